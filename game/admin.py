@@ -1,6 +1,24 @@
-from django.contrib import admin
+import json
 
-from game.models import Task, CompletedTask, UserTask
+from django.conf import settings
+from django.contrib import admin, messages
+from django.core.exceptions import PermissionDenied
+from django.db.models import OuterRef, Subquery
+from django.http import HttpResponseBadRequest, JsonResponse
+from django.template.response import TemplateResponse
+from django.urls import path, reverse
+from django.utils import timezone
+from django.utils.html import format_html
+from django.utils.http import urlencode
+from django.utils.translation import gettext_lazy as _
+from django.views.decorators.http import require_POST
+
+from game import catalogue, moderation, phash, photos
+from game.images import rendition_name
+from game.models import Task, CompletedTask, UserTask, Job
+from game.pagination import EstimatedCountPaginator
+
+REVIEW_BATCH_SIZE = 20
 
 
 @admin.register(Task)
@@ -8,19 +26,175 @@ class TaskAdmin(admin.ModelAdmin):
     list_display = ("id", "description", "description_pl", "description_en")
     list_editable = ("description_pl", "description_en")
 
+class NearDuplicateFilter(admin.SimpleListFilter):
+    title = _("near duplicates")
+    parameter_name = "near_duplicates_of"
+
+    def lookups(self, request, model_admin):
+        # Only shown once a photo is picked from the "near duplicates" column.
+        value = self.value()
+        return [(value, f"#{value}")] if value else []
+
+    def queryset(self, request, queryset):
+        value = self.value()
+        if not value:
+            return queryset
+        if not value.isdigit():
+            return queryset.none()
+        photo_hash = CompletedTask.objects.filter(pk=value).values_list("photo_hash", flat=True).first()
+        if photo_hash is None:
+            return queryset.filter(pk=value)
+        matches = phash.index().near(photo_hash, settings.PHOTO_DUPLICATE_DISTANCE)
+        return queryset.filter(pk__in=[pk for _, pk in matches])
+
+
 @admin.register(CompletedTask)
 class CompletedTaskAdmin(admin.ModelAdmin):
-    list_display = ("id", "user_task__user__username", "user_task__task__description", "task_verified", "photo_tag")
+    list_display = ("id", "user_task__user__username", "task_description", "task_verified", "is_public", "photo_tag", "duplicate_of", "near_duplicates")
     list_editable = ("task_verified",)
-    list_filter = ("user_task__user", "task_verified")
+    list_filter = ("task_verified", "is_public", "processing_failed", NearDuplicateFilter)
+    # A filter listing every player doesn't scale; search by username instead.
+    search_fields = ("^user_task__user__username",)
+    search_help_text = _("Username starts with")
+    actions = ("verify_selected", "reject_selected", "hide_selected", "retry_processing_selected")
+    show_full_result_count = False
+    paginator = EstimatedCountPaginator
 
     def get_queryset(self, request):
-        return super().get_queryset(request).select_related("user_task", "user_task__user", "user_task__task")
+        # The first earlier completion with the same content-addressed photo.
+        first_upload = CompletedTask.objects.filter(photo=OuterRef("photo"), id__lt=OuterRef("id")).order_by("id").values("id")[:1]
+        return super().get_queryset(request).select_related("user_task", "user_task__user").annotate(duplicate_of_id=Subquery(first_upload))
+
+    @admin.display(description=_("Task description"))
+    def task_description(self, obj):
+        return catalogue.description(obj.user_task.task_id)
+
+    @admin.display(description=_("duplicate of"), ordering="duplicate_of_id")
+    def duplicate_of(self, obj):
+        if obj.duplicate_of_id is None:
+            return None
+        url = reverse("admin:game_completedtask_change", args=[obj.duplicate_of_id])
+        return format_html('<a href="{}">#{}</a>', url, obj.duplicate_of_id)
+
+    @admin.display(description=_("near duplicates"))
+    def near_duplicates(self, obj):
+        if obj.photo_hash is None:
+            return None
+        matches = phash.index().near(obj.photo_hash, settings.PHOTO_DUPLICATE_DISTANCE, exclude=obj.pk)
+        if not matches:
+            return None
+        shown = ", ".join(f"#{pk}" for _, pk in matches[:3])
+        if len(matches) > 3:
+            shown += f" +{len(matches) - 3}"
+        url = reverse("admin:game_completedtask_changelist") + "?" + urlencode({"near_duplicates_of": obj.pk})
+        return format_html('<a href="{}">{}</a>', url, shown)
+
+    def save_model(self, request, obj, form, change):
+        if "task_verified" in form.changed_data:
+            obj.reviewed_at = timezone.now()
+        super().save_model(request, obj, form, change)
+
+    @admin.action(description=_("Verify selected photos"), permissions=["change"])
+    def verify_selected(self, request, queryset):
+        updated = moderation.set_verified(queryset, True)
+        self.message_user(request, _("Verified %(count)d photos.") % {"count": updated}, messages.SUCCESS)
+
+    @admin.action(description=_("Reject selected photos"), permissions=["change"])
+    def reject_selected(self, request, queryset):
+        updated = moderation.set_verified(queryset, False)
+        self.message_user(request, _("Rejected %(count)d photos.") % {"count": updated}, messages.SUCCESS)
+
+    @admin.action(description=_("Hide selected photos from the gallery"), permissions=["change"])
+    def hide_selected(self, request, queryset):
+        updated = moderation.hide(queryset)
+        self.message_user(request, _("Hid %(count)d photos.") % {"count": updated}, messages.SUCCESS)
+
+    @admin.action(description=_("Retry processing selected photos"), permissions=["change"])
+    def retry_processing_selected(self, request, queryset):
+        queued = photos.retry_processing(queryset)
+        self.message_user(request, _("Queued %(count)d photos for processing.") % {"count": queued}, messages.SUCCESS)
+
+    def get_urls(self):
+        review_urls = [
+            path("review/", self.admin_site.admin_view(self.review_view), name="game_completedtask_review"),
+            path("review/batch/", self.admin_site.admin_view(self.review_batch_view), name="game_completedtask_review_batch"),
+            path("review/decide/", self.admin_site.admin_view(require_POST(self.review_decide_view)), name="game_completedtask_review_decide"),
+        ]
+        return review_urls + super().get_urls()
+
+    def review_view(self, request):
+        if not self.has_change_permission(request):
+            raise PermissionDenied
+        context = {
+            **self.admin_site.each_context(request),
+            "opts": self.model._meta,
+            "title": _("Review queue"),
+            "batch_size": REVIEW_BATCH_SIZE,
+        }
+        return TemplateResponse(request, "admin/game/completedtask/review.html", context)
+
+    def review_batch_view(self, request):
+        if not self.has_change_permission(request):
+            raise PermissionDenied
+        try:
+            after = int(request.GET.get("after", 0))
+        except ValueError:
+            return HttpResponseBadRequest()
+        items = []
+        for completed_task in moderation.review_queue(after, REVIEW_BATCH_SIZE):
+            if completed_task.renditions:
+                preview = rendition_name(completed_task.photo.name, completed_task.renditions[-1], "jpg")
+                preview_url = completed_task.photo.storage.url(preview)
+            else:
+                preview_url = completed_task.photo.url
+            near = []
+            if completed_task.photo_hash is not None:
+                near = phash.index().near(completed_task.photo_hash, settings.PHOTO_DUPLICATE_DISTANCE, exclude=completed_task.pk)
+            items.append({
+                "id": completed_task.pk,
+                "photo": preview_url,
+                "user": completed_task.user_task.user.username,
+                "task": catalogue.description(completed_task.user_task.task_id),
+                "verified": completed_task.task_verified,
+                "public": completed_task.is_public,
+                "near_duplicates": [pk for _, pk in near[:5]],
+                "url": reverse("admin:game_completedtask_change", args=[completed_task.pk]),
+            })
+        return JsonResponse({"items": items})
+
+    def review_decide_view(self, request):
+        if not self.has_change_permission(request):
+            raise PermissionDenied
+        try:
+            decision = json.loads(request.body)
+            action, ids = decision["action"], [int(pk) for pk in decision["ids"]]
+        except (ValueError, TypeError, KeyError):
+            return HttpResponseBadRequest()
+        queryset = CompletedTask.objects.filter(pk__in=ids)
+        if action == "verify":
+            updated = moderation.set_verified(queryset, True)
+        elif action == "reject":
+            updated = moderation.set_verified(queryset, False)
+        elif action == "hide":
+            updated = moderation.hide(queryset)
+        else:
+            return HttpResponseBadRequest()
+        return JsonResponse({"updated": updated})
 
 @admin.register(UserTask)
 class UserTask(admin.ModelAdmin):
-    list_display = ("id", "user", "task__description")
+    list_display = ("id", "user", "task_description")
 
     def get_queryset(self, request):
-        return super().get_queryset(request).select_related("task")
+        return super().get_queryset(request).select_related("user")
+
+    @admin.display(description=_("Task description"))
+    def task_description(self, obj):
+        return catalogue.description(obj.task_id)
+
 
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ("id", "kind", "status", "attempts", "run_after", "locked_by")
+    list_filter = ("status", "kind")
+    readonly_fields = ("locked_by", "locked_until", "last_error", "created")
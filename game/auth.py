@@ -0,0 +1,36 @@
+from django.conf import settings
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import caches
+
+
+def _cache():
+    return caches[settings.USER_CACHE_ALIAS]
+
+
+def _key(user_id) -> str:
+    return f"game:user:{user_id}"
+
+
+def forget(user_id) -> None:
+    _cache().delete(_key(user_id))
+
+
+class CachedModelBackend(ModelBackend):
+    """ModelBackend that keeps logged-in users in the cache for
+    ``USER_CACHE_TIMEOUT`` seconds, so requests don't each load them.
+
+    Users are forgotten whenever they're saved or deleted (a new password,
+    deactivation in the admin, the last_login update of a new login) and on
+    logout; the session hash check still runs against the cached password.
+    """
+
+    def get_user(self, user_id):
+        cache = _cache()
+        key = _key(user_id)
+        user = cache.get(key)
+        if user is None:
+            # None for inactive users too, which are never cached.
+            user = super().get_user(user_id)
+            if user is not None:
+                cache.set(key, user, timeout=settings.USER_CACHE_TIMEOUT)
+        return user
@@ -0,0 +1,154 @@
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import CommandError
+from django.db import transaction
+from django.test import Client
+
+
+class _Rollback(Exception):
+    pass
+
+
+@contextmanager
+def rolled_back():
+    # Benchmarks seed their own data; throw it away once they're done.
+    try:
+        with transaction.atomic():
+            yield
+            raise _Rollback()
+    except _Rollback:
+        pass
+
+
+def percentile(samples: list[float], pct: float) -> float:
+    ordered = sorted(samples)
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def summarize(samples: list[float]) -> dict[str, float]:
+    return {
+        "n": len(samples),
+        "mean_ms": statistics.fmean(samples) * 1000 if samples else 0.0,
+        "p50_ms": percentile(samples, 50) * 1000,
+        "p95_ms": percentile(samples, 95) * 1000,
+        "p99_ms": percentile(samples, 99) * 1000,
+    }
+
+
+def timed(fn, repeat: int) -> list[float]:
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            cwd=settings.BASE_DIR,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def session_cookie(user: User) -> str:
+    # A real session row, so a separate server process accepts it.
+    client = Client()
+    client.force_login(user)
+    name = settings.SESSION_COOKIE_NAME
+    return f"{name}={client.cookies[name].value}"
+
+
+def children() -> dict[int, list[int]]:
+    """Child pids of every process, by parent pid (Linux only)."""
+    found = {}
+    for entry in os.listdir("/proc"):
+        if entry.isdigit():
+            try:
+                with open(f"/proc/{entry}/stat") as f:
+                    # The command name may contain spaces; fields resume after ")".
+                    ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+            except (OSError, IndexError, ValueError):
+                continue
+            found.setdefault(ppid, []).append(int(entry))
+    return found
+
+
+def rss(pid: int) -> int:
+    """Resident memory of ``pid`` in bytes, 0 once it has exited."""
+    try:
+        with open(f"/proc/{pid}/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        return 0
+
+
+def pss(pid: int) -> int:
+    """Proportional set size of ``pid`` in bytes: pages shared with other
+    processes count for their share only, so forked workers that share the
+    master's memory add up correctly."""
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            for line in f:
+                if line.startswith("Pss:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return 0
+
+
+def tree_rss(pid: int) -> int:
+    """Resident memory of ``pid`` and its children in bytes (Linux only)."""
+    tree = children()
+    total, pending = 0, [pid]
+    while pending:
+        current = pending.pop()
+        pending += tree.get(current, [])
+        total += rss(current)
+    return total
+
+
+@contextmanager
+def gunicorn(app: str, port: int, workers: int, *args: str, env=None, timeout=30):
+    """Run a local gunicorn for ``app`` until the block exits; yields the process."""
+    server = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", app, "-w", str(workers)]
+        + ["-b", f"127.0.0.1:{port}", *args],
+        cwd=settings.BASE_DIR,
+        env={**os.environ, **(env or {})},
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        deadline = time.monotonic() + timeout
+        while True:
+            if server.poll() is not None:
+                raise CommandError(f"gunicorn {app} exited during startup.")
+            try:
+                socket.create_connection(("127.0.0.1", port), timeout=1).close()
+                break
+            except OSError:
+                if time.monotonic() > deadline:
+                    raise CommandError(f"gunicorn {app} did not start in {timeout} s.")
+                time.sleep(0.1)
+        yield server
+    finally:
+        server.terminate()
+        server.wait()
@@ -0,0 +1,118 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils import translation
+
+HITS_KEY = "game:fragments:hits"
+MISSES_KEY = "game:fragments:misses"
+
+
+def _cache():
+    return caches[settings.FRAGMENT_CACHE_ALIAS]
+
+
+def _version_key(scope: str) -> str:
+    return f"game:version:{scope}"
+
+
+def _bumped_key(scope: str) -> str:
+    return f"game:bumped:{scope}"
+
+
+def _initial_version() -> int:
+    # Start from the clock rather than 0, so a version key that got evicted
+    # can't come back with a value an old fragment was cached under.
+    return time.time_ns() // 1000
+
+
+def bump(*scopes: str) -> None:
+    cache = _cache()
+    for scope in scopes:
+        key = _version_key(scope)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, _initial_version(), timeout=None)
+    if settings.REPLICA_DATABASES:
+        # Replicas may lack the rows behind a bump for up to
+        # REPLICA_PIN_SECONDS; see recently_bumped().
+        cache.set_many(
+            {_bumped_key(scope): True for scope in scopes},
+            timeout=settings.REPLICA_PIN_SECONDS,
+        )
+
+
+def recently_bumped(scopes: list[str]) -> bool:
+    """Whether any of ``scopes`` changed too recently for every replica to
+    have caught up."""
+    return bool(_cache().get_many([_bumped_key(scope) for scope in scopes]))
+
+
+def versions(scopes: list[str]) -> str:
+    cache = _cache()
+    keys = [_version_key(scope) for scope in scopes]
+    found = cache.get_many(keys)
+    missing = {key: _initial_version() for key in keys if key not in found}
+    if missing:
+        cache.set_many(missing, timeout=None)
+        found.update(missing)
+    return ".".join(str(found[key]) for key in keys)
+
+
+def fragment_key(
+    name: str, user_id, language: str, scopes: list[str], query: str
+) -> str:
+    query_hash = hashlib.md5(query.encode(), usedforsecurity=False).hexdigest()
+    return f"game:fragment:{name}:{user_id}:{language}:{versions(scopes)}:{query_hash}"
+
+
+def request_scopes(scopes, request) -> list[str]:
+    # The "user" scope stands for the requesting user's own version.
+    user_id = request.user.pk
+    return [f"user:{user_id}" if scope == "user" else scope for scope in scopes]
+
+
+def request_fragment_key(name: str, scopes, request) -> str:
+    return fragment_key(
+        name,
+        request.user.pk,
+        translation.get_language(),
+        request_scopes(scopes, request),
+        request.GET.urlencode(),
+    )
+
+
+def get_fragment(key: str) -> str | None:
+    cache = _cache()
+    content = cache.get(key)
+    count(HITS_KEY if content is not None else MISSES_KEY)
+    return content
+
+
+def set_fragment(key: str, content: str) -> None:
+    _cache().set(key, content, timeout=settings.FRAGMENT_CACHE_TIMEOUT)
+
+
+def count(key: str, delta: int = 1) -> None:
+    """Add ``delta`` to a counter every process sharing the cache sees."""
+    cache = _cache()
+    try:
+        cache.incr(key, delta)
+    except ValueError:
+        cache.add(key, delta, timeout=None)
+
+
+def counters(keys: list[str]) -> dict[str, int]:
+    found = _cache().get_many(keys)
+    return {key: found.get(key, 0) for key in keys}
+
+
+def stats() -> dict[str, int]:
+    found = counters([HITS_KEY, MISSES_KEY])
+    return {"hits": found[HITS_KEY], "misses": found[MISSES_KEY]}
+
+
+def reset_stats() -> None:
+    _cache().delete_many([HITS_KEY, MISSES_KEY])
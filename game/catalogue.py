@@ -0,0 +1,131 @@
+import logging
+import sys
+import time
+
+from django.conf import settings
+from django.db import DatabaseError
+from modeltranslation.utils import get_language, resolution_order
+
+from game import cache
+from game.models import Task
+
+logger = logging.getLogger(__name__)
+
+# Shares the fragment cache's version, which game.signals bumps on Task changes.
+SCOPE = "tasks"
+# How long a process trusts its copy before checking the shared version again.
+CHECK_SECONDS = 1.0
+
+
+def resolve(by_language: dict, language: str) -> str:
+    # modeltranslation's fallback: the first non-empty value in its order.
+    for code in resolution_order(language):
+        if by_language.get(code):
+            return by_language[code]
+    return ""
+
+
+class Catalogue:
+    """Every task's description in each language, with modeltranslation's
+    fallbacks already resolved, so listing pages only need task ids.
+
+    Held as ``{id: (description per language)}``; a language that falls back
+    to another shares its string instead of copying it.
+    """
+
+    def __init__(self):
+        self.languages = tuple(code for code, _ in settings.LANGUAGES)
+        self.descriptions: dict[int, tuple[str, ...]] = {}
+        self.version = None
+        self.checked = 0.0
+        self.hits = self.misses = self.loads = 0
+
+    def load(self) -> None:
+        fields = [f"description_{language}" for language in self.languages]
+        rows = Task.objects.order_by().values_list("pk", *fields)
+        descriptions = {}
+        for pk, *values in rows.iterator(chunk_size=5_000):
+            by_language = dict(zip(self.languages, values))
+            descriptions[pk] = tuple(
+                resolve(by_language, language) for language in self.languages
+            )
+        self.descriptions = descriptions
+        self.loads += 1
+
+    def refresh(self, now: bool = False) -> None:
+        if not now and time.monotonic() - self.checked < CHECK_SECONDS:
+            return
+        self.checked = time.monotonic()
+        version = cache.versions([SCOPE])
+        if version != self.version:
+            self.load()
+            self.version = version
+
+    def invalidate(self) -> None:
+        self.version = None
+        self.checked = 0.0
+
+    def description(self, task_id: int, language: str | None = None) -> str:
+        loads = self.loads
+        self.refresh()
+        entry = self.descriptions.get(task_id)
+        if entry is None:
+            # Possibly created by another process since the last check.
+            self.refresh(now=True)
+            entry = self.descriptions.get(task_id)
+        # A lookup that had to (re)load from the database counts as a miss.
+        if entry is None or self.loads != loads:
+            self.misses += 1
+        else:
+            self.hits += 1
+        if entry is None:
+            return ""
+        language = language or get_language()
+        if language not in self.languages:
+            language = settings.LANGUAGE_CODE
+        return entry[self.languages.index(language)]
+
+    def size(self) -> int:
+        strings = {
+            id(text): text for entry in self.descriptions.values() for text in entry
+        }
+        return (
+            sys.getsizeof(self.descriptions)
+            + sum(sys.getsizeof(entry) for entry in self.descriptions.values())
+            + sum(sys.getsizeof(pk) for pk in self.descriptions)
+            + sum(sys.getsizeof(text) for text in strings.values())
+        )
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "tasks": len(self.descriptions),
+            "bytes": self.size(),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else None,
+            "loads": self.loads,
+        }
+
+
+catalogue = Catalogue()
+
+
+def description(task_id: int, language: str | None = None) -> str:
+    return catalogue.description(task_id, language)
+
+
+def invalidate() -> None:
+    catalogue.invalidate()
+
+
+def stats() -> dict:
+    return catalogue.stats()
+
+
+def warm() -> None:
+    """Load the catalogue before the first request needs it."""
+    try:
+        catalogue.refresh(now=True)
+    except DatabaseError:
+        logger.warning("Task catalogue not warmed; it loads on first use.")
@@ -0,0 +1,27 @@
+import os
+from collections import Counter
+
+from django.db import connections
+
+# Database connections opened by this process, per alias. A count that keeps
+# growing with the request count means connections aren't being reused.
+opened = Counter()
+
+
+def count_opened(alias: str) -> None:
+    opened[alias] += 1
+
+
+def stats() -> dict:
+    databases = {}
+    for connection in connections.all():
+        pool = getattr(connection, "pool", None)
+        databases[connection.alias] = {
+            "vendor": connection.vendor,
+            "conn_max_age": connection.settings_dict["CONN_MAX_AGE"],
+            "health_checks": connection.settings_dict["CONN_HEALTH_CHECKS"],
+            "connected": connection.connection is not None,
+            "opened": opened[connection.alias],
+            "pool": pool.get_stats() if pool is not None else None,
+        }
+    return {"pid": os.getpid(), "databases": databases}
@@ -0,0 +1,56 @@
+import random
+
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+
+from game.models import Task, UserTask
+from game.retry import retry_on_lock
+
+MAX_INCOMPLETE_TASKS = 5
+
+
+class DrawError(Exception):
+    pass
+
+
+class TooManyIncompleteTasks(DrawError):
+    pass
+
+
+class NoTasksAvailable(DrawError):
+    pass
+
+
+def undrawn_tasks(user: User):
+    return Task.objects.filter(
+        ~Exists(UserTask.objects.filter(user=user, task=OuterRef("pk")))
+    )
+
+
+def pick_task_id(user: User, key: float | None = None) -> int | None:
+    # Every task carries an indexed random ``draw_key``. Walking the index
+    # from a random point and taking the first undrawn task costs one index
+    # seek instead of loading every undrawn id into the worker.
+    if key is None:
+        key = random.random()
+    candidates = undrawn_tasks(user).order_by("draw_key").values_list("id", flat=True)
+    task_id = candidates.filter(draw_key__gte=key).first()
+    if task_id is None:
+        task_id = candidates.filter(draw_key__lt=key).first()
+    return task_id
+
+
+@retry_on_lock
+@transaction.atomic
+def draw_task(user: User) -> UserTask:
+    # Lock the player's row so two simultaneous draws by the same user can't
+    # both pass the incomplete-task limit or pick the same task.
+    User.objects.select_for_update().only("id").get(pk=user.pk)
+    incomplete = UserTask.objects.filter(user=user, completedtask=None).count()
+    if incomplete >= MAX_INCOMPLETE_TASKS:
+        raise TooManyIncompleteTasks()
+    task_id = pick_task_id(user)
+    if task_id is None:
+        raise NoTasksAvailable()
+    return UserTask.objects.create(user=user, task_id=task_id)
@@ -0,0 +1,186 @@
+"""Live updates for the gallery and the leaderboard.
+
+Signal handlers publish events into the ``game_event`` table once their
+transaction commits, and every open ``/events/`` stream polls it from its
+own cursor, so the publishing and the serving worker needn't be the same
+process. Streams are server-sent events whose ids are ``Event`` ids;
+browsers send the last one back as ``Last-Event-ID`` when they reconnect
+and get only what they missed.
+"""
+
+import asyncio
+import json
+import time
+from datetime import UTC, datetime, timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from game import catalogue
+from game.models import CompletedTask, Event
+
+PHOTO = "photo"
+HIDDEN = "hidden"
+LEADERBOARD = "leaderboard"
+
+# Events read per query; a stream that is further behind catches up a batch
+# at a time.
+BATCH_SIZE = 100
+# Old events are deleted when the id of a new one is a multiple of this.
+PRUNE_EVERY = 1000
+KEEPALIVE_SECONDS = 15
+
+
+def create(kind: str, data: dict) -> None:
+    event = Event.objects.create(kind=kind, data=data)
+    if event.pk % PRUNE_EVERY == 0:
+        prune()
+
+
+def publish(kind: str, data: dict) -> None:
+    """Write an event once the current transaction commits. A failure is
+    logged rather than failing the request that has already committed."""
+    transaction.on_commit(lambda: create(kind, data), robust=True)
+
+
+def photo_data(completed_task: CompletedTask) -> dict:
+    user_task = completed_task.user_task
+    return {
+        "id": completed_task.pk,
+        "author": user_task.user.username,
+        "task": {
+            code: catalogue.description(user_task.task_id, code)
+            for code, _ in settings.LANGUAGES
+        },
+        "date": completed_task.date_completed.isoformat(),
+        "verified": completed_task.task_verified,
+        "photo": completed_task.photo.url,
+        "thumbnail": completed_task.thumbnail_url,
+    }
+
+
+def _publish_photo(completed_task_id: int) -> None:
+    completed_task = (
+        CompletedTask.objects.filter(pk=completed_task_id, is_public=True)
+        .select_related("user_task__user")
+        .first()
+    )
+    if completed_task is not None:
+        create(PHOTO, photo_data(completed_task))
+
+
+def photo_published(completed_task_id: int) -> None:
+    """Announce a photo that just appeared in the public gallery."""
+    # Read after commit, so a photo hidden in the same transaction isn't sent.
+    transaction.on_commit(lambda: _publish_photo(completed_task_id), robust=True)
+
+
+def photos_hidden(completed_task_ids: list[int]) -> None:
+    if completed_task_ids:
+        publish(HIDDEN, {"ids": completed_task_ids})
+
+
+def latest(kind: str) -> dict | None:
+    return (
+        Event.objects.filter(kind=kind)
+        .order_by("-id")
+        .values_list("data", flat=True)
+        .first()
+    )
+
+
+def prune() -> int:
+    cutoff = timezone.now() - timedelta(seconds=settings.EVENTS_RETENTION_SECONDS)
+    return Event.objects.filter(created__lt=cutoff).delete()[0]
+
+
+def _since(timestamp: float | None) -> datetime:
+    if timestamp is not None:
+        try:
+            return datetime.fromtimestamp(timestamp, UTC)
+        except (OverflowError, OSError, ValueError):
+            pass
+    return timezone.now()
+
+
+def _seen(timestamp: float | None):
+    return Event.objects.filter(created__lte=_since(timestamp))
+
+
+def start(timestamp: float | None = None) -> int:
+    """Id of the newest event published by ``timestamp`` (default now), for a
+    client without a cursor: its page already shows everything before that."""
+    return _seen(timestamp).aggregate(last=Max("id"))["last"] or 0
+
+
+async def astart(timestamp: float | None = None) -> int:
+    return (await _seen(timestamp).aaggregate(last=Max("id")))["last"] or 0
+
+
+def pending(after: int):
+    """Events after id ``after`` in id order, leaving out the newest
+    ``EVENTS_SETTLE_SECONDS``: an id is taken when a row is inserted, not
+    when it commits, so a lower id may still show up until then."""
+    settled = timezone.now() - timedelta(seconds=settings.EVENTS_SETTLE_SECONDS)
+    return (
+        Event.objects.filter(pk__gt=after, created__lte=settled)
+        .order_by("pk")
+        .values_list("pk", "kind", "data")[:BATCH_SIZE]
+    )
+
+
+def message(pk: int, kind: str, data: dict) -> str:
+    return f"id: {pk}\nevent: {kind}\ndata: {json.dumps(data)}\n\n"
+
+
+def retry_message() -> str:
+    # How long the browser waits before reconnecting once a stream ends.
+    return f"retry: {int(settings.EVENTS_POLL_SECONDS * 1000)}\n\n"
+
+
+def stream(after: int, seconds: float):
+    """Yield server-sent events after id ``after``, polling for new ones
+    for ``seconds``; with 0, just what's there now."""
+    yield retry_message()
+    deadline = time.monotonic() + seconds
+    sent = time.monotonic()
+    while True:
+        batch = list(pending(after))
+        for pk, kind, data in batch:
+            yield message(pk, kind, data)
+            after = pk
+        if batch:
+            sent = time.monotonic()
+        if len(batch) == BATCH_SIZE:
+            continue
+        if time.monotonic() >= deadline:
+            return
+        if time.monotonic() - sent >= KEEPALIVE_SECONDS:
+            # Keeps proxies from closing a quiet connection.
+            yield ": keepalive\n\n"
+            sent = time.monotonic()
+        time.sleep(settings.EVENTS_POLL_SECONDS)
+
+
+async def astream(after: int, seconds: float):
+    """``stream`` for async views; waiting doesn't tie up a thread."""
+    yield retry_message()
+    deadline = time.monotonic() + seconds
+    sent = time.monotonic()
+    while True:
+        batch = [row async for row in pending(after)]
+        for pk, kind, data in batch:
+            yield message(pk, kind, data)
+            after = pk
+        if batch:
+            sent = time.monotonic()
+        if len(batch) == BATCH_SIZE:
+            continue
+        if time.monotonic() >= deadline:
+            return
+        if time.monotonic() - sent >= KEEPALIVE_SECONDS:
+            yield ": keepalive\n\n"
+            sent = time.monotonic()
+        await asyncio.sleep(settings.EVENTS_POLL_SECONDS)
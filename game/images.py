@@ -0,0 +1,116 @@
+import logging
+import os
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps
+
+from game import cache
+
+logger = logging.getLogger(__name__)
+
+RENDITION_WIDTHS = (320, 640, 1280)
+RENDITION_FORMATS = {"webp": "WEBP", "jpg": "JPEG"}
+RENDITION_QUALITY = 80
+
+# Photos are normalized in run_jobs workers, so the totals are kept in the
+# cache where the web workers serving /stats/ can read them.
+UPLOAD_STATS_KEYS = {
+    field: f"game:uploads:{field}" for field in ("uploads", "bytes_in", "bytes_out")
+}
+
+
+def record_upload(bytes_in: int, bytes_out: int) -> None:
+    cache.count(UPLOAD_STATS_KEYS["uploads"])
+    cache.count(UPLOAD_STATS_KEYS["bytes_in"], bytes_in)
+    cache.count(UPLOAD_STATS_KEYS["bytes_out"], bytes_out)
+
+
+def upload_stats() -> dict[str, int]:
+    found = cache.counters(list(UPLOAD_STATS_KEYS.values()))
+    stats = {field: found[key] for field, key in UPLOAD_STATS_KEYS.items()}
+    stats["bytes_saved"] = stats["bytes_in"] - stats["bytes_out"]
+    return stats
+
+
+def rendition_name(name: str, width: int, ext: str) -> str:
+    stem, _ = os.path.splitext(name)
+    return f"{stem}_{width}w.{ext}"
+
+
+def rendition_srcset(name: str, widths: list[int], ext: str) -> str:
+    return ", ".join(
+        f"{default_storage.url(rendition_name(name, width, ext))} {width}w"
+        for width in widths
+    )
+
+
+def generate_renditions(name: str) -> list[int]:
+    with default_storage.open(name) as source, Image.open(source) as original:
+        image = ImageOps.exif_transpose(original).convert("RGB")
+    widths = [width for width in RENDITION_WIDTHS if width < image.width]
+    if not widths:
+        widths = [image.width]
+    produced = []
+    # Largest first, so every step downsamples the previous rendition rather
+    # than the full-size original.
+    for width in sorted(widths, reverse=True):
+        if width < image.width:
+            image = image.resize(
+                (width, max(1, round(image.height * width / image.width))),
+                Image.Resampling.LANCZOS,
+            )
+        for ext, pil_format in RENDITION_FORMATS.items():
+            buffer = BytesIO()
+            image.save(buffer, pil_format, quality=RENDITION_QUALITY, optimize=True)
+            target = rendition_name(name, image.width, ext)
+            if default_storage.exists(target):
+                default_storage.delete(target)
+            default_storage.save(target, ContentFile(buffer.getvalue()))
+        produced.append(image.width)
+    return sorted(produced)
+
+
+def render_photo(name: str) -> tuple[str, list[int]]:
+    try:
+        return name, generate_renditions(name)
+    except (OSError, ValueError):
+        logger.exception("Could not generate renditions for %s", name)
+        return name, []
+
+
+def normalize_photo(upload, max_edge: int, quality: int) -> ContentFile:
+    upload.seek(0)
+    with Image.open(upload) as original:
+        # JPEG can decode straight at 1/2, 1/4 or 1/8 scale, so a 12 MP photo
+        # never gets fully decoded when we only keep max_edge pixels of it.
+        original.draft("RGB", (max_edge, max_edge))
+        icc_profile = original.info.get("icc_profile")
+        image = ImageOps.exif_transpose(original)
+        image.thumbnail((max_edge, max_edge), Image.Resampling.LANCZOS)
+        if image.mode != "RGB":
+            image = image.convert("RGB")
+    buffer = BytesIO()
+    # EXIF (including GPS position) is dropped because it's never passed to save().
+    image.save(
+        buffer,
+        "JPEG",
+        quality=quality,
+        optimize=True,
+        progressive=True,
+        icc_profile=icc_profile,
+    )
+    stem, _ = os.path.splitext(os.path.basename(upload.name))
+    normalized = ContentFile(buffer.getvalue(), name=f"{stem}.jpg")
+    record_upload(upload.size, normalized.size)
+    logger.info(
+        "Normalized %s: %d -> %d bytes (%d saved), %dx%d",
+        upload.name,
+        upload.size,
+        normalized.size,
+        upload.size - normalized.size,
+        image.width,
+        image.height,
+    )
+    return normalized
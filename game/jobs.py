@@ -0,0 +1,125 @@
+import logging
+import traceback
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from game.models import Job
+
+logger = logging.getLogger(__name__)
+
+handlers = {}
+failure_handlers = {}
+
+
+def handler(kind: str, on_failure=None):
+    """Register ``fn`` to run jobs of ``kind``. ``on_failure`` is called with
+    the same payload once a job has used up its attempts."""
+
+    def register(fn):
+        handlers[kind] = fn
+        if on_failure is not None:
+            failure_handlers[kind] = on_failure
+        return fn
+
+    return register
+
+
+def enqueue(kind: str, **payload) -> Job:
+    if kind not in handlers:
+        raise ValueError(f"No job handler registered for {kind!r}")
+    job = Job.objects.create(kind=kind, payload=payload)
+    if settings.JOBS_EAGER:
+        transaction.on_commit(lambda: run_now(job.pk))
+    return job
+
+
+def _claimable(now):
+    return Q(status=Job.Status.QUEUED, run_after__lte=now) | Q(
+        status=Job.Status.RUNNING, locked_until__lt=now
+    )
+
+
+def claim(worker: str, limit: int, visibility: timedelta) -> list[Job]:
+    now = timezone.now()
+    # A job whose worker died mid-run becomes visible again once its lock
+    # expires, unless it has already used up its attempts.
+    expired = Job.objects.filter(
+        status=Job.Status.RUNNING, locked_until__lt=now, attempts__gte=F("max_attempts")
+    )
+    for job in expired:
+        # Another worker may be failing the same job; only one gets the update.
+        if Job.objects.filter(
+            pk=job.pk, status=Job.Status.RUNNING, locked_by=job.locked_by
+        ).update(
+            status=Job.Status.FAILED,
+            locked_until=None,
+            last_error="Visibility timeout expired.",
+        ):
+            call_failure_handler(job)
+    token = f"{worker}:{uuid.uuid4().hex[:8]}"
+    with transaction.atomic():
+        ids = list(
+            Job.objects.select_for_update(skip_locked=True)
+            .filter(_claimable(now))
+            .order_by("run_after")
+            .values_list("id", flat=True)[:limit]
+        )
+        # Re-checking the claimable condition keeps the claim safe on
+        # databases without SELECT ... FOR UPDATE SKIP LOCKED.
+        Job.objects.filter(_claimable(now), id__in=ids).update(
+            status=Job.Status.RUNNING,
+            locked_by=token,
+            locked_until=now + visibility,
+            attempts=F("attempts") + 1,
+        )
+    return list(Job.objects.filter(locked_by=token, status=Job.Status.RUNNING))
+
+
+def call_failure_handler(job: Job) -> None:
+    """Call the failure handler of a job that used up its attempts."""
+    if job.kind in failure_handlers:
+        try:
+            failure_handlers[job.kind](**job.payload)
+        except Exception:
+            logger.exception("Failure handler for %s failed", job)
+
+
+def retry_delay(attempts: int) -> timedelta:
+    return timedelta(seconds=min(2**attempts, 600))
+
+
+def run(job: Job) -> bool:
+    mine = Job.objects.filter(pk=job.pk, locked_by=job.locked_by)
+    try:
+        handlers[job.kind](**job.payload)
+    except Exception:
+        logger.exception("Job %s failed", job)
+        failed = job.attempts >= job.max_attempts
+        updated = mine.update(
+            status=Job.Status.FAILED if failed else Job.Status.QUEUED,
+            run_after=timezone.now() + retry_delay(job.attempts),
+            locked_until=None,
+            last_error=traceback.format_exc(),
+        )
+        if failed and updated:
+            call_failure_handler(job)
+        return False
+    mine.delete()
+    return True
+
+
+def run_now(job_id: int) -> None:
+    jobs = Job.objects.filter(pk=job_id, status=Job.Status.QUEUED)
+    token = f"eager:{uuid.uuid4().hex[:8]}"
+    if jobs.update(
+        status=Job.Status.RUNNING,
+        locked_by=token,
+        locked_until=timezone.now() + timedelta(minutes=5),
+        attempts=F("attempts") + 1,
+    ):
+        run(Job.objects.get(pk=job_id))
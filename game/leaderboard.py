@@ -0,0 +1,111 @@
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import Count, F
+
+from game import cache, events
+from game.models import CompletedTask, LeaderboardEntry
+
+
+def top(limit: int):
+    return (
+        LeaderboardEntry.objects.filter(verified_count__gt=0)
+        .order_by("-verified_count", "user_id")
+        .annotate(username=F("user__username"), count=F("verified_count"))
+        .values("username", "count")[:limit]
+    )
+
+
+def _own_count(user: User):
+    return LeaderboardEntry.objects.filter(
+        user_id=user.pk, verified_count__gt=0
+    ).values_list("verified_count", flat=True)
+
+
+def rank_for(user: User) -> dict | None:
+    count = _own_count(user).first()
+    if count is None:
+        return None
+    ahead = LeaderboardEntry.objects.filter(verified_count__gt=count).count()
+    return {"rank": ahead + 1, "count": count}
+
+
+async def arank_for(user: User) -> dict | None:
+    count = await _own_count(user).afirst()
+    if count is None:
+        return None
+    ahead = await LeaderboardEntry.objects.filter(verified_count__gt=count).acount()
+    return {"rank": ahead + 1, "count": count}
+
+
+def _announce() -> None:
+    leaders = list(top(settings.LEADERBOARD_SIZE))
+    # Most verifications don't move the top of the board.
+    if events.latest(events.LEADERBOARD) != {"leaders": leaders}:
+        events.create(events.LEADERBOARD, {"leaders": leaders})
+
+
+def changed() -> None:
+    transaction.on_commit(lambda: cache.bump("leaderboard"))
+    transaction.on_commit(_announce, robust=True)
+
+
+def adjust(user_id: int, delta: int) -> None:
+    changed()
+    if delta < 0:
+        LeaderboardEntry.objects.filter(
+            user_id=user_id, verified_count__gte=-delta
+        ).update(verified_count=F("verified_count") + delta)
+        return
+    updated = LeaderboardEntry.objects.filter(user_id=user_id).update(
+        verified_count=F("verified_count") + delta
+    )
+    if not updated:
+        _, created = LeaderboardEntry.objects.get_or_create(
+            user_id=user_id, defaults={"verified_count": delta}
+        )
+        if not created:
+            LeaderboardEntry.objects.filter(user_id=user_id).update(
+                verified_count=F("verified_count") + delta
+            )
+
+
+def live_counts() -> dict[int, int]:
+    rows = (
+        CompletedTask.objects.filter(task_verified=True)
+        .values_list("user_task__user")
+        .annotate(count=Count("id"))
+    )
+    return dict(rows)
+
+
+def stored_counts() -> dict[int, int]:
+    return dict(
+        LeaderboardEntry.objects.filter(verified_count__gt=0).values_list(
+            "user_id", "verified_count"
+        )
+    )
+
+
+@transaction.atomic
+def rebuild() -> int:
+    counts = live_counts()
+    LeaderboardEntry.objects.all().delete()
+    LeaderboardEntry.objects.bulk_create(
+        (
+            LeaderboardEntry(user_id=user_id, verified_count=count)
+            for user_id, count in counts.items()
+        ),
+        batch_size=1000,
+    )
+    changed()
+    return len(counts)
+
+
+def differences() -> dict[int, tuple[int, int]]:
+    stored, live = stored_counts(), live_counts()
+    return {
+        user_id: (stored.get(user_id, 0), live.get(user_id, 0))
+        for user_id in stored.keys() | live.keys()
+        if stored.get(user_id, 0) != live.get(user_id, 0)
+    }
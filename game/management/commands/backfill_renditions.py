@@ -0,0 +1,35 @@
+import os
+
+from django.core.management.base import BaseCommand
+
+from game import photos
+from game.images import render_photo
+from game.models import CompletedTask
+
+
+class Command(BaseCommand):
+    help = "Generate thumbnail renditions for photos that don't have them yet."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--processes", type=int, default=os.cpu_count())
+        parser.add_argument(
+            "--all",
+            action="store_true",
+            dest="regenerate",
+            help="Regenerate renditions for every photo.",
+        )
+
+    def handle(self, *args, processes, regenerate, **options):
+        queryset = CompletedTask.objects.exclude(photo="")
+        if not regenerate:
+            queryset = queryset.filter(renditions=[])
+        names = list(queryset.values_list("photo", flat=True).distinct())
+        done = failed = 0
+        with photos.file_workers(processes) as pool:
+            for name, widths in pool.map(render_photo, names, chunksize=8):
+                if widths:
+                    CompletedTask.objects.filter(photo=name).update(renditions=widths)
+                    done += 1
+                else:
+                    failed += 1
+        self.stdout.write(f"Rendered {done} photos, {failed} failed.")
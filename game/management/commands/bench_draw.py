@@ -0,0 +1,50 @@
+import random
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+
+from game.benchmarks import rolled_back, summarize, timed
+from game.draw import draw_task
+from game.models import Task, UserTask
+
+
+def legacy_draw(user: User) -> UserTask:
+    task_ids = Task.objects.exclude(usertask__user=user).values_list("id", flat=True)
+    task = Task.objects.get(id=random.choice(task_ids))
+    user_task = UserTask(user=user, task=task)
+    user_task.save()
+    return user_task
+
+
+class Command(BaseCommand):
+    help = "Compare the indexed task draw with the old materialize-all-ids draw."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 100_000])
+        parser.add_argument("--draws", type=int, default=200)
+        parser.add_argument("--batch-size", type=int, default=5_000)
+
+    def handle(self, *args, sizes, draws, batch_size, **options):
+        for size in sizes:
+            with rolled_back():
+                Task.objects.bulk_create(
+                    (Task(description=f"bench task {i}") for i in range(size)),
+                    batch_size=batch_size,
+                )
+                legacy_user = User.objects.create(username="bench-draw-legacy")
+                engine_user = User.objects.create(username="bench-draw-engine")
+
+                # Drawn tasks are deleted again so the user stays below the
+                # incomplete-task limit; both paths pay for that delete.
+                legacy = summarize(
+                    timed(lambda user=legacy_user: legacy_draw(user).delete(), draws)
+                )
+                indexed = summarize(
+                    timed(lambda user=engine_user: draw_task(user).delete(), draws)
+                )
+            for name, result in (("legacy", legacy), ("indexed", indexed)):
+                self.stdout.write(
+                    f"{size:>8} tasks  {name:<8} "
+                    f"mean {result['mean_ms']:8.2f} ms  "
+                    f"p50 {result['p50_ms']:8.2f} ms  p95 {result['p95_ms']:8.2f} ms"
+                )
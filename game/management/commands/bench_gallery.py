@@ -0,0 +1,87 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.core.paginator import Paginator
+from django.test import RequestFactory
+
+from game.benchmarks import rolled_back, summarize, timed
+from game.models import CompletedTask, Task, UserTask
+from game.pagination import KeysetPage, encode_cursor
+from game.views import AllPhotosView
+
+PER_PAGE = 20
+
+
+class Command(BaseCommand):
+    help = "Compare OFFSET/COUNT and keyset pagination of the public gallery."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--pages", type=int, nargs="+", default=[1, 10, 100, 1_000, 5_000]
+        )
+        parser.add_argument("--repeat", type=int, default=5)
+        parser.add_argument("--batch-size", type=int, default=5_000)
+
+    def seed(self, rows, batch_size):
+        user = User.objects.create(username="bench-gallery")
+        tasks = Task.objects.bulk_create(
+            (Task(description=f"bench task {i}") for i in range(rows)),
+            batch_size=batch_size,
+        )
+        user_tasks = UserTask.objects.bulk_create(
+            (UserTask(user=user, task=task) for task in tasks), batch_size=batch_size
+        )
+        CompletedTask.objects.bulk_create(
+            (
+                CompletedTask(
+                    user_task=user_task, photo=f"tasks_photos/bench-{user_task.pk}.jpg"
+                )
+                for user_task in user_tasks
+            ),
+            batch_size=batch_size,
+        )
+        return user
+
+    def handle(self, *args, pages, repeat, batch_size, **options):
+        with rolled_back():
+            user = self.seed(max(pages) * PER_PAGE + PER_PAGE, batch_size)
+            request = RequestFactory().get("/all-photos/")
+            request.user = user
+            view = AllPhotosView(request=request)
+            queryset = view.get_queryset()
+            ordered = queryset.order_by(
+                "-completedtask__date_completed", "-completedtask__id"
+            )
+            for number in pages:
+
+                def offset_page(number=number):
+                    page = Paginator(ordered, PER_PAGE).page(number)
+                    list(page.object_list)
+                    page.has_next()
+
+                params = {}
+                if number > 1:
+                    keys = ordered.values_list(
+                        "completedtask__date_completed", "completedtask__id"
+                    )
+                    params["after"] = encode_cursor(
+                        keys[(number - 1) * PER_PAGE - 1], number
+                    )
+
+                def keyset_page(params=params):
+                    page = KeysetPage(
+                        queryset,
+                        "completedtask__date_completed",
+                        "completedtask__id",
+                        PER_PAGE,
+                        params,
+                    )
+                    list(page.object_list)
+                    # Runs the neighbouring-page queries, as the template does.
+                    _ = page.page_links
+
+                for name, fn in (("offset", offset_page), ("keyset", keyset_page)):
+                    result = summarize(timed(fn, repeat))
+                    self.stdout.write(
+                        f"page {number:>6}  {name:<7} "
+                        f"p50 {result['p50_ms']:8.2f} ms  p95 {result['p95_ms']:8.2f} ms"
+                    )
@@ -0,0 +1,186 @@
+import asyncio
+import json
+import threading
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.urls import reverse
+from django.utils import timezone
+
+from game.benchmarks import git_commit, gunicorn, session_cookie, summarize, tree_rss
+from game.models import UserTask
+
+SERVERS = {
+    "wsgi": ("kc_django.wsgi", [], {}),
+    "asgi": (
+        "kc_django.asgi",
+        ["-k", "uvicorn_worker.UvicornWorker"],
+        {"ASYNC_VIEWS": "1"},
+    ),
+}
+
+PAGES = ("dashboard", "tasks", "my-photos", "all-photos")
+
+
+class RssSampler(threading.Thread):
+    def __init__(self, pid: int, interval: float = 0.25):
+        super().__init__(daemon=True)
+        self.pid = pid
+        self.interval = interval
+        self.peak = 0
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.is_set():
+            self.peak = max(self.peak, tree_rss(self.pid))
+            self.stopped.wait(self.interval)
+
+
+class SlowClient:
+    """A client that trickles its request and reads the response at ``rate``."""
+
+    def __init__(self, port, host, cookie, send_seconds, rate):
+        self.port = port
+        self.host = host
+        self.cookie = cookie
+        self.send_seconds = send_seconds
+        self.rate = rate
+
+    async def fetch(self, path: str) -> tuple[int, int]:
+        reader, writer = await asyncio.open_connection("127.0.0.1", self.port)
+        try:
+            request = (
+                f"GET {path} HTTP/1.1\r\nHost: {self.host}\r\n"
+                f"Cookie: {self.cookie}\r\nConnection: close\r\n\r\n"
+            ).encode()
+            chunks = 8
+            step = -(-len(request) // chunks)
+            for start in range(0, len(request), step):
+                writer.write(request[start : start + step])
+                await writer.drain()
+                await asyncio.sleep(self.send_seconds / chunks)
+            status_line = await reader.readline()
+            size = len(status_line)
+            while chunk := await reader.read(4096):
+                size += len(chunk)
+                await asyncio.sleep(len(chunk) / self.rate)
+            return int(status_line.split()[1]), size
+        finally:
+            writer.close()
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare sync WSGI and async ASGI gunicorn workers under many slow "
+        "concurrent clients: throughput, latency and memory."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--user", help="Player username.")
+        parser.add_argument("--clients", type=int, default=500)
+        parser.add_argument("--duration", type=float, default=20)
+        parser.add_argument("--workers", type=int, default=4)
+        parser.add_argument(
+            "--send-seconds",
+            type=float,
+            default=1.0,
+            help="Time each client takes to send its request.",
+        )
+        parser.add_argument(
+            "--rate",
+            type=int,
+            default=16_384,
+            help="Bytes per second each client reads the response at.",
+        )
+        parser.add_argument("--port", type=int, default=8766)
+        parser.add_argument(
+            "--servers", nargs="+", choices=list(SERVERS), default=list(SERVERS)
+        )
+        parser.add_argument(
+            "--output", help="Write the JSON report here instead of stdout."
+        )
+
+    def handle(self, *args, **options):
+        if options["user"]:
+            user = User.objects.get(username=options["user"])
+        else:
+            pending = UserTask.objects.filter(completedtask=None).first()
+            if pending is None:
+                raise CommandError("No player to benchmark as; run seed_load first.")
+            user = pending.user
+        cookie = session_cookie(user)
+        paths = [reverse(name) for name in PAGES]
+
+        report = {
+            "commit": git_commit(),
+            "created": timezone.now().isoformat(),
+            "clients": options["clients"],
+            "duration": options["duration"],
+            "workers": options["workers"],
+            "servers": {},
+        }
+        for name in options["servers"]:
+            app, args, env = SERVERS[name]
+            with gunicorn(
+                app, options["port"], options["workers"], *args, env=env
+            ) as server:
+                idle_rss = tree_rss(server.pid)
+                sampler = RssSampler(server.pid)
+                sampler.start()
+                result = asyncio.run(self.load(cookie, paths, options))
+                sampler.stopped.set()
+                sampler.join()
+            result["idle_rss_mb"] = idle_rss / 2**20
+            result["peak_rss_mb"] = max(sampler.peak, idle_rss) / 2**20
+            result["rss_per_client_kb"] = (
+                max(sampler.peak - idle_rss, 0) / options["clients"] / 1024
+            )
+            report["servers"][name] = result
+            self.stderr.write(
+                f"{name}: {result['requests_per_second']:.1f} req/s, "
+                f"p50 {result['p50_ms']:.0f} ms, p99 {result['p99_ms']:.0f} ms, "
+                f"{result['errors']} errors, peak {result['peak_rss_mb']:.0f} MB "
+                f"({result['rss_per_client_kb']:.0f} kB per client)"
+            )
+
+        output = json.dumps(report, indent=2)
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                f.write(output + "\n")
+        else:
+            self.stdout.write(output)
+
+    async def load(self, cookie: str, paths: list[str], options) -> dict:
+        client = SlowClient(
+            options["port"],
+            "localhost",
+            cookie,
+            options["send_seconds"],
+            options["rate"],
+        )
+        deadline = time.monotonic() + options["duration"]
+        samples, errors = [], 0
+
+        async def run_client(index: int):
+            nonlocal errors
+            while time.monotonic() < deadline:
+                start = time.perf_counter()
+                try:
+                    status, _ = await client.fetch(paths[index % len(paths)])
+                except (OSError, IndexError, ValueError):
+                    status = None
+                if status == 200:
+                    samples.append(time.perf_counter() - start)
+                else:
+                    errors += 1
+                index += 1
+
+        started = time.monotonic()
+        await asyncio.gather(*(run_client(i) for i in range(options["clients"])))
+        elapsed = time.monotonic() - started
+        return {
+            **summarize(samples),
+            "errors": errors,
+            "requests_per_second": len(samples) / elapsed,
+        }
@@ -0,0 +1,109 @@
+import json
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+from django.urls import reverse
+from django.utils import timezone
+
+from game.benchmarks import children, git_commit, gunicorn, pss, rss, summarize
+
+# gunicorn.conf.py reads GUNICORN_PRELOAD.
+MODES = {
+    "fork": {"GUNICORN_PRELOAD": "0"},
+    "preload": {"GUNICORN_PRELOAD": "1"},
+}
+
+
+def fetch(url: str) -> float:
+    start = time.perf_counter()
+    with urllib.request.urlopen(url, timeout=30) as response:
+        response.read()
+    return time.perf_counter() - start
+
+
+class Command(BaseCommand):
+    help = (
+        "Start gunicorn with and without preload_app and report the time to "
+        "the first response, latency of the first burst of requests, and "
+        "memory per worker, as JSON."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=16)
+        parser.add_argument(
+            "--requests",
+            type=int,
+            default=10,
+            help="Requests per worker in the burst after the first response.",
+        )
+        parser.add_argument("--port", type=int, default=8767)
+        parser.add_argument(
+            "--modes", nargs="+", choices=list(MODES), default=list(MODES)
+        )
+        parser.add_argument(
+            "--output", help="Write the JSON report here instead of stdout."
+        )
+
+    def handle(self, *args, workers, requests, port, modes, output, **options):
+        url = f"http://127.0.0.1:{port}{reverse('login')}"
+        report = {
+            "commit": git_commit(),
+            "created": timezone.now().isoformat(),
+            "workers": workers,
+            "modes": {},
+        }
+        for mode in modes:
+            result = self.bench(mode, url, workers, requests, port)
+            report["modes"][mode] = result
+            self.stderr.write(
+                f"{mode}: first response after {result['first_response_s']:.2f} s, "
+                f"burst p50 {result['p50_ms']:.0f} ms p99 {result['p99_ms']:.0f} ms, "
+                f"{result['worker_rss_mb']:.0f} MB RSS / "
+                f"{result['worker_pss_mb']:.0f} MB PSS per worker, "
+                f"{result['total_pss_mb']:.0f} MB PSS in all"
+            )
+
+        text = json.dumps(report, indent=2)
+        if output:
+            with open(output, "w") as f:
+                f.write(text + "\n")
+        else:
+            self.stdout.write(text)
+
+    def bench(self, mode, url, workers, requests, port) -> dict:
+        started = time.perf_counter()
+        with gunicorn(
+            "kc_django.wsgi", port, workers, env=MODES[mode], timeout=120
+        ) as server:
+            while True:
+                try:
+                    fetch(url)
+                    break
+                except (urllib.error.URLError, ConnectionError):
+                    if time.perf_counter() - started > 120:
+                        raise CommandError(f"{mode}: no response in 120 s.")
+                    time.sleep(0.05)
+            first_response = time.perf_counter() - started
+            with ThreadPoolExecutor(workers) as pool:
+                samples = list(pool.map(fetch, [url] * (workers * requests)))
+            # gunicorn spaces out forking its workers a little.
+            while len(pids := children().get(server.pid, [])) < workers:
+                if time.perf_counter() - started > 120:
+                    raise CommandError(f"{mode}: {len(pids)} of {workers} workers up.")
+                time.sleep(0.05)
+            processes = [server.pid, *pids]
+            worker_rss = sum(map(rss, pids)) / len(pids)
+            worker_pss = sum(map(pss, pids)) / len(pids)
+            total_pss = sum(map(pss, processes))
+            master_rss = rss(server.pid)
+        return {
+            "first_response_s": first_response,
+            **summarize(samples),
+            "master_rss_mb": master_rss / 2**20,
+            "worker_rss_mb": worker_rss / 2**20,
+            "worker_pss_mb": worker_pss / 2**20,
+            "total_pss_mb": total_pss / 2**20,
+        }
@@ -0,0 +1,266 @@
+import json
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLPattern, URLResolver, reverse
+from django.utils import timezone
+
+from game.benchmarks import git_commit, gunicorn, session_cookie, summarize
+from game.models import UserTask
+from kc_django import urls
+
+# Routes in urls.py that are benchmarked through named routes inside them.
+INCLUDED_ROUTES = {
+    "admin/": [
+        "admin:index",
+        "admin:game_task_changelist",
+        "admin:game_completedtask_changelist",
+        "admin:game_completedtask_review",
+        "admin:game_completedtask_review_batch",
+        "admin:game_usertask_changelist",
+    ],
+    "accounts/": ["login"],
+}
+
+# Routes outside admin/ that need a staff user.
+STAFF_ROUTES = {"stats", "all-photos-download", "metrics"}
+
+
+def route_names() -> list[str]:
+    names = []
+    for pattern in urls.urlpatterns:
+        if isinstance(pattern, URLResolver):
+            route = str(pattern.pattern)
+            if route not in INCLUDED_ROUTES:
+                raise CommandError(f"No benchmark routes for {route}")
+            names += INCLUDED_ROUTES[route]
+        elif isinstance(pattern, URLPattern) and pattern.name:
+            names.append(pattern.name)
+    return names
+
+
+def request_host() -> str:
+    for host in settings.ALLOWED_HOSTS:
+        if host != "*" and not host.startswith("."):
+            return host
+    return "localhost"
+
+
+class NoRedirect(urllib.request.HTTPRedirectHandler):
+    # Measure the redirect itself, as the test client does.
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+opener = urllib.request.build_opener(NoRedirect)
+
+
+def mean(values: list) -> float:
+    return sum(values) / len(values) if values else 0.0
+
+
+class Command(BaseCommand):
+    help = (
+        "Request every route as a seeded player and report latency percentiles, "
+        "queries and bytes per response as JSON."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--user",
+            help="Player username. Defaults to the first player with a pending task.",
+        )
+        parser.add_argument(
+            "--admin",
+            help="Superuser for admin routes. Defaults to the first superuser.",
+        )
+        parser.add_argument("--repeat", type=int, default=50)
+        parser.add_argument("--warmup", type=int, default=3)
+        parser.add_argument(
+            "--routes", nargs="+", help="Only benchmark these route names."
+        )
+        parser.add_argument(
+            "--gunicorn",
+            action="store_true",
+            help="Also benchmark over HTTP against a local gunicorn.",
+        )
+        parser.add_argument("--workers", type=int, default=4)
+        parser.add_argument("--concurrency", type=int, default=8)
+        parser.add_argument("--port", type=int, default=8765)
+        parser.add_argument(
+            "--output", help="Write the JSON report here instead of stdout."
+        )
+        parser.add_argument(
+            "--compare", help="Earlier JSON report to print p50 changes against."
+        )
+
+    def handle(self, *args, **options):
+        player, admin = self.users(options["user"], options["admin"])
+        names = route_names()
+        if options["routes"]:
+            unknown = set(options["routes"]) - set(names)
+            if unknown:
+                raise CommandError(f"Unknown routes: {', '.join(sorted(unknown))}")
+            names = [name for name in names if name in options["routes"]]
+        targets = {
+            name: (
+                self.url_for(name, player),
+                admin if name.startswith("admin:") or name in STAFF_ROUTES else player,
+            )
+            for name in names
+        }
+
+        report = {
+            "commit": git_commit(),
+            "created": timezone.now().isoformat(),
+            "database": connection.vendor,
+            "repeat": options["repeat"],
+            "client": self.bench_client(targets, options["repeat"], options["warmup"]),
+        }
+        if options["gunicorn"]:
+            report["gunicorn"] = self.bench_gunicorn(targets, options)
+
+        output = json.dumps(report, indent=2)
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                f.write(output + "\n")
+            self.print_table(report)
+        else:
+            self.stdout.write(output)
+        if options["compare"]:
+            with open(options["compare"]) as f:
+                self.print_comparison(json.load(f), report)
+
+    def users(self, username, admin_username) -> tuple[User, User]:
+        if username:
+            player = User.objects.get(username=username)
+        else:
+            pending = (
+                UserTask.objects.filter(completedtask=None).order_by("user_id").first()
+            )
+            if pending is None:
+                raise CommandError(
+                    "No player with a pending task; run seed_load first."
+                )
+            player = pending.user
+        if admin_username:
+            admin = User.objects.get(username=admin_username)
+        else:
+            admin = User.objects.filter(is_superuser=True).order_by("pk").first()
+            if admin is None:
+                raise CommandError(
+                    "No superuser for admin routes; run seed_load first."
+                )
+        return player, admin
+
+    def url_for(self, name: str, user: User) -> str:
+        if name == "tasks_detail":
+            pending = user.usertask_set.filter(completedtask=None).first()
+            if pending is None:
+                raise CommandError(f"{user.username} has no pending task.")
+            return reverse(name, args=[pending.pk])
+        return reverse(name)
+
+    def bench_client(self, targets: dict, repeat: int, warmup: int) -> dict:
+        results = {}
+        for name, (url, user) in targets.items():
+            client = Client(HTTP_HOST=request_host())
+            client.force_login(user)
+            for _ in range(warmup):
+                client.get(url)
+            samples, queries, sizes = [], [], []
+            for _ in range(repeat):
+                with CaptureQueriesContext(connection) as captured:
+                    start = time.perf_counter()
+                    response = client.get(url)
+                    samples.append(time.perf_counter() - start)
+                if response.status_code >= 400:
+                    raise CommandError(f"{url} returned {response.status_code}")
+                queries.append(len(captured))
+                sizes.append(
+                    sum(map(len, response.streaming_content))
+                    if response.streaming
+                    else len(response.content)
+                )
+            results[name] = {
+                "url": url,
+                **summarize(samples),
+                "queries": mean(queries),
+                "bytes": mean(sizes),
+            }
+        return results
+
+    def bench_gunicorn(self, targets: dict, options) -> dict:
+        port, workers = options["port"], options["workers"]
+        with gunicorn("kc_django.wsgi", port, workers):
+            results = {}
+            for name, (url, user) in targets.items():
+                results[name] = self.bench_http(
+                    f"http://127.0.0.1:{port}{url}", session_cookie(user), options
+                )
+                results[name]["url"] = url
+        return {
+            "workers": workers,
+            "concurrency": options["concurrency"],
+            "routes": results,
+        }
+
+    def bench_http(self, url: str, cookie: str, options) -> dict:
+        headers = {"Host": request_host(), "Cookie": cookie}
+
+        def fetch(_):
+            request = urllib.request.Request(url, headers=headers)
+            start = time.perf_counter()
+            try:
+                with opener.open(request) as response:
+                    size = len(response.read())
+            except urllib.error.HTTPError as error:
+                if error.code >= 400:
+                    raise CommandError(f"{url} returned {error.code}")
+                size = len(error.read())
+            return time.perf_counter() - start, size
+
+        with ThreadPoolExecutor(options["concurrency"]) as pool:
+            list(pool.map(fetch, range(options["warmup"])))
+            start = time.perf_counter()
+            measured = list(pool.map(fetch, range(options["repeat"])))
+            elapsed = time.perf_counter() - start
+        return {
+            **summarize([sample for sample, _ in measured]),
+            "bytes": mean([size for _, size in measured]),
+            "requests_per_second": len(measured) / elapsed,
+        }
+
+    def print_table(self, report: dict):
+        runs = [("client", report["client"])]
+        if "gunicorn" in report:
+            runs.append(("gunicorn", report["gunicorn"]["routes"]))
+        for run, routes in runs:
+            self.stdout.write(f"{run}:")
+            for name, result in routes.items():
+                queries = result.get("queries")
+                self.stdout.write(
+                    f"  {name:<38} p50 {result['p50_ms']:7.2f}  p95 {result['p95_ms']:7.2f}  "
+                    f"p99 {result['p99_ms']:7.2f} ms  "
+                    f"{'' if queries is None else f'{queries:5.1f} q  '}{result['bytes']:9.0f} B"
+                )
+
+    def print_comparison(self, before: dict, after: dict):
+        self.stdout.write(f"p50 change since {before.get('commit') or 'baseline'}:")
+        for name, result in after["client"].items():
+            previous = before.get("client", {}).get(name)
+            if not previous or not previous["p50_ms"]:
+                continue
+            change = (result["p50_ms"] / previous["p50_ms"] - 1) * 100
+            self.stdout.write(
+                f"  {name:<38} {previous['p50_ms']:7.2f} -> {result['p50_ms']:7.2f} ms "
+                f"({change:+.0f}%)  queries {previous['queries']:.1f} -> {result['queries']:.1f}"
+            )
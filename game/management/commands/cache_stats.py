@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from game import cache
+
+
+class Command(BaseCommand):
+    help = "Show hit/miss counters of the page fragment cache."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--reset", action="store_true", help="Reset the counters afterwards."
+        )
+
+    def handle(self, *args, reset, **options):
+        stats = cache.stats()
+        total = stats["hits"] + stats["misses"]
+        ratio = stats["hits"] / total if total else 0.0
+        self.stdout.write(
+            f"hits {stats['hits']}  misses {stats['misses']}  hit ratio {ratio:.1%}"
+        )
+        if reset:
+            cache.reset_stats()
@@ -0,0 +1,107 @@
+import os
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from game import cache, photos
+from game.images import RENDITION_FORMATS, rendition_name
+from game.models import CompletedTask
+from game.storage import content_hash, content_name, photo_storage
+
+
+def hash_photo(name: str) -> tuple[str, str | None, int]:
+    storage = photo_storage()
+    try:
+        with storage.open(name) as photo:
+            return name, content_name(name, content_hash(photo)), photo.size
+    except OSError:
+        return name, None, 0
+
+
+def move(path: str, target: str) -> bool:
+    """Move ``path`` to ``target`` unless an identical file is already there.
+    Returns whether it was a duplicate."""
+    if os.path.exists(target):
+        os.remove(path)
+        return True
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    os.replace(path, target)
+    return False
+
+
+class Command(BaseCommand):
+    help = (
+        "Rename stored photos to their content hash so identical files are "
+        "kept once, and recount photo references."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--processes", type=int, default=os.cpu_count())
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Only report how many files and bytes would be freed.",
+        )
+
+    def handle(self, *args, processes, dry_run, **options):
+        storage = photo_storage()
+        names = list(
+            CompletedTask.objects.exclude(photo="")
+            .values_list("photo", flat=True)
+            .distinct()
+            .order_by()
+        )
+        # Targets created earlier in this run, or that would be in a dry run.
+        seen = set()
+        renamed = merged = missing = freed = 0
+        with photos.file_workers(processes) as pool:
+            # Hashing is the slow part; the renames below are cheap.
+            for name, target, size in pool.map(hash_photo, names, chunksize=32):
+                if target is None:
+                    missing += 1
+                    continue
+                if target == name:
+                    continue
+                duplicate = target in seen or storage.exists(target)
+                seen.add(target)
+                if duplicate:
+                    merged += 1
+                    freed += size
+                else:
+                    renamed += 1
+                if not dry_run:
+                    self.relocate(name, target)
+
+        if dry_run:
+            self.stdout.write(
+                f"Would rename {renamed} photos and merge {merged} duplicates, "
+                f"freeing {freed / 2**20:.1f} MB; {missing} missing."
+            )
+            return
+        blobs = photos.rebuild_blobs()
+        cache.bump("gallery")
+        self.stdout.write(
+            f"Renamed {renamed} photos, merged {merged} duplicates "
+            f"({freed / 2**20:.1f} MB freed), {missing} missing; "
+            f"{blobs} photos in use."
+        )
+
+    def relocate(self, name: str, target: str) -> None:
+        storage = photo_storage()
+        completions = CompletedTask.objects.filter(photo=name)
+        widths = completions.values_list("renditions", flat=True).first() or []
+        with transaction.atomic():
+            owners = set(completions.values_list("user_task__user_id", flat=True))
+            completions.update(photo=target)
+            # A failed move rolls the rows back to the old name.
+            move(storage.path(name), storage.path(target))
+        for width in widths:
+            for ext in RENDITION_FORMATS:
+                source = default_storage.path(rendition_name(name, width, ext))
+                if os.path.exists(source):
+                    move(
+                        source,
+                        default_storage.path(rendition_name(target, width, ext)),
+                    )
+        cache.bump(*(f"user:{owner_id}" for owner_id in owners))
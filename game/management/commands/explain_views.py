@@ -0,0 +1,109 @@
+import re
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from django.test import RequestFactory
+
+from game import draw, leaderboard
+from game.models import LeaderboardEntry, UserTask
+from game.views import AllPhotosView, MyPhotosView, TaskListView
+
+GALLERY_ORDER = ("-completedtask__date_completed", "-completedtask__id")
+
+# "SCAN game_task" in SQLite and "Seq Scan on game_task" in PostgreSQL read
+# the whole table; "SCAN ... USING INDEX" and index scans don't.
+SQLITE_SCAN = re.compile(r"\bSCAN (?:TABLE )?(\w+)(?!\w| USING)")
+POSTGRES_SCAN = re.compile(r"Seq Scan on (\w+)")
+
+
+def view_queryset(view_class, user):
+    request = RequestFactory().get("/")
+    request.user = user
+    return view_class(request=request, kwargs={}).get_queryset()
+
+
+def view_querysets(user: User) -> dict:
+    return {
+        "tasks": view_queryset(TaskListView, user),
+        "tasks_detail": user.usertask_set.filter(completedtask=None),
+        "my-photos": view_queryset(MyPhotosView, user).order_by(*GALLERY_ORDER)[:20],
+        "all-photos": view_queryset(AllPhotosView, user).order_by(*GALLERY_ORDER)[:20],
+        "dashboard leaderboard": leaderboard.top(10),
+        "dashboard rank": LeaderboardEntry.objects.filter(verified_count__gt=1),
+        "draw limit": UserTask.objects.filter(user=user, completedtask=None),
+        "draw pick": draw.undrawn_tasks(user)
+        .filter(draw_key__gte=0.5)
+        .order_by("draw_key")
+        .values_list("id", flat=True)[:1],
+    }
+
+
+def table_rows(table: str) -> int:
+    with connection.cursor() as cursor:
+        if connection.vendor == "postgresql":
+            cursor.execute(
+                "SELECT reltuples::bigint FROM pg_class WHERE relname = %s", [table]
+            )
+            row = cursor.fetchone()
+            return max(row[0], 0) if row else 0
+        cursor.execute(f"SELECT COUNT(*) FROM {connection.ops.quote_name(table)}")
+        return cursor.fetchone()[0]
+
+
+class Command(BaseCommand):
+    help = (
+        "EXPLAIN the queries behind each game view and fail on large sequential scans."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--user",
+            help="Username whose pages are explained. Defaults to the player with most tasks.",
+        )
+        parser.add_argument(
+            "--threshold",
+            type=int,
+            default=1_000,
+            help="Sequential scans of tables with more rows than this fail the check.",
+        )
+        parser.add_argument(
+            "--analyze", action="store_true", help="Refresh planner statistics first."
+        )
+        parser.add_argument(
+            "--verbose-plans", action="store_true", help="Print every plan."
+        )
+
+    def handle(self, *args, user, threshold, analyze, verbose_plans, **options):
+        if user:
+            player = User.objects.get(username=user)
+        else:
+            player = (
+                User.objects.annotate(tasks=Count("usertask"))
+                .order_by("-tasks")
+                .first()
+            )
+        if player is None:
+            raise CommandError(
+                "No users to explain views for; seed the database first."
+            )
+        if analyze:
+            with connection.cursor() as cursor:
+                cursor.execute("ANALYZE")
+        pattern = POSTGRES_SCAN if connection.vendor == "postgresql" else SQLITE_SCAN
+        failures = []
+        for name, queryset in view_querysets(player).items():
+            plan = queryset.explain()
+            scans = {table: table_rows(table) for table in pattern.findall(plan)}
+            large = {table: rows for table, rows in scans.items() if rows > threshold}
+            status = self.style.ERROR("SEQ SCAN") if large else self.style.SUCCESS("ok")
+            self.stdout.write(f"{name:<24} {status} {scans or ''}")
+            if verbose_plans or large:
+                self.stdout.write(plan)
+            if large:
+                failures.append(name)
+        if failures:
+            raise CommandError(
+                f"Sequential scans above {threshold} rows in: {', '.join(failures)}"
+            )
@@ -0,0 +1,48 @@
+import contextlib
+import sys
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from game.archive import photo_archive
+from game.models import CompletedTask
+
+
+class Command(BaseCommand):
+    help = (
+        "Write a ZIP of the public gallery, or of one player's photos, with a "
+        "manifest.csv of tasks, authors and dates."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("output", help='ZIP file to write, or "-" for stdout.')
+        parser.add_argument("--user", help="Only this player's photos, public or not.")
+        parser.add_argument("--chunk-size", type=int, default=500)
+
+    def handle(self, *args, output, user, chunk_size, **options):
+        if user:
+            try:
+                user = User.objects.get(username=user)
+            except User.DoesNotExist:
+                raise CommandError(f"No user {user}")
+            queryset = CompletedTask.objects.filter(user_task__user=user)
+        else:
+            queryset = CompletedTask.objects.filter(is_public=True)
+
+        started = time.perf_counter()
+        written = 0
+        # stdout is not ours to close.
+        with (
+            contextlib.nullcontext(sys.stdout.buffer)
+            if output == "-"
+            else open(output, "wb")
+        ) as f:
+            for chunk in photo_archive(queryset, chunk_size=chunk_size):
+                f.write(chunk)
+                written += len(chunk)
+        elapsed = time.perf_counter() - started
+        self.stderr.write(
+            f"Wrote {written / 2**20:.1f} MB in {elapsed:.1f} s "
+            f"({written / 2**20 / elapsed:.1f} MB/s)."
+        )
@@ -0,0 +1,59 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db.models import Count, Max, Min, Q
+
+from game.models import DESCRIPTION_FIELDS, Task
+from game.taskfile import FORMATS, RowWriter, detect_format, open_text
+
+COMPLETED = "usertask__completedtask"
+
+STATS = {
+    "drawn": Count("usertask"),
+    "completed": Count(COMPLETED),
+    "verified": Count(COMPLETED, filter=Q(**{f"{COMPLETED}__task_verified": True})),
+    "public": Count(COMPLETED, filter=Q(**{f"{COMPLETED}__is_public": True})),
+    "first_completed": Min(f"{COMPLETED}__date_completed"),
+    "last_completed": Max(f"{COMPLETED}__date_completed"),
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Write every task to CSV or JSON Lines, in the format import_tasks "
+        "reads, optionally with per-task completion stats."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--output", default="-", help='File to write, or "-" for stdout.'
+        )
+        parser.add_argument("--format", choices=FORMATS)
+        parser.add_argument(
+            "--stats",
+            action="store_true",
+            help=f"Add {', '.join(STATS)} columns.",
+        )
+        parser.add_argument("--chunk-size", type=int, default=5_000)
+
+    def handle(self, *args, output, stats, chunk_size, **options):
+        fmt = detect_format(output, options["format"])
+        started = time.perf_counter()
+        fields = ["id", *DESCRIPTION_FIELDS]
+        queryset = Task.objects.order_by("id")
+        if stats:
+            queryset = queryset.annotate(**STATS)
+            fields += list(STATS)
+        written = 0
+        with open_text(output, "w", self.stdout) as stream:
+            writer = RowWriter(stream, fmt, fields)
+            # iterator() fetches in chunks (a server-side cursor on
+            # PostgreSQL), so memory doesn't grow with the number of tasks.
+            for row in queryset.values(*fields).iterator(chunk_size=chunk_size):
+                writer.write(row)
+                written += 1
+        elapsed = time.perf_counter() - started
+        self.stderr.write(
+            f"Exported {written} tasks in {elapsed:.1f} s "
+            f"({written / elapsed:.0f} rows/s)."
+        )
@@ -0,0 +1,88 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from game import cache
+from game.models import DESCRIPTION_FIELDS, Task
+from game.taskfile import FORMATS, batched, detect_format, open_text, read_rows
+
+
+class Command(BaseCommand):
+    help = (
+        "Create or update tasks from a CSV or JSON Lines file with "
+        f"{', '.join(DESCRIPTION_FIELDS)} columns. Tasks with the same "
+        f"normalized {DESCRIPTION_FIELDS[0]} (or, where that's empty, the first "
+        "description filled in) are updated in place; the other translations "
+        "aren't compared."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help='File to read, or "-" for stdin.')
+        parser.add_argument("--format", choices=FORMATS)
+        parser.add_argument("--chunk-size", type=int, default=5_000)
+
+    def handle(self, *args, path, chunk_size, **options):
+        fmt = detect_format(path, options["format"])
+        started = time.perf_counter()
+        read = upserted = repeated = skipped = 0
+        with open_text(path, "r") as stream:
+            try:
+                for chunk in batched(
+                    read_rows(stream, fmt, DESCRIPTION_FIELDS), chunk_size
+                ):
+                    read += len(chunk)
+                    tasks, fields = {}, set()
+                    for row in chunk:
+                        task = Task(
+                            **{
+                                f: (row.get(f) or "").strip()
+                                for f in DESCRIPTION_FIELDS
+                            }
+                        )
+                        task.normalized_key = task.compute_key()
+                        if task.normalized_key is None:
+                            skipped += 1
+                            continue
+                        if task.normalized_key in tasks:
+                            repeated += 1
+                        # The last of several rows for the same task wins.
+                        tasks[task.normalized_key] = task
+                        fields.update(f for f in DESCRIPTION_FIELDS if f in row)
+                    upserted += self.upsert(list(tasks.values()), fields)
+                    if options["verbosity"] >= 2:
+                        self.progress(read, started)
+            except (ValueError, TypeError, UnicodeDecodeError) as error:
+                raise CommandError(f"{path}: {error}") from error
+
+        # bulk_create sends no signals.
+        cache.bump("tasks")
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Read {read} rows in {elapsed:.1f} s ({read / elapsed:.0f} rows/s): "
+                f"{upserted} tasks created or updated, {repeated} repeated rows, "
+                f"{skipped} rows without a description."
+            )
+        )
+
+    def upsert(self, tasks: list[Task], fields: set[str]) -> int:
+        if not tasks:
+            return 0
+        # Only the columns in the file are overwritten; the untranslated
+        # ``description`` column follows the default language.
+        update_fields = [f for f in DESCRIPTION_FIELDS if f in fields]
+        if DESCRIPTION_FIELDS[0] in fields:
+            update_fields.append("description")
+        with transaction.atomic():
+            Task.objects.bulk_create(
+                tasks,
+                update_conflicts=True,
+                unique_fields=["normalized_key"],
+                update_fields=update_fields,
+            )
+        return len(tasks)
+
+    def progress(self, read: int, started: float) -> None:
+        elapsed = time.perf_counter() - started
+        self.stderr.write(f"{read} rows, {read / elapsed:.0f} rows/s")
@@ -0,0 +1,63 @@
+import os
+import re
+import subprocess
+import sys
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# python -X importtime writes "import time: <self us> | <cumulative us> | <module>",
+# with the module indented by its nesting depth.
+LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$")
+
+
+class Command(BaseCommand):
+    help = (
+        "Import the WSGI app in a fresh interpreter under python -X importtime "
+        "and list the packages and modules that take longest to import."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--top", type=int, default=15)
+        parser.add_argument("--app", default="kc_django.wsgi", help="Module to import.")
+
+    def handle(self, *args, top, app, **options):
+        started = time.perf_counter()
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", f"import {app}"],
+            cwd=settings.BASE_DIR,
+            env={**os.environ, "DJANGO_SETTINGS_MODULE": settings.SETTINGS_MODULE},
+            capture_output=True,
+            text=True,
+            check=False,
+        )
+        elapsed = time.perf_counter() - started
+        if result.returncode:
+            raise CommandError(result.stderr[-2000:])
+
+        by_package = Counter()
+        direct = Counter()
+        for line in result.stderr.splitlines():
+            match = LINE.match(line)
+            if not match:
+                continue
+            own, cumulative, indent, module = match.groups()
+            by_package[module.split(".")[0]] += int(own)
+            # What the app module imports directly (one level in), with
+            # everything those import in turn.
+            if len(indent) == 3:
+                direct[module] = int(cumulative)
+        total = sum(by_package.values())
+
+        self.stdout.write(
+            f"Started and imported {app} in {elapsed:.2f} s, "
+            f"{total / 1e6:.2f} s of it importing.\n"
+        )
+        self.stdout.write("Own import time by package:")
+        for package, us in by_package.most_common(top):
+            self.stdout.write(f"  {us / 1000:8.1f} ms  {us / total:6.1%}  {package}")
+        self.stdout.write(f"\nSlowest imports made by {app}, with their own imports:")
+        for module, us in direct.most_common(top):
+            self.stdout.write(f"  {us / 1000:8.1f} ms  {module}")
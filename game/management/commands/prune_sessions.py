@@ -0,0 +1,41 @@
+import time
+
+from django.contrib.sessions.models import Session
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete expired sessions a batch at a time. Unlike clearsessions, "
+        "each batch is a short delete by primary key, so logins going on "
+        "meanwhile aren't held up."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1_000)
+        parser.add_argument(
+            "--sleep",
+            type=float,
+            default=0.0,
+            help="Seconds to wait between batches.",
+        )
+
+    def handle(self, *args, batch_size, sleep, **options):
+        started = time.perf_counter()
+        now = timezone.now()
+        expired = Session.objects.filter(expire_date__lt=now).order_by("expire_date")
+        deleted = 0
+        while keys := list(expired.values_list("pk", flat=True)[:batch_size]):
+            deleted += Session.objects.filter(pk__in=keys).delete()[0]
+            if options["verbosity"] >= 2:
+                self.stderr.write(f"{deleted} sessions deleted")
+            if sleep:
+                time.sleep(sleep)
+        # Cached copies of these sessions time out on their own.
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Deleted {deleted} expired sessions in {elapsed:.1f} s."
+            )
+        )
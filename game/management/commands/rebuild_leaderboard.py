@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from game import leaderboard
+
+
+class Command(BaseCommand):
+    help = "Rebuild the leaderboard table from verified completions and verify it."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--check",
+            action="store_true",
+            help="Only compare the table with the live aggregate, don't rebuild.",
+        )
+
+    def handle(self, *args, check, **options):
+        if not check:
+            users = leaderboard.rebuild()
+            self.stdout.write(f"Rebuilt leaderboard for {users} users.")
+        differences = leaderboard.differences()
+        for user_id, (stored, live) in sorted(differences.items()):
+            self.stderr.write(f"user {user_id}: stored {stored}, live {live}")
+        if differences:
+            raise CommandError(f"Leaderboard differs for {len(differences)} users.")
+        self.stdout.write(self.style.SUCCESS("Leaderboard matches the live aggregate."))
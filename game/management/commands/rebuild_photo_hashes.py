@@ -0,0 +1,40 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand
+
+from game import phash, photos
+from game.models import CompletedTask
+
+
+class Command(BaseCommand):
+    help = "Compute perceptual hashes for photos that don't have one yet."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--processes", type=int, default=os.cpu_count())
+        parser.add_argument(
+            "--all",
+            action="store_true",
+            dest="rehash",
+            help="Recompute the hash of every photo.",
+        )
+
+    def handle(self, *args, processes, rehash, **options):
+        started = time.perf_counter()
+        queryset = CompletedTask.objects.exclude(photo="")
+        if not rehash:
+            queryset = queryset.filter(photo_hash=None)
+        names = list(queryset.values_list("photo", flat=True).distinct().order_by())
+        done = failed = 0
+        with photos.file_workers(processes) as pool:
+            for name, value in pool.map(phash.hash_photo, names, chunksize=32):
+                if value is None:
+                    failed += 1
+                    continue
+                CompletedTask.objects.filter(photo=name).update(photo_hash=value)
+                done += 1
+        phash.changed()
+        self.stdout.write(
+            f"Hashed {done} photos in {time.perf_counter() - started:.1f} s, "
+            f"{failed} failed; {len(phash.index())} photos indexed."
+        )
@@ -0,0 +1,72 @@
+import os
+import signal
+import socket
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import timedelta
+
+from django import db
+from django.core.management.base import BaseCommand
+
+from game import jobs
+
+
+def _run_and_close(job):
+    try:
+        return jobs.run(job)
+    finally:
+        db.connection.close()
+
+
+class Command(BaseCommand):
+    help = "Process background jobs from the database queue."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--concurrency",
+            type=int,
+            default=2,
+            help="Jobs run in parallel by this worker.",
+        )
+        parser.add_argument(
+            "--visibility",
+            type=int,
+            default=300,
+            help="Seconds a claimed job stays hidden from other workers.",
+        )
+        parser.add_argument(
+            "--poll",
+            type=float,
+            default=1.0,
+            help="Seconds to wait when the queue is empty.",
+        )
+        parser.add_argument(
+            "--once", action="store_true", help="Exit once the queue is drained."
+        )
+
+    def handle(self, *args, concurrency, visibility, poll, once, **options):
+        worker = f"{socket.gethostname()}:{os.getpid()}"
+        self.stopping = False
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        running = set()
+        # Leaving the executor waits for jobs that are still running.
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            while not self.stopping:
+                free = concurrency - len(running)
+                if free:
+                    claimed = jobs.claim(worker, free, timedelta(seconds=visibility))
+                    running.update(pool.submit(_run_and_close, job) for job in claimed)
+                if running:
+                    _, running = wait(
+                        running, timeout=poll, return_when=FIRST_COMPLETED
+                    )
+                elif once:
+                    break
+                else:
+                    db.close_old_connections()
+                    time.sleep(poll)
+        self.stdout.write(f"Worker {worker} stopped.")
+
+    def stop(self, signum, frame):
+        self.stopping = True
@@ -0,0 +1,150 @@
+import random
+import secrets
+import time
+from io import BytesIO
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from PIL import Image, ImageDraw
+
+from game import cache, leaderboard, photos
+from game.images import render_photo
+from game.models import CompletedTask, Task, UserTask, description_key
+from game.taskfile import batched
+
+
+def generated_photo(index: int, size: int) -> ContentFile:
+    image = Image.new(
+        "RGB", (size * 4 // 3, size), tuple(random.randrange(256) for _ in range(3))
+    )
+    ImageDraw.Draw(image).text((4, 4), str(index), fill=(255, 255, 255))
+    buffer = BytesIO()
+    image.save(buffer, "JPEG", quality=80)
+    return ContentFile(buffer.getvalue(), name=f"load-{index}.jpg")
+
+
+class Command(BaseCommand):
+    help = "Bulk-create players, tasks, draws and photos for load testing."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=1_000)
+        parser.add_argument("--tasks", type=int, default=5_000)
+        parser.add_argument("--tasks-per-user", type=int, default=20)
+        parser.add_argument("--completed-ratio", type=float, default=0.7)
+        parser.add_argument("--verified-ratio", type=float, default=0.5)
+        parser.add_argument("--public-ratio", type=float, default=0.9)
+        parser.add_argument(
+            "--images",
+            type=int,
+            default=50,
+            help="Distinct generated photos shared by completions.",
+        )
+        parser.add_argument("--image-size", type=int, default=480)
+        parser.add_argument("--batch-size", type=int, default=2_000)
+        parser.add_argument(
+            "--prefix", default="load", help="Prefix of generated usernames."
+        )
+        parser.add_argument("--seed", type=int, default=None, help="Random seed.")
+        parser.add_argument(
+            "--allow-superuser",
+            action="store_true",
+            help="Seed with DEBUG off too; the seeded users include a superuser.",
+        )
+
+    def handle(self, *args, **options):
+        if not settings.DEBUG and not options["allow_superuser"]:
+            raise CommandError(
+                "seed_load creates a superuser; run it with DEBUG on or pass "
+                "--allow-superuser."
+            )
+        random.seed(options["seed"])
+        batch_size = options["batch_size"]
+        prefix = options["prefix"]
+        started = time.perf_counter()
+
+        generated = []
+        for index in range(options["images"]):
+            name = default_storage.save(
+                f"tasks_photos/{prefix}/load-{index}.jpg",
+                generated_photo(index, options["image_size"]),
+            )
+            generated.append(render_photo(name))
+        self.stdout.write(f"Generated {len(generated)} photos")
+
+        secret = secrets.token_urlsafe(12)
+        with transaction.atomic():
+            # Hashing is deliberately slow, so every player shares one hash.
+            password = make_password(secret)
+            users = []
+            for batch in batched(
+                (
+                    User(username=f"{prefix}-{i}", password=password)
+                    for i in range(options["users"])
+                ),
+                batch_size,
+            ):
+                users += User.objects.bulk_create(batch)
+            User.objects.create_superuser(f"{prefix}-admin", password=secret)
+            self.stdout.write(
+                f"Created {len(users)} users and {prefix}-admin, "
+                f"all with the password {secret}"
+            )
+
+            task_ids = []
+            for batch in batched(
+                (
+                    Task(
+                        description_pl=f"Zadanie {prefix} {i}",
+                        description_en=f"Task {prefix} {i}",
+                        normalized_key=description_key(f"Zadanie {prefix} {i}"),
+                    )
+                    for i in range(options["tasks"])
+                ),
+                batch_size,
+            ):
+                task_ids += [task.pk for task in Task.objects.bulk_create(batch)]
+            self.stdout.write(f"Created {len(task_ids)} tasks")
+
+            per_user = min(options["tasks_per_user"], len(task_ids))
+            drawn = 0
+            completed = 0
+            for batch in batched(
+                (
+                    UserTask(user=user, task_id=task_id)
+                    for user in users
+                    for task_id in random.sample(task_ids, per_user)
+                ),
+                batch_size,
+            ):
+                user_tasks = UserTask.objects.bulk_create(batch)
+                drawn += len(user_tasks)
+                completions = [
+                    self.completion(user_task, random.choice(generated), options)
+                    for user_task in user_tasks
+                    if random.random() < options["completed_ratio"]
+                ]
+                completed += len(CompletedTask.objects.bulk_create(completions))
+            self.stdout.write(f"Created {drawn} user tasks, {completed} completed")
+
+            # bulk_create doesn't send signals, so bring derived data up to date.
+            leaderboard.rebuild()
+            photos.rebuild_blobs()
+            cache.bump("gallery", "tasks", "leaderboard")
+        self.stdout.write(
+            self.style.SUCCESS(f"Seeded in {time.perf_counter() - started:.1f} s")
+        )
+
+    def completion(self, user_task, photo, options) -> CompletedTask:
+        name, renditions = photo
+        return CompletedTask(
+            user_task=user_task,
+            photo=name,
+            renditions=renditions,
+            task_verified=random.random() < options["verified_ratio"],
+            is_public=random.random() < options["public_ratio"],
+        )
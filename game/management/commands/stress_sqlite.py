@@ -0,0 +1,117 @@
+import io
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django import db
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.urls import reverse
+from PIL import Image
+
+from game import retry
+from game.benchmarks import percentile
+from game.models import Task, UserTask
+
+PREFIX = "stress-"
+
+
+def photo() -> io.BytesIO:
+    buffer = io.BytesIO()
+    Image.new("RGB", (64, 48), (os.getpid() % 256, 120, 60)).save(buffer, "JPEG")
+    buffer.seek(0)
+    buffer.name = "stress.jpg"
+    return buffer
+
+
+def hammer(username: str, rounds: int) -> dict:
+    """Draw and complete ``rounds`` tasks as ``username`` through the views,
+    as a browser would."""
+    # Lock waits make requests slow on purpose; don't log every one.
+    logging.getLogger("game.metrics").setLevel(logging.ERROR)
+    client = Client(HTTP_HOST="localhost")
+    client.force_login(User.objects.get(username=username))
+    samples, failures = [], []
+    for _ in range(rounds):
+        for name, request in (
+            ("draw", lambda: client.post(reverse("dashboard"))),
+            ("upload", lambda: upload(client, username)),
+        ):
+            start = time.perf_counter()
+            try:
+                response = request()
+            except db.OperationalError as error:
+                failures.append(f"{name}: {error}")
+                continue
+            samples.append(time.perf_counter() - start)
+            if response.status_code != 302:
+                failures.append(f"{name}: HTTP {response.status_code}")
+    return {"samples": samples, "failures": failures, "retries": retry.retries}
+
+
+def upload(client: Client, username: str):
+    user_task = (
+        UserTask.objects.filter(user__username=username, completedtask=None)
+        .order_by("pk")
+        .first()
+    )
+    if user_task is None:
+        raise db.OperationalError("nothing drawn to upload")
+    return client.post(reverse("tasks_detail", args=[user_task.pk]), {"photo": photo()})
+
+
+class Command(BaseCommand):
+    help = (
+        "Have many processes draw tasks and upload photos at once against the "
+        "SQLite database, and report locking failures, retries and latency. "
+        "Creates its own players and tasks and deletes them afterwards. Set "
+        "DB_SQLITE_CONCURRENT_WRITES to measure the concurrent-write profile."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--processes", type=int, default=16)
+        parser.add_argument("--rounds", type=int, default=20)
+
+    def handle(self, *args, processes, rounds, **options):
+        if connection.vendor != "sqlite":
+            raise CommandError("This stress test is for the SQLite profile.")
+        usernames = [f"{PREFIX}{i}" for i in range(processes)]
+        self.cleanup()
+        for username in usernames:
+            User.objects.create_user(username)
+        tasks = [Task(description=f"{PREFIX}{i}") for i in range(processes * rounds)]
+        for task in tasks:
+            task.normalized_key = task.compute_key()
+        Task.objects.bulk_create(tasks)
+
+        # Each process opens its own connection.
+        db.connections.close_all()
+        started = time.perf_counter()
+        try:
+            with ProcessPoolExecutor(processes) as pool:
+                results = list(pool.map(hammer, usernames, [rounds] * processes))
+        finally:
+            self.cleanup()
+        elapsed = time.perf_counter() - started
+
+        samples = [s for result in results for s in result["samples"]]
+        failures = [f for result in results for f in result["failures"]]
+        for failure in sorted(set(failures)):
+            self.stderr.write(f"  {failures.count(failure)} x {failure}")
+        self.stdout.write(
+            f"{len(samples)} writes in {elapsed:.1f} s "
+            f"({len(samples) / elapsed:.0f}/s), p50 "
+            f"{percentile(samples, 50) * 1000:.0f} ms, p99 "
+            f"{percentile(samples, 99) * 1000:.0f} ms, "
+            f"{sum(r['retries'] for r in results)} retries, "
+            f"{len(failures)} failures."
+        )
+        if failures:
+            raise CommandError("Some writes failed.")
+
+    def cleanup(self):
+        User.objects.filter(username__startswith=PREFIX).delete()
+        Task.objects.filter(description__startswith=PREFIX).delete()
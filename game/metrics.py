@@ -0,0 +1,269 @@
+import atexit
+import json
+import logging
+import os
+import threading
+import time
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+# Statements listed in the slow-request log, slowest first.
+SLOW_LOG_STATEMENTS = 20
+
+# name: (type, help)
+METRICS = {
+    "kc_http_requests_total": ("counter", "Requests by route, method and status."),
+    "kc_http_request_duration_seconds": (
+        "histogram",
+        "Time from the first middleware until the response is returned.",
+    ),
+    "kc_http_response_bytes_total": (
+        "counter",
+        "Response body bytes, not counting streamed responses.",
+    ),
+    "kc_db_queries_total": ("counter", "SQL statements run while serving requests."),
+    "kc_db_query_seconds_total": ("counter", "Time spent in those statements."),
+    "kc_template_render_seconds_total": ("counter", "Time spent rendering templates."),
+}
+
+
+class Registry:
+    """Cumulative samples of this process, keyed by ``(name, labels)``.
+
+    Histogram buckets are stored already cumulative, so the samples of
+    several processes are merged by simply adding them up.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pid = os.getpid()
+        self.samples = {}
+        self.flushed_at = 0.0
+
+    def _forked(self) -> None:
+        # A gunicorn worker starts with a copy of the master's samples, which
+        # the master's own file already counts.
+        if self.pid != os.getpid():
+            self.pid = os.getpid()
+            self.samples = {}
+            self.flushed_at = 0.0
+
+    def inc(self, name: str, labels: tuple, value: float = 1) -> None:
+        key = (name, labels)
+        self.samples[key] = self.samples.get(key, 0) + value
+
+    def observe(self, name: str, labels: tuple, value: float) -> None:
+        for le in DURATION_BUCKETS:
+            if value <= le:
+                self.inc(f"{name}_bucket", (*labels, ("le", str(le))))
+        self.inc(f"{name}_bucket", (*labels, ("le", "+Inf")))
+        self.inc(f"{name}_sum", labels, value)
+        self.inc(f"{name}_count", labels)
+
+    def record(self, route: str, method: str, status: int, metrics: "RequestMetrics"):
+        labels = (("route", route),)
+        with self.lock:
+            self._forked()
+            self.inc(
+                "kc_http_requests_total",
+                (*labels, ("method", method), ("status", str(status))),
+            )
+            self.observe("kc_http_request_duration_seconds", labels, metrics.duration)
+            self.inc("kc_http_response_bytes_total", labels, metrics.size)
+            self.inc("kc_db_queries_total", labels, len(metrics.queries))
+            self.inc("kc_db_query_seconds_total", labels, metrics.sql_time)
+            self.inc("kc_template_render_seconds_total", labels, metrics.template_time)
+
+    def dump(self) -> list:
+        with self.lock:
+            self._forked()
+            return [
+                [name, list(labels), v] for (name, labels), v in self.samples.items()
+            ]
+
+    def flush(self, force: bool = False) -> None:
+        """Write the samples to ``METRICS_DIR/<pid>.json``, at most every
+        ``METRICS_FLUSH_SECONDS`` unless forced."""
+        if not settings.METRICS_DIR:
+            return
+        now = time.monotonic()
+        if not force and now - self.flushed_at < settings.METRICS_FLUSH_SECONDS:
+            return
+        self.flushed_at = now
+        samples = self.dump()
+        os.makedirs(settings.METRICS_DIR, exist_ok=True)
+        path = os.path.join(settings.METRICS_DIR, f"{self.pid}.json")
+        # Readers must never see half a file.
+        with open(f"{path}.tmp", "w") as f:
+            json.dump(samples, f)
+        os.replace(f"{path}.tmp", path)
+
+
+registry = Registry()
+atexit.register(registry.flush, force=True)
+
+
+def collect() -> dict:
+    """Samples of every process that wrote to ``METRICS_DIR``, summed.
+
+    Files of exited workers are kept, so counters never go backwards while
+    the app is up; empty the directory when deploying.
+    """
+    dumps = {registry.pid: registry.dump()}
+    if settings.METRICS_DIR and os.path.isdir(settings.METRICS_DIR):
+        for entry in os.scandir(settings.METRICS_DIR):
+            pid, ext = os.path.splitext(entry.name)
+            if ext != ".json" or not pid.isdigit() or int(pid) in dumps:
+                continue
+            try:
+                with open(entry.path) as f:
+                    dumps[int(pid)] = json.load(f)
+            except (OSError, ValueError):
+                logger.warning("Skipping unreadable metrics file %s", entry.path)
+    totals = {}
+    for samples in dumps.values():
+        for name, labels, value in samples:
+            key = (name, tuple(map(tuple, labels)))
+            totals[key] = totals.get(key, 0) + value
+    return totals
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def exposition(samples: dict) -> str:
+    """``samples`` in the Prometheus text format."""
+    lines = []
+    for metric, (kind, help_text) in METRICS.items():
+        lines += [f"# HELP {metric} {help_text}", f"# TYPE {metric} {kind}"]
+        for (name, labels), value in sorted(samples.items()):
+            if name == metric or (
+                kind == "histogram"
+                and name in (f"{metric}_bucket", f"{metric}_sum", f"{metric}_count")
+            ):
+                label_text = ",".join(f'{k}="{_escape(v)}"' for k, v in labels)
+                lines.append(f"{name}{{{label_text}}} {value:g}")
+    return "\n".join(lines) + "\n"
+
+
+@dataclass
+class RequestMetrics:
+    queries: list = field(default_factory=list)
+    sql_time: float = 0.0
+    template_time: float = 0.0
+    duration: float = 0.0
+    size: int = 0
+
+
+_current: ContextVar[RequestMetrics | None] = ContextVar(
+    "metrics_request", default=None
+)
+
+
+def _record_query(execute, sql, params, many, context):
+    metrics = _current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        elapsed = time.perf_counter() - started
+        metrics.queries.append((sql, elapsed))
+        metrics.sql_time += elapsed
+
+
+def install_query_recorder() -> None:
+    """Time the statements of this thread's connections from now on.
+
+    Called on request_started, which the async handler sends from the thread
+    its ORM calls run in. The wrapper stays installed; outside a request it
+    just passes statements through.
+    """
+    for alias in connections:
+        connection = connections[alias]
+        if _record_query not in connection.execute_wrappers:
+            connection.execute_wrappers.append(_record_query)
+
+
+class MetricsMiddleware:
+    """Records latency, SQL, template time and size of every request, and
+    logs requests slower than ``METRICS_SLOW_REQUEST_SECONDS`` with their
+    slowest statements."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        self.finish(request, response, metrics, started)
+        return response
+
+    async def __acall__(self, request):
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        self.finish(request, response, metrics, started)
+        return response
+
+    def process_template_response(self, request, response):
+        metrics = _current.get()
+        if metrics is not None:
+            started = time.perf_counter()
+
+            def rendered(response):
+                metrics.template_time += time.perf_counter() - started
+
+            response.add_post_render_callback(rendered)
+        return response
+
+    def finish(self, request, response, metrics, started):
+        metrics.duration = time.perf_counter() - started
+        if not response.streaming:
+            metrics.size = len(response.content)
+        match = request.resolver_match
+        route = match.view_name if match else "<unmatched>"
+        registry.record(route, request.method, response.status_code, metrics)
+        registry.flush()
+        if metrics.duration >= settings.METRICS_SLOW_REQUEST_SECONDS:
+            slowest = sorted(metrics.queries, key=lambda q: q[1], reverse=True)
+            logger.warning(
+                "Slow request %s %s (%s): %.3f s, %d queries in %.3f s, "
+                "templates %.3f s%s",
+                request.method,
+                request.get_full_path(),
+                route,
+                metrics.duration,
+                len(metrics.queries),
+                metrics.sql_time,
+                metrics.template_time,
+                "".join(
+                    f"\n  {elapsed * 1000:.1f} ms  {sql}"
+                    for sql, elapsed in slowest[:SLOW_LOG_STATEMENTS]
+                ),
+            )
@@ -0,0 +1,35 @@
+# Generated by Django 5.1.6 on 2026-10-18 09:09
+
+import random
+
+from django.db import migrations, models
+
+import game.models
+
+
+def assign_draw_keys(apps, schema_editor):
+    # AddField evaluates the callable default once, so every existing task
+    # would otherwise share the same key.
+    Task = apps.get_model("game", "Task")
+    tasks = list(Task.objects.only("id"))
+    for task in tasks:
+        task.draw_key = random.random()
+    Task.objects.bulk_update(tasks, ["draw_key"], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("game", "0008_completedtask_task_verified"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="task",
+            name="draw_key",
+            field=models.FloatField(
+                db_index=True, default=game.models.random_draw_key, editable=False
+            ),
+        ),
+        migrations.RunPython(assign_draw_keys, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 5.1.6 on 2026-10-18 09:11
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def populate_leaderboard(apps, schema_editor):
+    CompletedTask = apps.get_model("game", "CompletedTask")
+    LeaderboardEntry = apps.get_model("game", "LeaderboardEntry")
+    counts = (
+        CompletedTask.objects.filter(task_verified=True)
+        .values("user_task__user")
+        .annotate(count=Count("id"))
+    )
+    LeaderboardEntry.objects.bulk_create(
+        LeaderboardEntry(user_id=row["user_task__user"], verified_count=row["count"])
+        for row in counts
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("auth", "0012_alter_user_first_name_max_length"),
+        ("game", "0009_task_draw_key"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="LeaderboardEntry",
+            fields=[
+                (
+                    "user",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        serialize=False,
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+                ("verified_count", models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["-verified_count", "user"],
+                        name="game_leaderboard_rank_idx",
+                    )
+                ],
+            },
+        ),
+        migrations.RunPython(populate_leaderboard, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.6 on 2026-10-18 09:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("game", "0010_leaderboardentry"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="completedtask",
+            name="renditions",
+            field=models.JSONField(blank=True, default=list, editable=False),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.1.6 on 2026-10-18 09:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("game", "0012_job"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="completedtask",
+            index=models.Index(
+                fields=["-date_completed", "-id"], name="game_ct_gallery_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,84 @@
+# Generated by Django 5.1.6 on 2026-10-18 09:21
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def drop_duplicate_user_tasks(apps, schema_editor):
+    # Keep one draw of every duplicated (user, task) pair: the one completed
+    # first, or else the first draw. The others go with their completions,
+    # and the kept completion counts as verified if any of them was.
+    UserTask = apps.get_model("game", "UserTask")
+    CompletedTask = apps.get_model("game", "CompletedTask")
+    LeaderboardEntry = apps.get_model("game", "LeaderboardEntry")
+    duplicates = (
+        UserTask.objects.values("user", "task")
+        .annotate(count=Count("id"))
+        .filter(count__gt=1)
+        .order_by()
+    )
+    recount = set()
+    for pair in list(duplicates):
+        draws = UserTask.objects.filter(user=pair["user"], task=pair["task"])
+        completions = CompletedTask.objects.filter(user_task__in=draws).order_by(
+            "date_completed", "id"
+        )
+        first = completions.first()
+        if first is None:
+            keep = draws.order_by("id").values_list("id", flat=True).first()
+        else:
+            keep = first.user_task_id
+            if completions.filter(task_verified=True).exists():
+                first.task_verified = True
+                first.save(update_fields=["task_verified"])
+            recount.add(pair["user"])
+        draws.exclude(id=keep).delete()
+    for user_id in recount:
+        LeaderboardEntry.objects.update_or_create(
+            user_id=user_id,
+            defaults={
+                "verified_count": CompletedTask.objects.filter(
+                    user_task__user=user_id, task_verified=True
+                ).count()
+            },
+        )
+    if schema_editor.connection.vendor == "postgresql":
+        # The deletes leave deferred foreign key checks pending, and
+        # PostgreSQL won't alter a table with pending trigger events in the
+        # same transaction; run the checks now.
+        schema_editor.execute("SET CONSTRAINTS ALL IMMEDIATE")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("game", "0013_completedtask_gallery_index"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_duplicate_user_tasks, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name="completedtask",
+            index=models.Index(
+                condition=models.Q(("is_public", True)),
+                fields=["-date_completed", "-id"],
+                name="game_ct_public_gallery_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="completedtask",
+            index=models.Index(
+                condition=models.Q(("task_verified", True)),
+                fields=["user_task"],
+                name="game_ct_verified_idx",
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="usertask",
+            constraint=models.UniqueConstraint(
+                fields=("user", "task"), name="game_usertask_unique_user_task"
+            ),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.1.6 on 2026-10-18 09:34
+
+from django.db import migrations, models
+
+import game.storage
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("game", "0014_query_indexes"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="completedtask",
+            name="photo",
+            field=models.ImageField(
+                storage=game.storage.photo_storage,
+                upload_to="tasks_photos/",
+                verbose_name="Photo",
+            ),
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.1.6 on 2026-10-18 11:20
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def count_references(apps, schema_editor):
+    CompletedTask = apps.get_model("game", "CompletedTask")
+    PhotoBlob = apps.get_model("game", "PhotoBlob")
+    counts = (
+        CompletedTask.objects.exclude(photo="")
+        .values("photo")
+        .annotate(count=Count("id"))
+    )
+    PhotoBlob.objects.bulk_create(
+        (PhotoBlob(name=row["photo"], refcount=row["count"]) for row in counts),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("game", "0015_photo_storage"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="PhotoBlob",
+            fields=[
+                (
+                    "name",
+                    models.CharField(max_length=100, primary_key=True, serialize=False),
+                ),
+                ("refcount", models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name="completedtask",
+            index=models.Index(fields=["photo", "id"], name="game_ct_photo_idx"),
+        ),
+        migrations.RunPython(count_references, migrations.RunPython.noop),
+    ]
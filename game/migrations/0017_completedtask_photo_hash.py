@@ -0,0 +1,18 @@
+# Generated by Django 5.1.6 on 2026-10-18 11:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("game", "0016_photoblob"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="completedtask",
+            name="photo_hash",
+            field=models.BigIntegerField(blank=True, editable=False, null=True),
+        ),
+    ]
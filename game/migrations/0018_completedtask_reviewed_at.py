@@ -0,0 +1,36 @@
+# Generated by Django 5.1.6 on 2026-10-18 12:24
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def mark_verified_as_reviewed(apps, schema_editor):
+    # Verified photos were reviewed by hand already; keep them out of the queue.
+    CompletedTask = apps.get_model("game", "CompletedTask")
+    CompletedTask.objects.filter(task_verified=True).update(
+        reviewed_at=F("date_completed")
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("game", "0017_completedtask_photo_hash"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="completedtask",
+            name="reviewed_at",
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.RunPython(mark_verified_as_reviewed, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name="completedtask",
+            index=models.Index(
+                condition=models.Q(("reviewed_at", None)),
+                fields=["id"],
+                name="game_ct_review_queue_idx",
+            ),
+        ),
+    ]
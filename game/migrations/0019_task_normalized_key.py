@@ -0,0 +1,67 @@
+# Generated by Django 5.1.6 on 2026-10-18 13:02
+
+import hashlib
+import unicodedata
+
+from django.db import migrations, models
+
+# Copies of game.models.description_key and DESCRIPTION_FIELDS as of this
+# migration, so later changes there don't change what it does.
+DESCRIPTION_FIELDS = ("description_pl", "description_en")
+
+
+def description_key(description: str) -> str | None:
+    normalized = " ".join(unicodedata.normalize("NFKC", description).casefold().split())
+    if not normalized:
+        return None
+    return hashlib.sha256(normalized.encode()).hexdigest()
+
+
+def duplicate_key(key: str, pk: int) -> str:
+    return hashlib.sha256(f"{key}:{pk}".encode()).hexdigest()
+
+
+def assign_normalized_keys(apps, schema_editor):
+    # Tasks that repeat an older task's description get a key of their own,
+    # which Task.save keeps until their description is edited, so they can
+    # still be saved and merged by hand.
+    Task = apps.get_model("game", "Task")
+    seen = set()
+    batch = []
+    for task in (
+        Task.objects.order_by("id")
+        .only("id", *DESCRIPTION_FIELDS)
+        .iterator(chunk_size=2000)
+    ):
+        keys = (description_key(getattr(task, f) or "") for f in DESCRIPTION_FIELDS)
+        key = next(filter(None, keys), None)
+        if key is None:
+            continue
+        if key in seen:
+            task.normalized_key = duplicate_key(key, task.pk)
+        else:
+            seen.add(key)
+            task.normalized_key = key
+        batch.append(task)
+        if len(batch) == 1000:
+            Task.objects.bulk_update(batch, ["normalized_key"])
+            batch = []
+    Task.objects.bulk_update(batch, ["normalized_key"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("game", "0018_completedtask_reviewed_at"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="task",
+            name="normalized_key",
+            field=models.CharField(
+                editable=False, max_length=64, null=True, unique=True
+            ),
+        ),
+        migrations.RunPython(assign_normalized_keys, migrations.RunPython.noop),
+    ]
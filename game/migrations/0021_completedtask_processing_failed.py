@@ -0,0 +1,18 @@
+# Generated by Django 5.1.6 on 2026-10-18 17:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("game", "0020_event"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="completedtask",
+            name="processing_failed",
+            field=models.BooleanField(default=False, editable=False),
+        ),
+    ]
@@ -1,34 +1,215 @@
+import hashlib
+import random
+import unicodedata
+
 from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+from django.core.files.storage import default_storage
 from django.db import models
+from django.utils import timezone
 from django.utils.safestring import mark_safe
 from django.utils.translation import gettext_lazy as _
+from modeltranslation.settings import AVAILABLE_LANGUAGES, DEFAULT_LANGUAGE
+
+from game.images import rendition_name, rendition_srcset
+from game.storage import photo_storage
 
 
 class UserTask(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     task = models.ForeignKey("Task", on_delete=models.CASCADE)
 
+    class Meta:
+        constraints = (
+            models.UniqueConstraint(fields=["user", "task"], name="game_usertask_unique_user_task"),
+        )
+
 class CompletedTask(models.Model):
     task_verified = models.BooleanField(default=False)
     date_completed = models.DateTimeField(auto_now_add=True)
     user_task = models.OneToOneField(UserTask, on_delete=models.CASCADE)
     is_public = models.BooleanField(verbose_name=_("Opublikuj w galerii"), default=True)
     photo = models.ImageField(verbose_name=_("Photo"),
-                              upload_to="tasks_photos/")
+                              upload_to="tasks_photos/",
+                              storage=photo_storage)
+    renditions = models.JSONField(default=list, blank=True, editable=False)
+    processing = models.BooleanField(default=False, editable=False)
+    # Set, with ``processing`` left on, once the processing job gives up.
+    processing_failed = models.BooleanField(default=False, editable=False)
+    photo_hash = models.BigIntegerField(null=True, blank=True, editable=False)
+    reviewed_at = models.DateTimeField(null=True, blank=True, editable=False)
+
+    class Meta:
+        indexes = (
+            models.Index(fields=["-date_completed", "-id"], name="game_ct_gallery_idx"),
+            models.Index(
+                fields=["-date_completed", "-id"],
+                condition=models.Q(is_public=True),
+                name="game_ct_public_gallery_idx",
+            ),
+            models.Index(
+                fields=["user_task"],
+                condition=models.Q(task_verified=True),
+                name="game_ct_verified_idx",
+            ),
+            models.Index(fields=["photo", "id"], name="game_ct_photo_idx"),
+            models.Index(
+                fields=["id"],
+                condition=models.Q(reviewed_at=None),
+                name="game_ct_review_queue_idx",
+            ),
+        )
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remembered so signal handlers can tell when verification flips,
+        # the photo is replaced or it shows up in the public gallery.
+        instance._loaded_task_verified = instance.__dict__.get("task_verified")
+        instance._loaded_photo = instance.__dict__.get("photo")
+        loaded = instance.__dict__.keys()
+        instance._loaded_in_gallery = (
+            instance.in_gallery if {"is_public", "processing"} <= loaded else None
+        )
+        return instance
+
+    @property
+    def in_gallery(self) -> bool:
+        return self.is_public and not self.processing
+
+    @property
+    def webp_srcset(self) -> str:
+        return rendition_srcset(self.photo.name, self.renditions, "webp")
+
+    @property
+    def jpeg_srcset(self) -> str:
+        return rendition_srcset(self.photo.name, self.renditions, "jpg")
+
+    @property
+    def thumbnail_url(self) -> str:
+        if not self.renditions:
+            return self.photo.url
+        return default_storage.url(rendition_name(self.photo.name, self.renditions[0], "jpg"))
 
     def photo_tag(self):
-        return mark_safe(f'<img src="{self.photo.url}" width="200" height="200" />')
+        return mark_safe(f'<img src="{self.thumbnail_url}" width="200" height="200" loading="lazy" />')
+
+
+def random_draw_key() -> float:
+    return random.random()
+
+
+def description_key(description: str) -> str | None:
+    """Hash of ``description`` ignoring case, Unicode form and whitespace, so
+    "Zrób  zdjęcie" and "zrób zdjęcie" count as the same task."""
+    normalized = " ".join(unicodedata.normalize("NFKC", description).casefold().split())
+    if not normalized:
+        return None
+    return hashlib.sha256(normalized.encode()).hexdigest()
+
+
+def duplicate_key(key: str, pk: int) -> str:
+    """Key of a task that already repeated an older task's description when
+    keys were introduced (migration 0019)."""
+    return hashlib.sha256(f"{key}:{pk}".encode()).hexdigest()
+
+
+# Tasks are told apart by their default-language description, or the first
+# translation that's filled in; the other translations aren't compared.
+KEY_LANGUAGES = (DEFAULT_LANGUAGE, *(code for code in AVAILABLE_LANGUAGES if code != DEFAULT_LANGUAGE))
+DESCRIPTION_FIELDS = tuple(f"description_{code}" for code in KEY_LANGUAGES)
 
 
 class Task(models.Model):
     description: str = models.TextField(
         verbose_name=_("Task description")
     )
+    draw_key = models.FloatField(default=random_draw_key, db_index=True, editable=False)
+    normalized_key = models.CharField(max_length=64, unique=True, null=True, editable=False)
     users = models.ManyToManyField(to=User, through="UserTask")
 
     def __str__(self) -> str:
         return self.description
 
+    def compute_key(self) -> str | None:
+        for field in DESCRIPTION_FIELDS:
+            if key := description_key(getattr(self, field) or ""):
+                if self.pk is not None and self.normalized_key == duplicate_key(key, self.pk):
+                    # An unedited duplicate from before keys were introduced.
+                    return self.normalized_key
+                return key
+        return None
+
+    def clean(self):
+        super().clean()
+        self.normalized_key = self.compute_key()
+        if self.normalized_key and Task.objects.filter(normalized_key=self.normalized_key).exclude(pk=self.pk).exists():
+            raise ValidationError({DESCRIPTION_FIELDS[0]: _("A task with this description already exists.")})
+
+    def save(self, *args, **kwargs):
+        self.normalized_key = self.compute_key()
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and {"description", *DESCRIPTION_FIELDS} & set(update_fields):
+            kwargs["update_fields"] = {*update_fields, "normalized_key"}
+        super().save(*args, **kwargs)
+
     class Meta:
         verbose_name = _("task")
-        verbose_name_plural = _("tasks")
\ No newline at end of file
+        verbose_name_plural = _("tasks")
+
+
+class LeaderboardEntry(models.Model):
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True)
+    verified_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        indexes = (
+            models.Index(fields=["-verified_count", "user"], name="game_leaderboard_rank_idx"),
+        )
+
+
+class PhotoBlob(models.Model):
+    """A stored photo file and how many completed tasks point at it."""
+    name = models.CharField(max_length=100, primary_key=True)
+    refcount = models.PositiveIntegerField(default=0)
+
+
+class Job(models.Model):
+    class Status(models.TextChoices):
+        QUEUED = "queued"
+        RUNNING = "running"
+        FAILED = "failed"
+
+    kind = models.CharField(max_length=64)
+    payload = models.JSONField(default=dict)
+    status = models.CharField(max_length=16, choices=Status, default=Status.QUEUED)
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=5)
+    run_after = models.DateTimeField(default=timezone.now)
+    locked_by = models.CharField(max_length=64, blank=True)
+    locked_until = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = (
+            models.Index(fields=["status", "run_after"], name="game_job_ready_idx"),
+        )
+
+    def __str__(self) -> str:
+        return f"{self.kind} #{self.pk} ({self.status})"
+
+
+class Event(models.Model):
+    """A change pushed to live pages; its id is the stream's resume cursor."""
+    kind = models.CharField(max_length=32)
+    data = models.JSONField(default=dict)
+    created = models.DateTimeField(default=timezone.now, db_index=True)
+
+    class Meta:
+        indexes = (
+            models.Index(fields=["kind", "-id"], name="game_event_kind_idx"),
+        )
+
+    def __str__(self) -> str:
+        return f"{self.kind} #{self.pk}"
@@ -0,0 +1,62 @@
+from collections import Counter
+
+from django.db import transaction
+from django.utils import timezone
+
+from game import cache, events, leaderboard
+from game.models import CompletedTask
+
+
+def _selected(queryset):
+    # Admin querysets carry joins and annotations that an UPDATE can't use.
+    return CompletedTask.objects.filter(pk__in=queryset.order_by().values("pk"))
+
+
+def _bump_after_commit(*scopes: str) -> None:
+    # Like game.signals: bumped any sooner, another process could cache the
+    # old rows under the new version.
+    transaction.on_commit(lambda: cache.bump(*scopes))
+
+
+@transaction.atomic
+def set_verified(queryset, verified: bool) -> int:
+    """Verify (or reject) every completed task in ``queryset`` with one
+    UPDATE, and move the leaderboard by the rows that actually flipped."""
+    selected = _selected(queryset)
+    flipping = Counter(
+        selected.filter(task_verified=not verified)
+        .select_for_update(of=("self",))
+        .values_list("user_task__user_id", flat=True)
+    )
+    updated = selected.update(task_verified=verified, reviewed_at=timezone.now())
+    for user_id, count in flipping.items():
+        leaderboard.adjust(user_id, count if verified else -count)
+    if flipping:
+        # The public gallery shows the verification status too.
+        _bump_after_commit("gallery", *(f"user:{user_id}" for user_id in flipping))
+    return updated
+
+
+@transaction.atomic
+def hide(queryset) -> int:
+    """Take every completed task in ``queryset`` out of the public gallery,
+    which also counts as reviewing it."""
+    selected = _selected(queryset)
+    hidden = dict(
+        selected.filter(is_public=True).values_list("pk", "user_task__user_id")
+    )
+    updated = selected.update(is_public=False, reviewed_at=timezone.now())
+    _bump_after_commit(
+        "gallery", *(f"user:{user_id}" for user_id in set(hidden.values()))
+    )
+    events.photos_hidden(list(hidden))
+    return updated
+
+
+def review_queue(after: int, limit: int):
+    """Unreviewed, processed completions in upload order, after id ``after``."""
+    return (
+        CompletedTask.objects.filter(reviewed_at=None, processing=False, pk__gt=after)
+        .select_related("user_task__user")
+        .order_by("pk")[:limit]
+    )
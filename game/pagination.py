@@ -0,0 +1,216 @@
+import base64
+import binascii
+import json
+from urllib.parse import urlencode
+
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from django.utils.functional import cached_property
+
+
+def encode_cursor(key: tuple, number: int) -> str:
+    date, pk = key
+    raw = json.dumps([date.isoformat(), pk, number]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(token: str) -> tuple[tuple, int] | None:
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        date, pk, number = json.loads(raw)
+        date = parse_datetime(date)
+    except (binascii.Error, ValueError, TypeError):
+        return None
+    if date is None or not isinstance(pk, int) or not isinstance(number, int):
+        return None
+    return (date, pk), max(number, 1)
+
+
+class KeysetPage:
+    """A page of ``queryset`` in descending (date, id) order.
+
+    Pages are addressed by the key of the row just outside them (``after`` /
+    ``before`` tokens) instead of an OFFSET, and neighbouring page links come
+    from a bounded look-ahead, so no query ever counts or skips the whole
+    result set. Everything is evaluated lazily.
+    """
+
+    def __init__(self, queryset, date_field, pk_field, per_page, params, window=2):
+        self.queryset = queryset
+        self.date_field = date_field
+        self.pk_field = pk_field
+        self.per_page = per_page
+        self.window = window
+        self.cursor = None
+        self.direction = None
+        self.number = 1
+        for direction in ("after", "before"):
+            decoded = decode_cursor(params.get(direction, ""))
+            if decoded:
+                self.direction = direction
+                self.cursor, self.number = decoded
+                break
+
+    def _older_than(self, key):
+        date, pk = key
+        # The redundant ``date <= key`` bound lets the database seek into the
+        # (date, id) index instead of filtering it from the start.
+        return self.queryset.filter(
+            Q(**{f"{self.date_field}__lte": date}),
+            Q(**{f"{self.date_field}__lt": date}) | Q(**{f"{self.pk_field}__lt": pk}),
+        ).order_by(f"-{self.date_field}", f"-{self.pk_field}")
+
+    def _newer_than(self, key):
+        date, pk = key
+        return self.queryset.filter(
+            Q(**{f"{self.date_field}__gte": date}),
+            Q(**{f"{self.date_field}__gt": date}) | Q(**{f"{self.pk_field}__gt": pk}),
+        ).order_by(self.date_field, self.pk_field)
+
+    def _key(self, obj) -> tuple:
+        values = []
+        for field in (self.date_field, self.pk_field):
+            value = obj
+            for attr in field.split("__"):
+                value = getattr(value, attr)
+            values.append(value)
+        return tuple(values)
+
+    def _rows(self):
+        # The page's rows, and whether they come out newest first.
+        if self.direction == "after":
+            return self._older_than(self.cursor)[: self.per_page], True
+        if self.direction == "before":
+            return self._newer_than(self.cursor)[: self.per_page], False
+        ordered = self.queryset.order_by(f"-{self.date_field}", f"-{self.pk_field}")
+        return ordered[: self.per_page], True
+
+    # One extra key tells whether rows continue past the link window.
+    def _older_keys_after(self, obj):
+        older = self._older_than(self._key(obj))
+        older = older.values_list(self.date_field, self.pk_field)
+        return older[: self.per_page * self.window + 1]
+
+    def _newer_keys_before(self, obj):
+        newer = self._newer_than(self._key(obj))
+        newer = newer.values_list(self.date_field, self.pk_field)
+        return newer[: self.per_page * self.window + 1]
+
+    @cached_property
+    def object_list(self) -> list:
+        rows, newest_first = self._rows()
+        rows = list(rows)
+        return rows if newest_first else rows[::-1]
+
+    @cached_property
+    def _older_keys(self) -> list[tuple]:
+        if not self.object_list:
+            return []
+        return list(self._older_keys_after(self.object_list[-1]))
+
+    @cached_property
+    def _newer_keys(self) -> list[tuple]:
+        if not self.object_list:
+            return []
+        return list(self._newer_keys_before(self.object_list[0]))
+
+    async def aload(self) -> None:
+        """Run every query of the page through the async ORM up front."""
+        rows, newest_first = self._rows()
+        rows = [obj async for obj in rows]
+        self.object_list = rows if newest_first else rows[::-1]
+        self._older_keys, self._newer_keys = [], []
+        if rows:
+            self._older_keys = [
+                key async for key in self._older_keys_after(self.object_list[-1])
+            ]
+            self._newer_keys = [
+                key async for key in self._newer_keys_before(self.object_list[0])
+            ]
+
+    def _next_query(self, offset: int) -> str:
+        # Page ``number + offset + 1`` starts after the last row before it.
+        keys = [self._key(self.object_list[-1])] + self._older_keys
+        key = keys[offset * self.per_page]
+        return urlencode({"after": encode_cursor(key, self.number + offset + 1)})
+
+    def _previous_query(self, offset: int) -> str:
+        number = self.number - offset - 1
+        if number <= 1 or len(self._newer_keys) <= (offset + 1) * self.per_page:
+            # That page is the newest one; link to the plain first page.
+            return ""
+        keys = [self._key(self.object_list[0])] + self._newer_keys
+        key = keys[offset * self.per_page]
+        return urlencode({"before": encode_cursor(key, number)})
+
+    def _pages(self, keys: list) -> int:
+        return -(-min(len(keys), self.per_page * self.window) // self.per_page)
+
+    def has_next(self) -> bool:
+        return bool(self._older_keys)
+
+    def has_previous(self) -> bool:
+        return bool(self._newer_keys)
+
+    @property
+    def next_query(self) -> str:
+        return self._next_query(0)
+
+    @property
+    def previous_query(self) -> str:
+        return self._previous_query(0)
+
+    @property
+    def query(self) -> str:
+        if self.direction is None:
+            return ""
+        return urlencode({self.direction: encode_cursor(self.cursor, self.number)})
+
+    @property
+    def page_links(self) -> list[dict]:
+        previous_pages = min(self._pages(self._newer_keys), self.number - 1)
+        links = [
+            {"number": self.number - offset - 1, "query": self._previous_query(offset)}
+            for offset in reversed(range(previous_pages))
+        ]
+        links.append({"number": self.number, "query": self.query, "current": True})
+        links += [
+            {"number": self.number + offset + 1, "query": self._next_query(offset)}
+            for offset in range(self._pages(self._older_keys))
+        ]
+        return links
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __bool__(self):
+        return bool(self.object_list)
+
+
+class EstimatedCountPaginator(Paginator):
+    """Takes PostgreSQL's row estimate instead of a ``COUNT(*)`` for unfiltered
+    querysets on large tables, where an exact count scans the whole table."""
+
+    # Below this, counting is cheap and exact numbers are nicer.
+    exact_below = 10_000
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        connection = connections[queryset.db]
+        if connection.vendor == "postgresql" and not queryset.query.where:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    "SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass",
+                    [queryset.model._meta.db_table],
+                )
+                row = cursor.fetchone()
+            # reltuples is -1 until the table is first analyzed.
+            if row and row[0] >= self.exact_below:
+                return row[0]
+        return super().count
@@ -0,0 +1,161 @@
+import logging
+from array import array
+from bisect import bisect_right
+
+from django.db import transaction
+from django.db.models import Max, Min, Q
+from PIL import Image
+
+from game import cache
+from game.models import CompletedTask
+from game.storage import photo_storage
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+logger = logging.getLogger(__name__)
+
+# Bumped when hashes change or go away, which reloads every index; photos
+# hashed for the first time only bump ADDED_SCOPE, which reads just the new rows.
+SCOPE = "photo_hashes"
+ADDED_SCOPE = "photo_hashes:added"
+MASK = 2**64 - 1
+
+
+def dhash(image: Image.Image) -> int:
+    """64-bit difference hash: whether each pixel of a 9x8 grayscale thumbnail
+    is brighter than its right neighbour. Survives rescaling, recompression
+    and small crops, so near-identical photos differ in only a few bits."""
+    pixels = image.convert("L").resize((9, 8), Image.Resampling.BOX).tobytes()
+    value = 0
+    for row in range(8):
+        for col in range(8):
+            left = pixels[row * 9 + col]
+            value = value << 1 | (left > pixels[row * 9 + col + 1])
+    # Stored in a signed BigIntegerField.
+    return value - 2**64 if value >= 2**63 else value
+
+
+def photo_hash(name: str) -> int | None:
+    try:
+        with photo_storage().open(name) as source, Image.open(source) as image:
+            # A 9x8 thumbnail doesn't need more than the JPEG's 1/8 scale.
+            image.draft("L", (64, 64))
+            return dhash(image)
+    except (OSError, ValueError):
+        logger.exception("Could not hash %s", name)
+        return None
+
+
+def hash_photo(name: str) -> tuple[str, int | None]:
+    return name, photo_hash(name)
+
+
+class PhotoHashIndex:
+    """Hashes of every hashed photo in two parallel int64 arrays (16 bytes a
+    photo), searched by Hamming distance in one vectorized pass when NumPy is
+    installed and a plain loop otherwise."""
+
+    def __init__(self):
+        # Swapped as one tuple, so a search never sees half a reload.
+        self.arrays = (array("q"), array("q"))
+        self.version = None
+        self.added_version = None
+        # Every completed task up to this id had been processed when the index
+        # was last read, so its hash can only change through ``changed()``.
+        self.settled = 0
+
+    def __len__(self):
+        return len(self.arrays[0])
+
+    def load(self, rows, settled: int = 0) -> None:
+        """Replace the index with ``(id, hash)`` rows in id order."""
+        self.arrays = (array("q"), array("q"))
+        self.settled = 0
+        self.extend(rows, settled)
+
+    def extend(self, rows, settled: int) -> None:
+        """Replace everything after ``self.settled`` with ``rows``, which
+        hold the hashed photos after it in id order."""
+        ids, hashes = self.arrays
+        keep = bisect_right(ids, self.settled)
+        ids, hashes = ids[:keep], hashes[:keep]
+        for pk, value in rows:
+            ids.append(pk)
+            hashes.append(value)
+        self.arrays = (ids, hashes)
+        self.settled = settled
+
+    def near(
+        self, value: int, max_distance: int, exclude: int | None = None
+    ) -> list[tuple[int, int]]:
+        """``(distance, id)`` of photos within ``max_distance`` bits of
+        ``value``, closest first."""
+        ids, hashes = self.arrays
+        if not ids:
+            return []
+        if numpy is not None:
+            # Unsigned, as bitwise_count counts the bits of the absolute value.
+            hashes = numpy.frombuffer(hashes, dtype=numpy.uint64)
+            distances = numpy.bitwise_count(hashes ^ numpy.uint64(value & MASK))
+            found = numpy.flatnonzero(distances <= max_distance)
+            ids = numpy.frombuffer(ids, dtype=numpy.int64)
+            matches = zip(distances[found].tolist(), ids[found].tolist())
+        else:
+            matches = (
+                (((other ^ value) & MASK).bit_count(), pk)
+                for pk, other in zip(ids, hashes)
+            )
+            matches = [match for match in matches if match[0] <= max_distance]
+        return sorted(match for match in matches if match[1] != exclude)
+
+
+_index = PhotoHashIndex()
+
+
+def _settled() -> int:
+    # Processing sets the first hash, and failed photos stay "processing"
+    # until a retry succeeds, so nothing before the oldest of them changes
+    # without a full reload. Uploads get new ids, so later ones come after;
+    # one committed only after a later upload was already processed waits
+    # for the next full reload.
+    bounds = CompletedTask.objects.aggregate(
+        processing=Min("id", filter=Q(processing=True)), last=Max("id")
+    )
+    if bounds["processing"] is not None:
+        return bounds["processing"] - 1
+    return bounds["last"] or 0
+
+
+def _hashed(after: int):
+    return (
+        CompletedTask.objects.filter(id__gt=after)
+        .exclude(photo_hash=None)
+        .order_by("id")
+        .values_list("id", "photo_hash")
+        .iterator(chunk_size=10_000)
+    )
+
+
+def index() -> PhotoHashIndex:
+    """This process's index: reloaded when hashes changed anywhere, and
+    extended past the last settled id when photos were hashed."""
+    version, added_version = cache.versions([SCOPE, ADDED_SCOPE]).split(".")
+    if version != _index.version:
+        _index.load(_hashed(0), _settled())
+    elif added_version != _index.added_version:
+        _index.extend(_hashed(_index.settled), _settled())
+    _index.version, _index.added_version = version, added_version
+    return _index
+
+
+def added() -> None:
+    """Photos got their first hash."""
+    transaction.on_commit(lambda: cache.bump(ADDED_SCOPE))
+
+
+def changed() -> None:
+    """Hashes were recomputed or deleted."""
+    transaction.on_commit(lambda: cache.bump(SCOPE))
@@ -0,0 +1,147 @@
+from collections.abc import Iterator
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+
+from django import db
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import Count, F
+
+from game import jobs, phash
+from game.images import (
+    RENDITION_FORMATS,
+    RENDITION_WIDTHS,
+    normalize_photo,
+    render_photo,
+    rendition_name,
+)
+from game.models import CompletedTask, PhotoBlob
+from game.storage import photo_storage
+
+
+def photo_failed(completed_task_id: int) -> None:
+    completed_task = CompletedTask.objects.filter(
+        pk=completed_task_id, processing=True
+    ).first()
+    if completed_task is not None:
+        # Stays out of the gallery and the review queue, as the raw upload
+        # still has its EXIF data; listed under "processing failed" in the
+        # admin, which can retry it.
+        completed_task.processing_failed = True
+        completed_task.save(update_fields=["processing_failed"])
+
+
+@jobs.handler("process_photo", on_failure=photo_failed)
+def process_photo(completed_task_id: int) -> None:
+    completed_task = CompletedTask.objects.filter(
+        pk=completed_task_id, processing=True
+    ).first()
+    if completed_task is None:
+        # Deleted, or already processed.
+        return
+    raw_name = completed_task.photo.name
+    with completed_task.photo.open("rb") as raw:
+        normalized = normalize_photo(
+            raw,
+            max_edge=settings.PHOTO_MAX_EDGE,
+            quality=settings.PHOTO_JPEG_QUALITY,
+        )
+    completed_task.photo.save(normalized.name, normalized, save=False)
+    name, renditions = render_photo(completed_task.photo.name)
+    photo_hash = phash.photo_hash(name)
+
+    with transaction.atomic():
+        # A worker that outlived its visibility timeout may be processing
+        # the same photo; only the first to get here stores its result.
+        # Photos are content-addressed, so both wrote the same files.
+        current = (
+            CompletedTask.objects.select_for_update()
+            .filter(pk=completed_task_id, processing=True, photo=raw_name)
+            .first()
+        )
+        if current is None:
+            return
+        current.photo = name
+        current.renditions = renditions
+        current.photo_hash = photo_hash
+        current.processing = False
+        current.processing_failed = False
+        # The raw upload is released by game.signals and deleted once no
+        # other completed task shares it.
+        current.save(
+            update_fields=[
+                "photo",
+                "renditions",
+                "photo_hash",
+                "processing",
+                "processing_failed",
+            ]
+        )
+    if photo_hash is not None:
+        phash.added()
+
+
+@transaction.atomic
+def retry_processing(queryset) -> int:
+    """Queue the photos in ``queryset`` whose processing failed again."""
+    ids = list(queryset.filter(processing_failed=True).values_list("pk", flat=True))
+    CompletedTask.objects.filter(pk__in=ids).update(processing_failed=False)
+    for completed_task_id in ids:
+        jobs.enqueue("process_photo", completed_task_id=completed_task_id)
+    return len(ids)
+
+
+@contextmanager
+def file_workers(processes: int | None) -> Iterator[ProcessPoolExecutor]:
+    """A process pool for the commands that hash or resize photo files."""
+    # Worker processes only touch files; don't let them inherit sockets.
+    db.connections.close_all()
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        yield pool
+
+
+def acquire(name: str) -> None:
+    updated = PhotoBlob.objects.filter(name=name).update(refcount=F("refcount") + 1)
+    if not updated:
+        _, created = PhotoBlob.objects.get_or_create(
+            name=name, defaults={"refcount": 1}
+        )
+        if not created:
+            PhotoBlob.objects.filter(name=name).update(refcount=F("refcount") + 1)
+
+
+def release(name: str, widths: list[int]) -> None:
+    PhotoBlob.objects.filter(name=name, refcount__gt=0).update(
+        refcount=F("refcount") - 1
+    )
+    deleted, _ = PhotoBlob.objects.filter(name=name, refcount=0).delete()
+    if deleted:
+        # Files can't be rolled back, so wait until the release is final.
+        transaction.on_commit(lambda: delete_files(name, widths))
+
+
+def delete_files(name: str, widths: list[int]) -> None:
+    if PhotoBlob.objects.filter(name=name).exists():
+        # An identical upload claimed the blob again in the meantime.
+        return
+    photo_storage().delete(name)
+    for width in {*widths, *RENDITION_WIDTHS}:
+        for ext in RENDITION_FORMATS:
+            default_storage.delete(rendition_name(name, width, ext))
+
+
+@transaction.atomic
+def rebuild_blobs() -> int:
+    counts = (
+        CompletedTask.objects.exclude(photo="")
+        .values_list("photo")
+        .annotate(count=Count("id"))
+        .order_by()
+    )
+    PhotoBlob.objects.all().delete()
+    blobs = PhotoBlob.objects.bulk_create(
+        (PhotoBlob(name=name, refcount=count) for name, count in counts),
+        batch_size=1000,
+    )
+    return len(blobs)
@@ -0,0 +1,51 @@
+import functools
+import logging
+import random
+import time
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, OperationalError, connections
+
+logger = logging.getLogger(__name__)
+
+# Seconds before the first retry; doubled for each one after it.
+BACKOFF = 0.05
+LOCKED = ("database is locked", "database table is locked")
+
+# Retries made by this process, for stress_sqlite's report.
+retries = 0
+
+
+def is_locked(error: OperationalError) -> bool:
+    return str(error).startswith(LOCKED)
+
+
+def retry_on_lock(func):
+    """Run ``func`` again, with jittered exponential backoff, when SQLite
+    gives up waiting for the write lock.
+
+    ``func`` should be a whole transaction: nothing is retried inside an
+    outer atomic block, whose transaction the error has already spoiled.
+    """
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        global retries
+        for attempt in range(settings.DB_LOCK_RETRIES + 1):
+            try:
+                return func(*args, **kwargs)
+            except OperationalError as error:
+                if (
+                    not is_locked(error)
+                    or attempt == settings.DB_LOCK_RETRIES
+                    or connections[DEFAULT_DB_ALIAS].in_atomic_block
+                ):
+                    raise
+                delay = BACKOFF * 2**attempt * random.uniform(0.5, 1.5)
+                logger.warning(
+                    "%s: %s, retrying in %.2f s", func.__qualname__, error, delay
+                )
+                retries += 1
+                time.sleep(delay)
+
+    return wrapper
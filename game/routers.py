@@ -0,0 +1,123 @@
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.utils.decorators import sync_and_async_middleware
+
+PIN_COOKIE = "replica_pin"
+PIN_SALT = "game.routers.pin"
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS", "TRACE")
+
+
+@dataclass
+class Routing:
+    # The user wrote recently, so replicas may not have their changes yet.
+    pinned: bool
+    # Set by views whose reads can go to a replica.
+    replica: bool = False
+    # Set once a read actually went to one.
+    replica_used: bool = False
+
+
+_routing: ContextVar[Routing | None] = ContextVar("routing", default=None)
+
+
+@contextmanager
+def request_routing(pinned: bool):
+    token = _routing.set(Routing(pinned=pinned))
+    try:
+        yield
+    finally:
+        _routing.reset(token)
+
+
+def read_from_replica() -> None:
+    """Let the rest of the current request read from a replica."""
+    routing = _routing.get()
+    if routing is not None:
+        routing.replica = True
+
+
+def used_replica() -> bool:
+    """Whether the current request has read from a replica so far."""
+    routing = _routing.get()
+    return routing is not None and routing.replica_used
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        routing = _routing.get()
+        if (
+            not settings.REPLICA_DATABASES
+            or routing is None
+            or not routing.replica
+            or routing.pinned
+            # Sessions and users stay on the primary, so a fresh login works.
+            or model._meta.app_label != "game"
+            # Reads inside a transaction must see its own writes.
+            or connections["default"].in_atomic_block
+        ):
+            return None
+        routing.replica_used = True
+        return random.choice(settings.REPLICA_DATABASES)
+
+    def db_for_write(self, model, **hints):
+        return "default"
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary.
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db not in settings.REPLICA_DATABASES
+
+
+def is_pinned(request) -> bool:
+    return (
+        request.get_signed_cookie(
+            PIN_COOKIE,
+            default=None,
+            salt=PIN_SALT,
+            max_age=settings.REPLICA_PIN_SECONDS,
+        )
+        is not None
+    )
+
+
+def _pin(request, response) -> None:
+    # A successful write pins the client to the primary for a short while,
+    # so its own changes don't disappear while replicas catch up.
+    if request.method not in SAFE_METHODS and response.status_code < 400:
+        response.set_signed_cookie(
+            PIN_COOKIE,
+            "1",
+            salt=PIN_SALT,
+            max_age=settings.REPLICA_PIN_SECONDS,
+            httponly=True,
+            samesite="Lax",
+        )
+
+
+@sync_and_async_middleware
+def replica_middleware(get_response):
+    if iscoroutinefunction(get_response):
+
+        async def middleware(request):
+            with request_routing(is_pinned(request)):
+                response = await get_response(request)
+            _pin(request, response)
+            return response
+
+    else:
+
+        def middleware(request):
+            with request_routing(is_pinned(request)):
+                response = get_response(request)
+            _pin(request, response)
+            return response
+
+    return middleware
@@ -0,0 +1,143 @@
+from django.contrib.auth.models import User
+from django.contrib.auth.signals import user_logged_out
+from django.core.signals import request_started
+from django.db import transaction
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from game import (
+    auth,
+    cache,
+    catalogue,
+    dbstats,
+    events,
+    leaderboard,
+    metrics,
+    phash,
+    photos,
+)
+from game.models import CompletedTask, Task, UserTask
+
+
+def _owner_id(completed_task: CompletedTask) -> int | None:
+    if CompletedTask.user_task.is_cached(completed_task):
+        return completed_task.user_task.user_id
+    return (
+        UserTask.objects.filter(pk=completed_task.user_task_id)
+        .values_list("user_id", flat=True)
+        .first()
+    )
+
+
+@receiver(post_save, sender=CompletedTask)
+def update_leaderboard_on_save(sender, instance, created, **kwargs):
+    was_verified = (
+        False if created else getattr(instance, "_loaded_task_verified", None)
+    )
+    if was_verified is None:
+        # Instance wasn't loaded from the database, so its previous state is
+        # unknown; leave it to ``rebuild_leaderboard``.
+        return
+    if instance.task_verified != was_verified:
+        leaderboard.adjust(_owner_id(instance), 1 if instance.task_verified else -1)
+    instance._loaded_task_verified = instance.task_verified
+
+
+@receiver(pre_delete, sender=CompletedTask)
+def remember_owner_on_delete(sender, instance, **kwargs):
+    # Cascades delete the UserTask right after, so look the owner up first.
+    instance._owner_id = _owner_id(instance)
+
+
+@receiver(post_delete, sender=CompletedTask)
+def update_leaderboard_on_delete(sender, instance, **kwargs):
+    if instance.task_verified and instance._owner_id is not None:
+        leaderboard.adjust(instance._owner_id, -1)
+
+
+@receiver(post_save, sender=CompletedTask)
+def count_photo_references(sender, instance, created, **kwargs):
+    previous = "" if created else getattr(instance, "_loaded_photo", None)
+    if previous is None:
+        # Unknown previous photo; ``dedupe_photos`` recounts references.
+        return
+    if instance.photo.name != previous:
+        if instance.photo.name:
+            photos.acquire(instance.photo.name)
+        if previous:
+            # The old photo's renditions aren't known any more.
+            photos.release(previous, [])
+    instance._loaded_photo = instance.photo.name
+
+
+@receiver(post_save, sender=CompletedTask)
+def announce_public_photo(sender, instance, created, **kwargs):
+    was_in_gallery = False if created else getattr(instance, "_loaded_in_gallery", None)
+    # Uploads enter the gallery once processed; a photo made public again
+    # is announced again.
+    if instance.in_gallery and was_in_gallery is False:
+        events.photo_published(instance.pk)
+    instance._loaded_in_gallery = instance.in_gallery
+
+
+@receiver(post_delete, sender=CompletedTask)
+def release_photo_on_delete(sender, instance, **kwargs):
+    if instance.photo.name:
+        photos.release(instance.photo.name, instance.renditions)
+    if instance.photo_hash is not None:
+        phash.changed()
+
+
+@receiver(post_save, sender=UserTask)
+@receiver(post_delete, sender=UserTask)
+def invalidate_user_fragments(sender, instance, **kwargs):
+    # After commit: bumped any sooner, another process could render the old
+    # rows and cache them under the new version.
+    scope = f"user:{instance.user_id}"
+    transaction.on_commit(lambda: cache.bump(scope))
+
+
+@receiver(post_save, sender=CompletedTask)
+@receiver(post_delete, sender=CompletedTask)
+def invalidate_photo_fragments(sender, instance, **kwargs):
+    owner_id = getattr(instance, "_owner_id", None) or _owner_id(instance)
+    transaction.on_commit(lambda: cache.bump(f"user:{owner_id}", "gallery"))
+
+
+@receiver(post_save, sender=Task)
+@receiver(post_delete, sender=Task)
+def invalidate_task_fragments(sender, instance, **kwargs):
+    transaction.on_commit(_tasks_changed)
+
+
+def _tasks_changed():
+    cache.bump("tasks")
+    # Other processes see the bumped version within catalogue.CHECK_SECONDS.
+    catalogue.invalidate()
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def forget_cached_user(sender, instance, **kwargs):
+    # After commit, like the fragment versions: a request in between could
+    # cache the old row again, still active or with the old password.
+    user_id = instance.pk
+    transaction.on_commit(lambda: auth.forget(user_id))
+
+
+@receiver(user_logged_out)
+def forget_logged_out_user(sender, request, user, **kwargs):
+    if user is not None:
+        user_id = user.pk
+        transaction.on_commit(lambda: auth.forget(user_id))
+
+
+@receiver(connection_created)
+def count_connection(sender, connection, **kwargs):
+    dbstats.count_opened(connection.alias)
+
+
+@receiver(request_started)
+def record_queries(sender, **kwargs):
+    metrics.install_query_recorder()
@@ -0,0 +1,51 @@
+import os
+
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import close_caches
+from django.db import connections
+from django.template import engines
+from django.template.exceptions import TemplateSyntaxError
+from django.urls import get_resolver
+from django.utils import translation
+from PIL import Image
+
+from game import catalogue
+
+
+def _project_templates():
+    for engine in engines.all():
+        for directory in getattr(engine, "dirs", []):
+            for root, _, files in os.walk(directory):
+                for name in files:
+                    if name.endswith(".html"):
+                        path = os.path.join(root, name)
+                        yield engine, os.path.relpath(path, directory)
+
+
+def warm() -> None:
+    """Do the one-off work of a worker's first requests at import time.
+
+    Under gunicorn's preload_app this runs once in the master, and the
+    forked workers share the result copy-on-write instead of each
+    building their own: the URL resolver, translation catalogues, compiled
+    templates, model field maps, Pillow's plugins and the task catalogue.
+    """
+    for model in apps.get_models():
+        model._meta.get_fields()
+    resolver = get_resolver()
+    for code, _ in settings.LANGUAGES:
+        with translation.override(code):
+            # Built, and cached per language, on first access.
+            _ = resolver.reverse_dict
+    for engine, name in _project_templates():
+        try:
+            engine.get_template(name)
+        except TemplateSyntaxError:
+            # It'll fail again, with the usual error page, when it's used.
+            pass
+    Image.init()
+    catalogue.warm()
+    # Forked workers must not share the master's sockets.
+    connections.close_all()
+    close_caches()
@@ -0,0 +1,59 @@
+// Live updates for the gallery and the leaderboard from the server-sent event
+// stream. The browser reconnects on its own and resumes after the last event
+// it got; pages work the same without it, just without updates.
+(function () {
+  const root = document.getElementById("live");
+  if (!root || !window.EventSource) {
+    return;
+  }
+  const language = root.dataset.language;
+  const gallery = document.getElementById("live-gallery");
+  const template = document.getElementById("live-photo");
+  const leaders = document.getElementById("live-leaderboard");
+  const source = new EventSource(root.dataset.eventsUrl);
+
+  function photoItem(photo) {
+    const item = template.content.firstElementChild.cloneNode(true);
+    item.dataset.photoId = photo.id;
+    item.querySelector("a").href = photo.photo;
+    item.querySelector("img").src = photo.thumbnail;
+    item.querySelector(".live-verified").hidden = !photo.verified;
+    item.querySelector(".live-pending").hidden = photo.verified;
+    item.querySelector(".live-task").textContent = photo.task[language] || "";
+    item.querySelector(".live-author").textContent = photo.author;
+    item.querySelector(".live-date").textContent = new Date(photo.date).toLocaleString();
+    return item;
+  }
+
+  function shown(id) {
+    return gallery.querySelector(`[data-photo-id="${id}"]`);
+  }
+
+  if (gallery && template) {
+    source.addEventListener("photo", (event) => {
+      const photo = JSON.parse(event.data);
+      if (!shown(photo.id)) {
+        gallery.prepend(photoItem(photo));
+      }
+    });
+    source.addEventListener("hidden", (event) => {
+      for (const id of JSON.parse(event.data).ids) {
+        shown(id)?.remove();
+      }
+    });
+  }
+
+  if (leaders) {
+    source.addEventListener("leaderboard", (event) => {
+      const list = document.createElement("ol");
+      for (const leader of JSON.parse(event.data).leaders) {
+        const item = document.createElement("li");
+        item.textContent = `${leader.username} (${leader.count})`;
+        list.append(item);
+      }
+      if (list.children.length) {
+        leaders.replaceChildren(list);
+      }
+    });
+  }
+})();
@@ -0,0 +1,97 @@
+// Keyboard review queue for completed task photos. Decisions are posted one
+// by one; the next batch is fetched and its photos preloaded before the
+// current one runs out.
+(function () {
+  const root = document.getElementById("review");
+  const batchUrl = root.dataset.batchUrl;
+  const decideUrl = root.dataset.decideUrl;
+  const batchSize = Number(root.dataset.batchSize);
+  const csrfToken = document.querySelector("[name=csrfmiddlewaretoken]").value;
+  const photo = document.getElementById("review-photo");
+
+  let queue = [];
+  let position = 0;
+  let lastId = 0;
+  let loading = null;
+  let exhausted = false;
+
+  function loadBatch() {
+    if (loading || exhausted) {
+      return loading;
+    }
+    loading = fetch(`${batchUrl}?after=${lastId}`, {credentials: "same-origin"})
+      .then((response) => response.json())
+      .then(({items}) => {
+        exhausted = items.length < batchSize;
+        for (const item of items) {
+          new Image().src = item.photo;
+          queue.push(item);
+          lastId = item.id;
+        }
+        loading = null;
+      });
+    return loading;
+  }
+
+  function show() {
+    const item = queue[position];
+    document.getElementById("review-empty").hidden = Boolean(item);
+    root.hidden = !item;
+    if (!item) {
+      return;
+    }
+    photo.src = item.photo;
+    document.getElementById("review-link").href = item.url;
+    document.getElementById("review-user").textContent = item.user;
+    document.getElementById("review-task").textContent = item.task;
+    document.getElementById("review-near").textContent =
+      item.near_duplicates.map((id) => `#${id}`).join(", ") || "–";
+    if (queue.length - position <= batchSize / 2) {
+      loadBatch();
+    }
+  }
+
+  function move(step) {
+    position = Math.max(0, position + step);
+    if (position >= queue.length && !exhausted) {
+      loadBatch().then(show);
+    } else {
+      show();
+    }
+  }
+
+  function decide(action) {
+    const item = queue[position];
+    if (!item) {
+      return;
+    }
+    fetch(decideUrl, {
+      method: "POST",
+      credentials: "same-origin",
+      headers: {"Content-Type": "application/json", "X-CSRFToken": csrfToken},
+      body: JSON.stringify({action, ids: [item.id]}),
+    });
+    queue.splice(position, 1);
+    move(0);
+  }
+
+  const keys = {
+    v: () => decide("verify"),
+    r: () => decide("reject"),
+    h: () => decide("hide"),
+    j: () => move(1),
+    ArrowRight: () => move(1),
+    k: () => move(-1),
+    ArrowLeft: () => move(-1),
+  };
+
+  document.addEventListener("keydown", (event) => {
+    if (event.ctrlKey || event.metaKey || event.altKey || !keys[event.key]) {
+      return;
+    }
+    event.preventDefault();
+    keys[event.key]();
+  });
+
+  loadBatch().then(show);
+})();
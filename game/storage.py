@@ -0,0 +1,99 @@
+import gzip
+import hashlib
+import os
+from io import BytesIO
+
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage, storages
+from PIL import Image
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+WEBP_SOURCES = (".png", ".jpg", ".jpeg")
+COMPRESSED_TYPES = (".css", ".js", ".svg", ".txt", ".json", ".map", ".xml", ".html")
+WEBP_QUALITY = 90
+
+
+def webp_name(name: str) -> str:
+    return os.path.splitext(name)[0] + ".webp"
+
+
+class StaticStorage(ManifestStaticFilesStorage):
+    """Hashed static files with WebP variants of images and precompressed
+    ``.gz`` (and ``.br``, if brotli is installed) siblings of text files, for
+    nginx's ``gzip_static``."""
+
+    def post_process(self, paths, dry_run=False, **options):
+        if not dry_run:
+            paths = {**paths, **self.write_webp_variants(paths)}
+        yield from super().post_process(paths, dry_run, **options)
+        if not dry_run:
+            for name in set(self.hashed_files.values()):
+                if name.endswith(COMPRESSED_TYPES):
+                    self.write_compressed(name)
+
+    def write_webp_variants(self, paths) -> dict:
+        variants = {}
+        for path, (storage, source_path) in paths.items():
+            if not path.lower().endswith(WEBP_SOURCES):
+                continue
+            with storage.open(source_path) as source, Image.open(source) as image:
+                buffer = BytesIO()
+                image.save(buffer, "WEBP", quality=WEBP_QUALITY, method=6)
+            name = webp_name(path)
+            if self.exists(name):
+                self.delete(name)
+            self._save(name, ContentFile(buffer.getvalue()))
+            variants[name] = (self, name)
+        return variants
+
+    def write_compressed(self, name: str) -> None:
+        with self.open(name) as f:
+            content = f.read()
+        encoders = [(".gz", lambda data: gzip.compress(data, 9, mtime=0))]
+        if brotli is not None:
+            encoders.append((".br", brotli.compress))
+        for suffix, encode in encoders:
+            compressed = encode(content)
+            if len(compressed) >= len(content):
+                continue
+            if self.exists(name + suffix):
+                self.delete(name + suffix)
+            self._save(name + suffix, ContentFile(compressed))
+
+
+def content_hash(content) -> str:
+    digest = hashlib.sha256()
+    content.seek(0)
+    for chunk in content.chunks():
+        digest.update(chunk)
+    content.seek(0)
+    return digest.hexdigest()
+
+
+def content_name(name: str, hexdigest: str) -> str:
+    """``tasks_photos/x.JPG`` -> ``tasks_photos/ab/cd/abcd….jpg``; two levels
+    of shards keep directories small on large media volumes."""
+    directory = os.path.dirname(name)
+    extension = os.path.splitext(name)[1].lower()
+    return os.path.join(directory, hexdigest[:2], hexdigest[2:4], hexdigest + extension)
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """Stores each file under the SHA-256 of its content, keeping the
+    directory and extension. The same content always gets the same name, so
+    it can be cached forever and identical uploads share one file."""
+
+    def _save(self, name, content):
+        name = content_name(name, content_hash(content))
+        if self.exists(name):
+            return name
+        return super()._save(name, content)
+
+
+def photo_storage():
+    return storages["photos"]
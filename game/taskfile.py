@@ -0,0 +1,72 @@
+import csv
+import json
+import sys
+from contextlib import contextmanager
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+FORMATS = ("csv", "jsonl")
+
+
+def batched(iterable, size):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def detect_format(path: str, requested: str | None) -> str:
+    if requested:
+        return requested
+    return "jsonl" if path.endswith((".jsonl", ".ndjson")) else "csv"
+
+
+@contextmanager
+def open_text(path: str, mode: str, std=None):
+    """``path`` opened for streaming text I/O; "-" is ``std``, or else stdin
+    or stdout."""
+    if path == "-":
+        yield std or (sys.stdin if mode == "r" else sys.stdout)
+        return
+    with open(path, mode, newline="", encoding="utf-8") as f:
+        yield f
+
+
+def read_rows(stream, fmt: str, fields=()):
+    """Yield one dict per CSV row or JSON line, reading as it goes. JSON
+    lines must be objects whose ``fields`` are strings or null; rows that
+    aren't raise TypeError, and lines that aren't JSON ValueError."""
+    if fmt == "csv":
+        yield from csv.DictReader(stream)
+        return
+    for number, line in enumerate(stream, 1):
+        if line.strip():
+            try:
+                row = json.loads(line)
+            except ValueError as error:
+                raise ValueError(f"line {number}: {error}") from error
+            if not isinstance(row, dict):
+                raise TypeError(f"line {number}: expected an object")
+            for field in fields:
+                if not isinstance(row.get(field), (str, type(None))):
+                    raise TypeError(f"line {number}: {field} must be a string")
+            yield row
+
+
+class RowWriter:
+    def __init__(self, stream, fmt: str, fields: list[str]):
+        self.stream = stream
+        self.fmt = fmt
+        if fmt == "csv":
+            self.csv = csv.DictWriter(stream, fields)
+            self.csv.writeheader()
+
+    def write(self, row: dict) -> None:
+        if self.fmt == "csv":
+            self.csv.writerow(row)
+        else:
+            self.stream.write(json.dumps(row, cls=DjangoJSONEncoder) + "\n")
@@ -0,0 +1,44 @@
+from django import template
+
+from game import cache, routers
+
+register = template.Library()
+
+
+class FragmentNode(template.Node):
+    def __init__(self, nodelist):
+        self.nodelist = nodelist
+
+    def render(self, context):
+        fragment = context.get("fragment")
+        request = context.get("request")
+        if not fragment or request is None:
+            return self.nodelist.render(context)
+        if "key" in fragment:
+            # Already looked up by the view (see AsyncFragmentCacheMixin).
+            key, content = fragment["key"], fragment["content"]
+        else:
+            key = cache.request_fragment_key(
+                fragment["name"], fragment["scopes"], request
+            )
+            content = cache.get_fragment(key)
+        if content is None:
+            content = self.nodelist.render(context)
+            # Rows read from a replica may predate a version bumped moments
+            # ago; the page is served but not cached under that version.
+            scopes = cache.request_scopes(fragment["scopes"], request)
+            if not (routers.used_replica() and cache.recently_bumped(scopes)):
+                cache.set_fragment(key, content)
+        return content
+
+
+@register.tag
+def cachedfragment(parser, token):
+    """Cache the enclosed block per user, language and query string.
+
+    The view provides ``fragment`` with a name and the scopes whose versions
+    are part of the key; see ``game.cache``.
+    """
+    nodelist = parser.parse(("endcachedfragment",))
+    parser.delete_first_token()
+    return FragmentNode(nodelist)
@@ -0,0 +1,18 @@
+from django import template
+from django.contrib.staticfiles.storage import staticfiles_storage
+
+from game.storage import webp_name
+
+register = template.Library()
+
+
+@register.simple_tag
+def webp_static(path: str) -> str:
+    """URL of the WebP variant collectstatic made of ``path``, or "".
+
+    Without a collectstatic manifest (e.g. runserver) there is no variant.
+    """
+    name = webp_name(path)
+    if name not in getattr(staticfiles_storage, "hashed_files", {}):
+        return ""
+    return staticfiles_storage.url(name)
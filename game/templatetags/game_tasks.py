@@ -0,0 +1,12 @@
+from django import template
+
+from game import catalogue
+
+register = template.Library()
+
+
+@register.filter
+def task_description(task_id: int) -> str:
+    """Description of task ``task_id`` in the active language, from the
+    per-process catalogue rather than a join on every row."""
+    return catalogue.description(task_id)
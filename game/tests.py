@@ -1,2 +1,1646 @@
+import csv
+import json
+import os
+import re
+import tempfile
+import zipfile
+from concurrent.futures import Future
+from datetime import timedelta
+from io import BytesIO, StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.contrib.sessions.models import Session
+from django.core.cache import caches
+from django.core.exceptions import ValidationError
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import OperationalError, connection, transaction
+from django.db.migrations.executor import MigrationExecutor
+from django.db.migrations.loader import MigrationLoader
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLPattern, URLResolver, path, reverse
+from django.utils import timezone, translation
+from PIL import Image, ImageDraw
+
+from game import (
+    cache,
+    catalogue,
+    events,
+    jobs,
+    leaderboard,
+    metrics,
+    models,
+    moderation,
+    phash,
+    photos,
+    retry,
+    routers,
+    views,
+)
+from game.images import render_photo
+from game.models import CompletedTask, Event, Job, PhotoBlob, Task, UserTask
+from game.storage import ContentAddressedStorage
+from kc_django import settings as project_settings
+from kc_django import urls
+
+# Upper bound on queries for each route, with a logged-in player (or admin
+# for admin pages) whose session is cached. Routes inside an include() are
+# listed by URL name.
+QUERY_BUDGETS = {
+    "index": 1,
+    "signup": 0,
+    "login": 0,
+    "dashboard": 4,
+    "tasks": 2,
+    "tasks_detail": 2,
+    "my-photos": 4,
+    "all-photos": 4,
+    "admin:index": 2,
+    "admin:game_task_changelist": 4,
+    "admin:game_completedtask_changelist": 5,
+    "admin:game_completedtask_review": 1,
+    "admin:game_completedtask_review_batch": 2,
+    "admin:game_usertask_changelist": 4,
+    "stats": 1,
+    "my-photos-download": 2,
+    "all-photos-download": 2,
+    "metrics": 1,
+    "events": 3,
+}
+
+# Routes in urls.py that are covered through a named route inside them.
+INCLUDED_ROUTES = {
+    "admin/": "admin:index",
+    "accounts/": "login",
+}
+
+TEST_STORAGES = {
+    **settings.STORAGES,
+    "staticfiles": {"BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"},
+}
+
+STAFF_ROUTES = {"stats", "all-photos-download", "metrics"}
+
+ADMIN_ROUTES = {
+    name for name in QUERY_BUDGETS if name.startswith("admin:") or name in STAFF_ROUTES
+}
+
+
+def seed_player(username: str, pending: int, completed: int) -> User:
+    user = User.objects.create_user(username=username, password="secret")
+    for i in range(pending + completed):
+        task = Task.objects.create(description=f"{username} task {i}")
+        user_task = UserTask.objects.create(user=user, task=task)
+        if i >= pending:
+            CompletedTask.objects.create(
+                user_task=user_task,
+                photo=f"tasks_photos/{username}-{i}.jpg",
+                task_verified=i % 2 == 0,
+            )
+    return user
+
+
+class GameTestMixin:
+    def setUp(self):
+        # Cached fragments are keyed by user id, which the test database reuses.
+        caches["default"].clear()
+        # So is this process's copy of the task descriptions.
+        catalogue.invalidate()
+        # modeltranslation writes ``description`` to the active language.
+        translation.activate(settings.LANGUAGE_CODE)
+        self.addCleanup(translation.deactivate)
+        # There's no collectstatic manifest to look hashed names up in.
+        self.enterContext(override_settings(STORAGES=TEST_STORAGES))
+
+
+class GameTestCase(GameTestMixin, TestCase):
+    pass
+
+
+class QueryBudgetTestCase(GameTestCase):
+    def assertMaxQueries(self, budget: int, url: str):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+            if response.streaming:
+                # Seeded photos have no files; the archive logs each one.
+                with mock.patch("game.archive.logger"):
+                    b"".join(response.streaming_content)
+        self.assertLess(response.status_code, 400, url)
+        executed = "\n".join(query["sql"] for query in queries.captured_queries)
+        self.assertLessEqual(
+            len(queries), budget, f"{url} ran {len(queries)} queries:\n{executed}"
+        )
+        return len(queries)
+
+    def url_for(self, name: str, user: User) -> str:
+        if name == "tasks_detail":
+            pending = user.usertask_set.filter(completedtask=None).first()
+            return reverse(name, args=[pending.pk])
+        return reverse(name)
+
+    def count_queries(self, user: User) -> dict[str, int]:
+        admin = User.objects.create_superuser(
+            f"admin-{user.username}", password="secret"
+        )
+        # As at worker startup; task edits reload it once per process.
+        catalogue.warm()
+        counts = {}
+        for name, budget in QUERY_BUDGETS.items():
+            self.client.force_login(admin if name in ADMIN_ROUTES else user)
+            counts[name] = self.assertMaxQueries(budget, self.url_for(name, user))
+        return counts
+
+    def test_every_route_has_a_budget(self):
+        for pattern in urls.urlpatterns:
+            if isinstance(pattern, URLResolver):
+                route = str(pattern.pattern)
+                self.assertIn(route, INCLUDED_ROUTES, f"No query budget for {route}")
+                self.assertIn(INCLUDED_ROUTES[route], QUERY_BUDGETS)
+            elif isinstance(pattern, URLPattern) and pattern.name:
+                self.assertIn(
+                    pattern.name, QUERY_BUDGETS, f"No query budget for {pattern.name}"
+                )
+
+    def test_query_counts_do_not_grow_with_data(self):
+        small = self.count_queries(seed_player("small", pending=2, completed=2))
+        large = self.count_queries(seed_player("large", pending=4, completed=30))
+        self.assertEqual(small, large)
+
+
+class DrawTestCase(GameTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user("player", password="secret")
+        self.client.force_login(self.user)
+        self.client.defaults["HTTP_ACCEPT_LANGUAGE"] = "en"
+
+    def test_draws_each_task_once(self):
+        tasks = {Task.objects.create(description=f"task {i}").pk for i in range(3)}
+        for _ in range(3):
+            self.assertRedirects(
+                self.client.post(reverse("dashboard")), reverse("tasks")
+            )
+        drawn = set(self.user.usertask_set.values_list("task_id", flat=True))
+        self.assertEqual(drawn, tasks)
+        response = self.client.post(reverse("dashboard"))
+        self.assertContains(response, "There are no more tasks available.")
+
+    def test_limits_incomplete_tasks(self):
+        for i in range(6):
+            Task.objects.create(description=f"task {i}")
+        for _ in range(5):
+            self.client.post(reverse("dashboard"))
+        response = self.client.post(reverse("dashboard"))
+        self.assertContains(response, "User already has 5 incomplete tasks")
+        self.assertEqual(self.user.usertask_set.count(), 5)
+
+
+class LeaderboardTestCase(GameTestCase):
+    def test_follows_verification_and_deletes(self):
+        alice = seed_player("alice", pending=0, completed=3)
+        bob = seed_player("bob", pending=1, completed=1)
+        self.assertEqual(leaderboard.rank_for(alice), {"rank": 1, "count": 2})
+        self.assertIsNone(leaderboard.rank_for(bob))
+
+        completed = CompletedTask.objects.get(user_task__user=bob)
+        completed.task_verified = True
+        completed.save()
+        self.assertEqual(leaderboard.rank_for(bob), {"rank": 2, "count": 1})
+
+        UserTask.objects.filter(user=alice, completedtask__task_verified=True).delete()
+        self.assertIsNone(leaderboard.rank_for(alice))
+        self.assertEqual(list(leaderboard.top(3)), [{"username": "bob", "count": 1}])
+        self.assertEqual(leaderboard.differences(), {})
+
+
+class ModerationTestCase(GameTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(
+            User.objects.create_superuser("admin", password="secret")
+        )
+        # Puts the admin in the user cache before queries are counted.
+        self.client.get(reverse("admin:index"))
+
+    def run_action(self, action: str, queryset) -> int:
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(
+                reverse("admin:game_completedtask_changelist"),
+                {
+                    "action": action,
+                    "_selected_action": list(queryset.values_list("pk", flat=True)),
+                },
+            )
+        self.assertEqual(response.status_code, 302)
+        return len(queries)
+
+    def test_bulk_actions_update_in_one_statement(self):
+        few = seed_player("few", pending=0, completed=2)
+        many = seed_player("many", pending=0, completed=20)
+        small = self.run_action(
+            "verify_selected", CompletedTask.objects.filter(user_task__user=few)
+        )
+        large = self.run_action(
+            "verify_selected", CompletedTask.objects.filter(user_task__user=many)
+        )
+        self.assertEqual(small, large)
+        self.assertEqual(leaderboard.rank_for(many), {"rank": 1, "count": 20})
+        self.assertEqual(leaderboard.rank_for(few), {"rank": 2, "count": 2})
+
+        self.run_action("reject_selected", CompletedTask.objects.filter(pk__lte=3))
+        self.run_action("hide_selected", CompletedTask.objects.filter(pk__lte=3))
+        self.assertEqual(leaderboard.differences(), {})
+        self.assertFalse(
+            CompletedTask.objects.filter(pk__lte=3, is_public=True).exists()
+        )
+
+    def test_bulk_actions_show_in_the_public_gallery(self):
+        seed_player("player", pending=0, completed=4)
+        pending = '<p style="color:orange;">'
+        self.assertContains(self.client.get(reverse("all-photos")), pending, count=2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.run_action("verify_selected", CompletedTask.objects.all())
+        self.assertNotContains(self.client.get(reverse("all-photos")), pending)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.run_action("reject_selected", CompletedTask.objects.all())
+        self.assertContains(self.client.get(reverse("all-photos")), pending, count=4)
+
+    def test_changelist_edits_verification(self):
+        user = seed_player("player", pending=0, completed=1)
+        completed_task = CompletedTask.objects.get()
+        self.assertEqual(leaderboard.rank_for(user)["count"], 1)
+        response = self.client.post(
+            reverse("admin:game_completedtask_changelist"),
+            {
+                "form-TOTAL_FORMS": 1,
+                "form-INITIAL_FORMS": 1,
+                "form-0-id": completed_task.pk,
+                "_save": "Save",
+            },
+        )
+        self.assertEqual(response.status_code, 302)
+        completed_task.refresh_from_db()
+        self.assertFalse(completed_task.task_verified)
+        self.assertIsNotNone(completed_task.reviewed_at)
+        self.assertIsNone(leaderboard.rank_for(user))
+
+    def test_review_queue(self):
+        seed_player("player", pending=0, completed=3)
+        batch_url = reverse("admin:game_completedtask_review_batch")
+        items = self.client.get(batch_url).json()["items"]
+        self.assertEqual(len(items), 3)
+        response = self.client.post(
+            reverse("admin:game_completedtask_review_decide"),
+            {"action": "verify", "ids": [items[0]["id"]]},
+            content_type="application/json",
+        )
+        self.assertEqual(response.json(), {"updated": 1})
+        remaining = self.client.get(batch_url).json()["items"]
+        self.assertEqual(
+            [item["id"] for item in remaining], [items[1]["id"], items[2]["id"]]
+        )
+        after = self.client.get(batch_url, {"after": items[1]["id"]}).json()["items"]
+        self.assertEqual([item["id"] for item in after], [items[2]["id"]])
+
+
+class CatalogueTestCase(GameTestCase):
+    def test_descriptions_follow_task_edits(self):
+        task = Task.objects.create(description_pl="Zadanie", description_en="")
+        # English falls back to Polish, as modeltranslation does.
+        self.assertEqual(catalogue.description(task.pk, "en"), "Zadanie")
+
+        task.description_en = "Task"
+        with self.captureOnCommitCallbacks() as callbacks:
+            task.save()
+        # Not reloaded before the edit commits.
+        self.assertEqual(catalogue.description(task.pk, "en"), "Zadanie")
+        for callback in callbacks:
+            callback()
+        self.assertEqual(catalogue.description(task.pk, "en"), "Task")
+        with self.assertNumQueries(0):
+            self.assertEqual(catalogue.description(task.pk, "pl"), "Zadanie")
+            self.assertEqual(catalogue.description(task.pk), "Zadanie")
+
+        stats = catalogue.stats()
+        self.assertEqual(stats["tasks"], 1)
+        self.assertGreater(stats["bytes"], 0)
+        self.assertGreater(stats["hits"], 0)
+
+
+class ExplainViewsTestCase(GameTestCase):
+    def test_explains_every_view(self):
+        seed_player("player", pending=2, completed=3)
+        out = StringIO()
+        call_command("explain_views", analyze=True, stdout=out)
+        lines = out.getvalue().splitlines()
+        self.assertEqual(
+            [line[:24].rstrip() for line in lines],
+            [
+                "tasks",
+                "tasks_detail",
+                "my-photos",
+                "all-photos",
+                "dashboard leaderboard",
+                "dashboard rank",
+                "draw limit",
+                "draw pick",
+            ],
+        )
+        self.assertTrue(all(" ok" in line for line in lines))
+
+    def test_fails_on_scans_above_the_threshold(self):
+        seed_player("player", pending=2, completed=3)
+        # Flag index searches too; no scan is big enough to fail here.
+        with (
+            mock.patch(
+                "game.management.commands.explain_views.SQLITE_SCAN",
+                re.compile(r"SEARCH (game_\w+)"),
+            ),
+            self.assertRaisesMessage(CommandError, "Sequential scans above 0"),
+        ):
+            call_command("explain_views", threshold=0, stdout=StringIO())
+
+    def test_requires_a_player(self):
+        with self.assertRaisesMessage(CommandError, "No users"):
+            call_command("explain_views", stdout=StringIO())
+
+
+class TaskImportExportTestCase(GameTestCase):
+    def write(self, name: str, content: str) -> str:
+        directory = self.enterContext(tempfile.TemporaryDirectory())
+        path = os.path.join(directory, name)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(content)
+        return path
+
+    def test_import_upserts_on_normalized_description(self):
+        existing = Task.objects.create(description_pl="Zrób zdjęcie", description_en="")
+        path = self.write(
+            "tasks.csv",
+            "description_pl,description_en\n"
+            "  zrób   ZDJĘCIE ,Take a photo\n"
+            "Nowe zadanie,New task\n"
+            "nowe zadanie,New task!\n"
+            ",\n",
+        )
+        call_command("import_tasks", path, chunk_size=2, stdout=StringIO())
+        self.assertEqual(Task.objects.count(), 2)
+        existing.refresh_from_db()
+        self.assertEqual(existing.description_en, "Take a photo")
+        self.assertEqual(
+            Task.objects.get(description_pl="nowe zadanie").description_en, "New task!"
+        )
+
+        duplicate = Task(description_pl="NOWE zadanie")
+        with self.assertRaises(ValidationError):
+            duplicate.full_clean()
+
+    def test_export_streams_tasks_with_stats(self):
+        seed_player("player", pending=1, completed=2)
+        output = StringIO()
+        call_command(
+            "export_tasks", format="jsonl", stats=True, stdout=output, stderr=StringIO()
+        )
+        rows = [json.loads(line) for line in output.getvalue().splitlines()]
+        self.assertEqual([row["drawn"] for row in rows], [1, 1, 1])
+        self.assertEqual([row["completed"] for row in rows], [0, 1, 1])
+        self.assertEqual([row["verified"] for row in rows], [0, 0, 1])
+
+        path = self.write("tasks.jsonl", output.getvalue())
+        call_command("import_tasks", path, stdout=StringIO())
+        self.assertEqual(Task.objects.count(), 3)
+
+    def test_import_rejects_rows_that_are_not_objects(self):
+        for line, error in (
+            ('["Zadanie"]', "line 2: expected an object"),
+            ('{"description_pl": 1}', "line 2: description_pl must be a string"),
+        ):
+            path = self.write(
+                "tasks.jsonl", f'{{"description_pl": "Zadanie"}}\n{line}\n'
+            )
+            with self.assertRaisesMessage(CommandError, error):
+                call_command("import_tasks", path, stdout=StringIO())
+
+
+class GalleryPaginationTestCase(GameTestCase):
+    def test_walks_every_photo_once(self):
+        user = seed_player("walker", pending=0, completed=45)
+        self.client.force_login(user)
+        seen, query = [], ""
+        while True:
+            response = self.client.get(reverse("my-photos") + "?" + query)
+            page = response.context["page_obj"]
+            seen += [user_task.pk for user_task in page]
+            if not page.has_next():
+                break
+            query = page.next_query
+        self.assertEqual(len(seen), 45)
+        self.assertEqual(len(set(seen)), 45)
+        self.assertEqual(page.number, 3)
+
+
+class FragmentCacheTestCase(GameTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = seed_player("cached", pending=2, completed=3)
+        self.client.force_login(self.user)
+
+    def test_serves_cached_fragment_until_invalidated(self):
+        task = Task.objects.create(description="freshly drawn")
+        with CaptureQueriesContext(connection) as cold:
+            self.client.get(reverse("tasks"))
+        with CaptureQueriesContext(connection) as warm:
+            response = self.client.get(reverse("tasks"))
+        self.assertLess(len(warm), len(cold))
+        self.assertContains(response, "cached task 0")
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            UserTask.objects.create(user=self.user, task=task)
+            # Not invalidated before the write commits.
+            self.assertNotContains(self.client.get(reverse("tasks")), "freshly drawn")
+        for callback in callbacks:
+            callback()
+        self.assertContains(self.client.get(reverse("tasks")), "freshly drawn")
+
+    def test_task_edits_invalidate_galleries(self):
+        self.client.get(reverse("my-photos"))
+        task = Task.objects.get(description="cached task 4")
+        task.description = "renamed task"
+        with self.captureOnCommitCallbacks(execute=True):
+            task.save()
+        self.assertContains(self.client.get(reverse("my-photos")), "renamed task")
+
+
+class AsyncUrlconf:
+    # kc_django.urls with the async views that ASYNC_VIEWS switches to in front.
+    urlpatterns = [
+        path("dashboard/", views.AsyncDashboardView.as_view(), name="dashboard"),
+        path("my-photos/", views.AsyncMyPhotosView.as_view(), name="my-photos"),
+        path("all-photos/", views.AsyncAllPhotosView.as_view(), name="all-photos"),
+        path("tasks/", views.AsyncTaskListView.as_view(), name="tasks"),
+        path(
+            "my-photos/download/",
+            views.AsyncMyPhotosArchiveView.as_view(),
+            name="my-photos-download",
+        ),
+        path(
+            "all-photos/download/",
+            views.AsyncAllPhotosArchiveView.as_view(),
+            name="all-photos-download",
+        ),
+        path("events/", views.AsyncEventStreamView.as_view(), name="events"),
+    ] + urls.urlpatterns
+
+
+CSRF_TOKEN = re.compile(r'name="csrfmiddlewaretoken" value="[^"]+"')
+EVENTS_SINCE = re.compile(r"since=\d+")
+
+
+class AsyncViewsTestCase(GameTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = seed_player("async", pending=2, completed=25)
+        seed_player("other", pending=0, completed=3)
+        self.client.force_login(self.user)
+        gallery_page_2 = self.client.get(reverse("my-photos")).context["page_obj"]
+        urls = [
+            reverse("dashboard"),
+            reverse("tasks"),
+            reverse("my-photos"),
+            reverse("my-photos") + "?" + gallery_page_2.next_query,
+            reverse("all-photos"),
+        ]
+        self.expected = {}
+        for url in urls:
+            caches["default"].clear()
+            self.expected[url] = self.content(self.client.get(url))
+        with mock.patch("game.archive.logger"):
+            response = self.client.get(reverse("my-photos-download"))
+            self.archive = b"".join(response.streaming_content)
+
+    def content(self, response) -> str:
+        self.assertEqual(response.status_code, 200)
+        return EVENTS_SINCE.sub("", CSRF_TOKEN.sub("", response.content.decode()))
+
+    @override_settings(ROOT_URLCONF=AsyncUrlconf)
+    async def test_render_the_same_pages(self):
+        await self.async_client.aforce_login(self.user)
+        for url, expected in self.expected.items():
+            await caches["default"].aclear()
+            self.assertEqual(self.content(await self.async_client.get(url)), expected)
+            # Served from the fragment cache the second time.
+            self.assertEqual(self.content(await self.async_client.get(url)), expected)
+
+    @override_settings(ROOT_URLCONF=AsyncUrlconf)
+    @mock.patch("game.archive.logger")
+    async def test_stream_the_same_archive(self, logger):
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.get(reverse("my-photos-download"))
+        self.assertEqual(
+            b"".join([c async for c in response.streaming_content]), self.archive
+        )
+        response = await self.async_client.get(reverse("all-photos-download"))
+        self.assertEqual(response.status_code, 302)
+
+    @override_settings(ROOT_URLCONF=AsyncUrlconf)
+    async def test_require_login(self):
+        response = await self.async_client.get(reverse("dashboard"))
+        self.assertRedirects(
+            response,
+            reverse("login") + "?next=" + reverse("dashboard"),
+            fetch_redirect_response=False,
+        )
+
+
+class StatsTestCase(GameTestCase):
+    def test_staff_only(self):
+        self.client.force_login(User.objects.create_user("player"))
+        self.assertEqual(self.client.get(reverse("stats")).status_code, 302)
+
+        self.client.force_login(User.objects.create_superuser("admin"))
+        stats = self.client.get(reverse("stats")).json()
+        self.assertEqual(stats["databases"]["default"]["vendor"], connection.vendor)
+        self.assertIn("hits", stats["fragment_cache"])
+
+
+class MetricsTestCase(GameTestCase):
+    def setUp(self):
+        super().setUp()
+        self.enterContext(mock.patch.object(metrics, "registry", metrics.Registry()))
+        self.user = seed_player("player", pending=1, completed=3)
+        self.client.force_login(self.user)
+
+    def assertRecorded(self, route: str, requests: int) -> int:
+        samples = metrics.collect()
+        labels = (("route", route),)
+        self.assertEqual(
+            samples[("kc_http_request_duration_seconds_count", labels)], requests
+        )
+        self.assertEqual(
+            samples[
+                ("kc_http_request_duration_seconds_bucket", (*labels, ("le", "+Inf")))
+            ],
+            requests,
+        )
+        self.assertGreater(samples[("kc_db_query_seconds_total", labels)], 0)
+        self.assertGreater(samples[("kc_template_render_seconds_total", labels)], 0)
+        self.assertGreater(samples[("kc_http_response_bytes_total", labels)], 0)
+        return samples[("kc_db_queries_total", labels)]
+
+    def test_records_each_route(self):
+        executed = 0
+        for _ in range(2):
+            with CaptureQueriesContext(connection) as queries:
+                self.client.get(reverse("my-photos"))
+            executed += len(queries)
+        self.assertEqual(self.assertRecorded("my-photos", requests=2), executed)
+
+    @override_settings(ROOT_URLCONF=AsyncUrlconf)
+    async def test_records_async_views(self):
+        await self.async_client.aforce_login(self.user)
+        await self.async_client.get(reverse("my-photos"))
+        # Statements run in sync_to_async's thread are counted too.
+        self.assertGreater(self.assertRecorded("my-photos", requests=1), 0)
+
+    def test_sums_workers(self):
+        directory = self.enterContext(tempfile.TemporaryDirectory())
+        labels = [["route", "tasks"], ["method", "GET"], ["status", "200"]]
+        with open(os.path.join(directory, "1.json"), "w") as f:
+            json.dump([["kc_http_requests_total", labels, 3]], f)
+        with override_settings(METRICS_DIR=directory, METRICS_TOKEN="secret"):
+            self.client.get(reverse("tasks"))
+            self.assertTrue(
+                os.path.exists(os.path.join(directory, f"{os.getpid()}.json"))
+            )
+            self.client.logout()
+            with self.assertLogs("django.request", "WARNING"):
+                response = self.client.get(reverse("metrics"))
+            self.assertEqual(response.status_code, 403)
+            response = self.client.get(
+                reverse("metrics"), headers={"Authorization": "Bearer secret"}
+            )
+        self.assertContains(
+            response,
+            'kc_http_requests_total{route="tasks",method="GET",status="200"} 4\n',
+        )
+        self.assertContains(
+            response, "# TYPE kc_http_request_duration_seconds histogram"
+        )
+
+    @override_settings(METRICS_SLOW_REQUEST_SECONDS=0)
+    def test_logs_slow_requests_with_their_sql(self):
+        with self.assertLogs("game.metrics", "WARNING") as logs:
+            self.client.get(reverse("dashboard"))
+        self.assertIn("(dashboard)", logs.output[0])
+        self.assertIn("SELECT", logs.output[0])
+
+
+class SessionCacheTestCase(GameTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = seed_player("player", pending=1, completed=1)
+        self.client.force_login(self.user)
+        self.client.get(reverse("tasks"))
+
+    def assertLoggedOut(self):
+        response = self.client.get(reverse("tasks"))
+        self.assertRedirects(
+            response,
+            reverse("login") + "?next=" + reverse("tasks"),
+            fetch_redirect_response=False,
+        )
+
+    def test_session_and_user_come_from_the_cache(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.client.get(reverse("tasks")).status_code, 200)
+        executed = " ".join(query["sql"] for query in queries.captured_queries)
+        self.assertNotIn("django_session", executed)
+        self.assertNotIn("auth_user", executed)
+
+    def test_password_change_ends_other_sessions(self):
+        user = User.objects.get(pk=self.user.pk)
+        user.set_password("changed")
+        with self.captureOnCommitCallbacks(execute=True):
+            user.save()
+        self.assertLoggedOut()
+
+    def test_deactivation_ends_sessions(self):
+        # As the admin's user form does.
+        user = User.objects.get(pk=self.user.pk)
+        user.is_active = False
+        with self.captureOnCommitCallbacks() as callbacks:
+            user.save()
+        # Dropped from the cache only once the change is committed, so no
+        # request can cache the old row again.
+        self.assertEqual(self.client.get(reverse("tasks")).status_code, 200)
+        for callback in callbacks:
+            callback()
+        self.assertLoggedOut()
+
+    def test_logout_ends_the_session(self):
+        session = self.client.cookies[settings.SESSION_COOKIE_NAME].value
+        self.client.post(reverse("logout"))
+        self.client.cookies[settings.SESSION_COOKIE_NAME] = session
+        self.assertLoggedOut()
+
+    def test_prune_sessions(self):
+        for i in range(5):
+            Session.objects.create(
+                session_key=f"expired{i}",
+                session_data="",
+                expire_date=timezone.now() - timedelta(days=1),
+            )
+        call_command("prune_sessions", batch_size=2, stdout=StringIO())
+        self.assertEqual(Session.objects.count(), 1)
+        self.client.get(reverse("tasks"))
+        self.assertEqual(self.client.get(reverse("tasks")).status_code, 200)
+
+
+class PrestartTestCase(GameTestCase):
+    def prestart(self) -> str:
+        out = StringIO()
+        call_command("prestart", stdout=out)
+        return out.getvalue()
+
+    def test_skips_unchanged_steps(self):
+        static_root = self.enterContext(tempfile.TemporaryDirectory())
+        with override_settings(STATIC_ROOT=static_root):
+            output = self.prestart()
+            self.assertNotIn("skipping collectstatic", output)
+            self.assertIn("skipping migrate", output)
+            self.assertTrue(os.path.exists(os.path.join(static_root, "review.js")))
+
+            self.assertIn("skipping collectstatic", self.prestart())
+            os.utime(os.path.join(settings.BASE_DIR, "game/static/review.js"))
+            self.assertNotIn("skipping collectstatic", self.prestart())
+
+
+SSE_ID = re.compile(r"^id: (\d+)$", re.MULTILINE)
+
+
+@override_settings(EVENTS_SETTLE_SECONDS=0, EVENTS_STREAM_SECONDS=0)
+class EventStreamTestCase(GameTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user("player")
+        self.client.force_login(self.user)
+
+    def published(self, kind: str) -> list[dict]:
+        return list(
+            Event.objects.filter(kind=kind)
+            .order_by("pk")
+            .values_list("data", flat=True)
+        )
+
+    def received(self, content) -> list[int]:
+        return [int(pk) for pk in SSE_ID.findall(b"".join(content).decode())]
+
+    def test_publishes_photos_once_they_reach_the_gallery(self):
+        user_task = UserTask.objects.create(
+            user=self.user, task=Task.objects.create(description="task")
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            CompletedTask.objects.create(
+                user_task=user_task, photo="tasks_photos/a.jpg", processing=True
+            )
+        self.assertEqual(self.published(events.PHOTO), [])
+
+        completed_task = CompletedTask.objects.get()
+        completed_task.processing = False
+        with self.captureOnCommitCallbacks(execute=True):
+            completed_task.save(update_fields=["processing"])
+        [photo] = self.published(events.PHOTO)
+        self.assertEqual(photo["id"], completed_task.pk)
+        self.assertEqual(photo["author"], "player")
+        self.assertEqual(photo["task"], {"pl": "task", "en": "task"})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            moderation.hide(CompletedTask.objects.all())
+        self.assertEqual(self.published(events.HIDDEN), [{"ids": [completed_task.pk]}])
+
+    def test_publishes_leaderboard_changes(self):
+        seed_player("alice", pending=0, completed=1)
+        completed_task = CompletedTask.objects.get()
+        with self.captureOnCommitCallbacks(execute=True):
+            leaderboard.rebuild()
+        completed_task.task_verified = False
+        with self.captureOnCommitCallbacks(execute=True):
+            completed_task.save()
+        with self.captureOnCommitCallbacks(execute=True):
+            # The top of the board is unchanged.
+            leaderboard.rebuild()
+        self.assertEqual(
+            self.published(events.LEADERBOARD),
+            [{"leaders": [{"username": "alice", "count": 1}]}, {"leaders": []}],
+        )
+
+    def test_resumes_after_the_last_event(self):
+        old = Event.objects.create(
+            kind=events.PHOTO, created=timezone.now() - timedelta(minutes=1)
+        )
+        rendered = timezone.now().timestamp()
+        new = [Event.objects.create(kind=events.PHOTO) for _ in range(3)]
+
+        response = self.client.get(reverse("events"))
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+        self.assertEqual(self.received(response.streaming_content), [])
+        response = self.client.get(reverse("events"), {"since": int(rendered)})
+        self.assertEqual(self.received(response.streaming_content), [e.pk for e in new])
+        response = self.client.get(
+            reverse("events"), headers={"Last-Event-ID": str(new[0].pk)}
+        )
+        self.assertEqual(
+            self.received(response.streaming_content), [e.pk for e in new[1:]]
+        )
+        response = self.client.get(
+            reverse("events"), headers={"Last-Event-ID": str(old.pk - 1)}
+        )
+        self.assertEqual(
+            self.received(response.streaming_content), [old.pk, *(e.pk for e in new)]
+        )
+
+    def test_prunes_old_events(self):
+        Event.objects.create(
+            kind=events.PHOTO, created=timezone.now() - timedelta(days=2)
+        )
+        kept = Event.objects.create(kind=events.PHOTO)
+        self.assertEqual(events.prune(), 1)
+        self.assertQuerySetEqual(Event.objects.all(), [kept])
+
+    @override_settings(ROOT_URLCONF=AsyncUrlconf)
+    async def test_async_stream(self):
+        await self.async_client.aforce_login(self.user)
+        first = await Event.objects.acreate(kind=events.PHOTO, data={"id": 1})
+        second = await Event.objects.acreate(kind=events.PHOTO, data={"id": 2})
+        response = await self.async_client.get(
+            reverse("events"), headers={"Last-Event-ID": str(first.pk)}
+        )
+        content = [chunk async for chunk in response.streaming_content]
+        self.assertEqual(self.received(content), [second.pk])
+        self.assertIn(b'event: photo\ndata: {"id": 2}\n\n', b"".join(content))
+
+
+class InlineExecutor:
+    def __init__(self, max_workers):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+    def submit(self, fn, *args):
+        future = Future()
+        future.set_result(fn(*args))
+        return future
+
+
+class JobQueueTestCase(GameTestCase):
+    def setUp(self):
+        super().setUp()
+        self.calls = []
+        self.failures = []
+        handlers = {"test": lambda value: self.calls.append(value)}
+        self.enterContext(mock.patch.dict(jobs.handlers, handlers))
+        failure_handlers = {"test": lambda value: self.failures.append(value)}
+        self.enterContext(mock.patch.dict(jobs.failure_handlers, failure_handlers))
+
+    def claim(self, worker="worker") -> list[Job]:
+        return jobs.claim(worker, 10, timedelta(minutes=5))
+
+    def test_enqueue_needs_a_handler(self):
+        with self.assertRaises(ValueError):
+            jobs.enqueue("unknown")
+
+    def test_claimed_job_runs_once(self):
+        job = jobs.enqueue("test", value=1)
+        [claimed] = self.claim()
+        self.assertEqual(claimed.pk, job.pk)
+        self.assertEqual(claimed.attempts, 1)
+        self.assertEqual(self.claim("other"), [])
+        self.assertTrue(jobs.run(claimed))
+        self.assertEqual(self.calls, [1])
+        self.assertFalse(Job.objects.exists())
+
+    def test_retries_with_backoff_then_fails(self):
+        jobs.handlers["test"] = mock.Mock(side_effect=RuntimeError("boom"))
+        job = jobs.enqueue("test", value=1)
+        Job.objects.filter(pk=job.pk).update(max_attempts=2)
+        [claimed] = self.claim()
+        with self.assertLogs("game.jobs", "ERROR"):
+            self.assertFalse(jobs.run(claimed))
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.Status.QUEUED)
+        self.assertGreater(job.run_after, timezone.now() + timedelta(seconds=1))
+        self.assertEqual(self.claim(), [])
+
+        Job.objects.filter(pk=job.pk).update(run_after=timezone.now())
+        [claimed] = self.claim()
+        with self.assertLogs("game.jobs", "ERROR"):
+            jobs.run(claimed)
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.Status.FAILED)
+        self.assertIn("boom", job.last_error)
+        self.assertEqual(self.failures, [1])
+        self.assertEqual(self.claim(), [])
+
+    def test_visibility_timeout_hands_job_to_another_worker(self):
+        job = jobs.enqueue("test", value=1)
+        [stalled] = self.claim()
+        Job.objects.filter(pk=job.pk).update(locked_until=timezone.now())
+        [reclaimed] = self.claim("other")
+        self.assertEqual(reclaimed.attempts, 2)
+        # The stalled worker finishing doesn't take the job from the other.
+        jobs.run(stalled)
+        self.assertTrue(Job.objects.filter(pk=job.pk).exists())
+        jobs.run(reclaimed)
+        self.assertFalse(Job.objects.exists())
+
+        job = jobs.enqueue("test", value=2)
+        Job.objects.filter(pk=job.pk).update(max_attempts=1)
+        self.claim()
+        Job.objects.filter(pk=job.pk).update(locked_until=timezone.now())
+        self.assertEqual(self.claim("other"), [])
+        self.assertEqual(Job.objects.get(pk=job.pk).status, Job.Status.FAILED)
+        self.assertEqual(self.failures, [2])
+        self.claim("other")
+        self.assertEqual(self.failures, [2])
+
+    @mock.patch("game.management.commands.run_jobs.signal.signal")
+    def test_run_jobs_drains_the_queue(self, signal):
+        for value in range(3):
+            jobs.enqueue("test", value=value)
+        # Jobs run inline: worker threads couldn't see this test's transaction.
+        with mock.patch(
+            "game.management.commands.run_jobs.ThreadPoolExecutor", InlineExecutor
+        ):
+            call_command("run_jobs", once=True, concurrency=2, stdout=StringIO())
+        self.assertEqual(self.calls, [0, 1, 2])
+        self.assertFalse(Job.objects.exists())
+
+    @override_settings(JOBS_EAGER=True)
+    def test_eager_jobs_run_after_commit(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            jobs.enqueue("test", value=1)
+        self.assertEqual(self.calls, [])
+        for callback in callbacks:
+            callback()
+        self.assertEqual(self.calls, [1])
+        self.assertFalse(Job.objects.exists())
+
+
+@mock.patch("game.retry.time.sleep")
+class RetryOnLockTestCase(GameTestMixin, TransactionTestCase):
+    # Not a TestCase: nothing is retried inside an outer transaction.
+
+    def flaky(self, failures: int, message="database is locked"):
+        calls = []
+
+        @retry.retry_on_lock
+        def write():
+            calls.append(1)
+            if len(calls) <= failures:
+                raise OperationalError(message)
+            return "done"
+
+        return write, calls
+
+    def test_retries_until_the_lock_is_free(self, sleep):
+        write, calls = self.flaky(failures=2)
+        with self.assertLogs("game.retry", "WARNING"):
+            self.assertEqual(write(), "done")
+        self.assertEqual(len(calls), 3)
+        self.assertLess(
+            sleep.call_args_list[0].args[0], sleep.call_args_list[1].args[0]
+        )
+
+    @override_settings(DB_LOCK_RETRIES=2)
+    def test_gives_up(self, sleep):
+        write, calls = self.flaky(failures=5)
+        with (
+            self.assertLogs("game.retry", "WARNING"),
+            self.assertRaises(OperationalError),
+        ):
+            write()
+        self.assertEqual(len(calls), 3)
+
+    def test_only_retries_whole_transactions_on_lock(self, sleep):
+        write, calls = self.flaky(failures=1, message="no such table: game_task")
+        with self.assertRaises(OperationalError):
+            write()
+        write, calls = self.flaky(failures=1)
+        with transaction.atomic(), self.assertRaises(OperationalError):
+            write()
+        self.assertEqual(len(calls), 1)
+        sleep.assert_not_called()
+
+    def test_sqlite_profile(self, sleep):
+        def options():
+            config = {"ENGINE": "django.db.backends.sqlite3", "NAME": "db.sqlite3"}
+            return project_settings.database(config)["OPTIONS"]
+
+        self.assertNotIn("transaction_mode", options())
+        self.assertNotIn("journal_mode", options()["init_command"])
+        with mock.patch.object(project_settings, "DB_SQLITE_CONCURRENT_WRITES", True):
+            self.assertEqual(options()["transaction_mode"], "IMMEDIATE")
+            self.assertIn("journal_mode=WAL", options()["init_command"])
+            self.assertIn("mmap_size", options()["init_command"])
+
+
+class ReplicaRoutingTestCase(GameTestMixin, TransactionTestCase):
+    # Not a TestCase: its transaction would keep every read on the primary.
+
+    @override_settings(REPLICA_DATABASES=["replica"])
+    def test_routes_marked_reads_to_replicas(self):
+        router = routers.ReplicaRouter()
+        with routers.request_routing(pinned=False):
+            self.assertIsNone(router.db_for_read(Task))
+            routers.read_from_replica()
+            self.assertEqual(router.db_for_read(Task), "replica")
+            with transaction.atomic():
+                self.assertIsNone(router.db_for_read(Task))
+        with routers.request_routing(pinned=True):
+            routers.read_from_replica()
+            self.assertIsNone(router.db_for_read(Task))
+        self.assertIsNone(router.db_for_read(Task))
+
+    @override_settings(REPLICA_DATABASES=["replica"], REPLICA_PIN_SECONDS=60)
+    def test_caches_replica_reads_only_once_replicas_caught_up(self):
+        user = seed_player("player", pending=1, completed=2)
+        self.client.force_login(user)
+        original = routers.ReplicaRouter.db_for_read
+        routed = []
+
+        def db_for_read(router, model, **hints):
+            routed.append(original(router, model, **hints))
+            # There's no replica connection in the tests.
+
+        def misses(name: str) -> int:
+            cache.reset_stats()
+            self.client.get(reverse(name))
+            return cache.stats()["misses"]
+
+        with mock.patch.object(routers.ReplicaRouter, "db_for_read", db_for_read):
+            # Seeding just bumped the player's scopes.
+            self.assertEqual(misses("my-photos"), 1)
+            self.assertIn("replica", routed)
+            self.assertEqual(misses("my-photos"), 1)
+
+            # As if REPLICA_PIN_SECONDS had passed.
+            caches["default"].delete_many(
+                [f"game:bumped:{scope}" for scope in (f"user:{user.pk}", "tasks")]
+            )
+            self.assertEqual(misses("my-photos"), 1)
+            self.assertEqual(misses("my-photos"), 0)
+
+    def test_pins_writers_to_primary(self):
+        self.client.force_login(User.objects.create_user("writer"))
+        Task.objects.create(description="task")
+        response = self.client.get(reverse("dashboard"))
+        self.assertNotIn(routers.PIN_COOKIE, response.cookies)
+
+        response = self.client.post(reverse("dashboard"))
+        self.assertIn(routers.PIN_COOKIE, response.cookies)
+        request = RequestFactory().get(reverse("all-photos"))
+        request.COOKIES = {
+            routers.PIN_COOKIE: response.cookies[routers.PIN_COOKIE].value
+        }
+        self.assertTrue(routers.is_pinned(request))
+
+
+class DataMigrationTestCase(TransactionTestCase):
+    def migrate(self, target: str):
+        executor = MigrationExecutor(connection)
+        executor.migrate([("game", target)])
+        return executor.loader.project_state(("game", target)).apps
+
+    latest = None
+
+    def migrate_back(self, target: str):
+        self.latest = MigrationLoader(connection).graph.leaf_nodes("game")[0][1]
+        self.addCleanup(self.migrate, self.latest)
+        return self.migrate(target)
+
+    def test_drop_duplicate_user_tasks_keeps_the_first_completed_draw(self):
+        apps = self.migrate_back("0013_completedtask_gallery_index")
+        User = apps.get_model("auth", "User")
+        Task = apps.get_model("game", "Task")
+        UserTask = apps.get_model("game", "UserTask")
+        CompletedTask = apps.get_model("game", "CompletedTask")
+        LeaderboardEntry = apps.get_model("game", "LeaderboardEntry")
+
+        user = User.objects.create(username="player")
+        completed, drawn = Task.objects.create(), Task.objects.create()
+        # The first draw was never completed.
+        _, first_draw, later_draw = (
+            UserTask.objects.create(user=user, task=completed) for _ in range(3)
+        )
+        now = timezone.now()
+        for user_task, verified, date in (
+            (later_draw, True, now),
+            (first_draw, False, now - timedelta(days=1)),
+        ):
+            CompletedTask.objects.create(
+                user_task=user_task, task_verified=verified, photo="x.jpg"
+            )
+            CompletedTask.objects.filter(user_task=user_task).update(
+                date_completed=date
+            )
+        LeaderboardEntry.objects.create(user=user, verified_count=1)
+        kept_draw = UserTask.objects.create(user=user, task=drawn)
+        UserTask.objects.create(user=user, task=drawn)
+
+        apps = self.migrate("0014_query_indexes")
+        UserTask = apps.get_model("game", "UserTask")
+        CompletedTask = apps.get_model("game", "CompletedTask")
+        LeaderboardEntry = apps.get_model("game", "LeaderboardEntry")
+        self.assertEqual(
+            set(UserTask.objects.values_list("pk", flat=True)),
+            {first_draw.pk, kept_draw.pk},
+        )
+        completed_task = CompletedTask.objects.get()
+        self.assertEqual(completed_task.user_task_id, first_draw.pk)
+        self.assertTrue(completed_task.task_verified)
+        self.assertEqual(LeaderboardEntry.objects.get().verified_count, 1)
+
+    def test_duplicate_descriptions_get_keys_of_their_own(self):
+        apps = self.migrate_back("0018_completedtask_reviewed_at")
+        Task = apps.get_model("game", "Task")
+        first = Task.objects.create(description_pl="Zrób zdjęcie")
+        duplicate = Task.objects.create(description_pl="zrób  ZDJĘCIE")
+        empty = Task.objects.create(description_pl="", description_en="")
+
+        self.migrate(self.latest)
+        keys = dict(models.Task.objects.values_list("pk", "normalized_key"))
+        self.assertIsNone(keys[empty.pk])
+        self.assertEqual(keys[first.pk], models.description_key("zrób zdjęcie"))
+        self.assertNotIn(keys[duplicate.pk], {None, keys[first.pk]})
+
+        # Saving the duplicate keeps its key until its description changes.
+        duplicate = models.Task.objects.get(pk=duplicate.pk)
+        duplicate.description_en = "Take a photo"
+        duplicate.full_clean()
+        duplicate.save()
+        self.assertEqual(
+            models.Task.objects.get(pk=duplicate.pk).normalized_key, keys[duplicate.pk]
+        )
+        duplicate.description_pl = "Inne zadanie"
+        duplicate.save()
+        self.assertEqual(
+            models.Task.objects.get(pk=duplicate.pk).normalized_key,
+            models.description_key("inne zadanie"),
+        )
+
+
+class StorageTestCase(GameTestCase):
+    def test_collectstatic_writes_hashed_variants(self):
+        static_root = self.enterContext(tempfile.TemporaryDirectory())
+        storages = {
+            **settings.STORAGES,
+            "staticfiles": {"BACKEND": "game.storage.StaticStorage"},
+        }
+        with override_settings(STATIC_ROOT=static_root, STORAGES=storages):
+            call_command("collectstatic", interactive=False, verbosity=0)
+            files = set(os.listdir(static_root)) | {
+                f"graphics/{name}"
+                for name in os.listdir(os.path.join(static_root, "graphics"))
+            }
+            self.assertTrue(
+                any(
+                    re.fullmatch(r"style\.[0-9a-f]{12}\.css\.gz", name)
+                    for name in files
+                )
+            )
+            webp = [
+                name
+                for name in files
+                if re.fullmatch(r"graphics/476663297_.*\.[0-9a-f]{12}\.webp", name)
+            ]
+            self.assertEqual(len(webp), 1)
+            self.assertContains(
+                self.client.get(reverse("index")), f'srcset="/static/{webp[0]}"'
+            )
+
+    def test_photos_are_named_by_content(self):
+        storage = ContentAddressedStorage(
+            location=self.enterContext(tempfile.TemporaryDirectory())
+        )
+        first = storage.save("tasks_photos/a.JPG", ContentFile(b"photo"))
+        second = storage.save("tasks_photos/b.jpg", ContentFile(b"photo"))
+        other = storage.save("tasks_photos/c.jpg", ContentFile(b"other photo"))
+        self.assertEqual(first, second)
+        self.assertNotEqual(first, other)
+        self.assertRegex(
+            first, r"^tasks_photos/([0-9a-f]{2})/([0-9a-f]{2})/\1\2[0-9a-f]{60}\.jpg$"
+        )
+        stored = [files for _, _, files in os.walk(storage.path("tasks_photos"))]
+        self.assertEqual(sum(map(len, stored)), 2)
+
+
+class PhotoTestCase(GameTestCase):
+    def setUp(self):
+        super().setUp()
+        self.enterContext(
+            override_settings(
+                MEDIA_ROOT=self.enterContext(tempfile.TemporaryDirectory())
+            )
+        )
+        self.user = User.objects.create_user(username="player", password="secret")
+
+    def complete(self, content: bytes) -> CompletedTask:
+        task = Task.objects.create(description=f"task {Task.objects.count()}")
+        user_task = UserTask.objects.create(user=self.user, task=task)
+        completed_task = CompletedTask(user_task=user_task)
+        completed_task.photo.save("upload.jpg", ContentFile(content))
+        return completed_task
+
+
+class PhotoBlobTestCase(PhotoTestCase):
+    def test_shared_photo_is_deleted_with_its_last_reference(self):
+        first = self.complete(b"photo")
+        second = self.complete(b"photo")
+        storage = first.photo.storage
+        self.assertEqual(first.photo.name, second.photo.name)
+        self.assertEqual(PhotoBlob.objects.get(name=first.photo.name).refcount, 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        self.assertTrue(storage.exists(second.photo.name))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            second.user_task.delete()
+        self.assertFalse(storage.exists(second.photo.name))
+        self.assertFalse(PhotoBlob.objects.exists())
+
+    def test_admin_points_at_first_upload(self):
+        first = self.complete(b"photo")
+        second = self.complete(b"photo")
+        self.complete(b"other photo")
+        self.client.force_login(
+            User.objects.create_superuser("admin", password="secret")
+        )
+        response = self.client.get(reverse("admin:game_completedtask_changelist"))
+        original = reverse("admin:game_completedtask_change", args=[first.pk])
+        self.assertContains(response, f'<a href="{original}">#{first.pk}</a>', count=1)
+        self.assertEqual(
+            response.context["cl"].result_list.get(pk=second.pk).duplicate_of_id,
+            first.pk,
+        )
+
+    def test_dedupe_photos_merges_existing_files(self):
+        storage = self.complete(b"photo").photo.storage
+        legacy = [self.complete(b"legacy") for _ in range(2)]
+        for i, completed_task in enumerate(legacy):
+            name = f"tasks_photos/legacy-{i}.jpg"
+            with open(storage.path(name), "wb") as f:
+                f.write(b"legacy")
+            CompletedTask.objects.filter(pk=completed_task.pk).update(photo=name)
+        content_named = legacy[0].photo.name
+        storage.delete(content_named)
+
+        call_command("dedupe_photos", processes=2, stdout=StringIO())
+
+        names = set(CompletedTask.objects.values_list("photo", flat=True))
+        self.assertEqual(len(names), 2)
+        self.assertIn(content_named, names)
+        self.assertFalse(storage.exists("tasks_photos/legacy-0.jpg"))
+        self.assertFalse(storage.exists("tasks_photos/legacy-1.jpg"))
+        self.assertTrue(storage.exists(content_named))
+        self.assertEqual(PhotoBlob.objects.get(name=content_named).refcount, 2)
+
+
+def sample_photo(seed: int, size=(400, 300)) -> Image.Image:
+    image = Image.new("RGB", size, "white")
+    draw = ImageDraw.Draw(image)
+    for i in range(12):
+        x, y = (seed * 37 + i * 53) % 360, (seed * 91 + i * 29) % 260
+        draw.rectangle((x, y, x + 40, y + 40), fill=(i * 20, seed * 50 % 256, 90))
+    return image
+
+
+def jpeg(image: Image.Image) -> bytes:
+    buffer = BytesIO()
+    image.save(buffer, "JPEG", quality=80)
+    return buffer.getvalue()
+
+
+class UploadTestCase(PhotoTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.user)
+        self.user_task = UserTask.objects.create(
+            user=self.user, task=Task.objects.create(description="task")
+        )
+
+    def upload(self, content: bytes):
+        return self.client.post(
+            reverse("tasks_detail", args=[self.user_task.pk]),
+            {"photo": SimpleUploadedFile("upload.jpg", content), "is_public": "on"},
+        )
+
+    @override_settings(PHOTO_MAX_UPLOAD_BYTES=1024)
+    def test_rejects_large_files(self):
+        response = self.upload(jpeg(sample_photo(1)) + b"\0" * 1024)
+        self.assertFormError(
+            response.context["form"],
+            "photo",
+            views.PhotoField.default_error_messages["file_too_large"] % {"limit": 0},
+        )
+        self.assertFalse(CompletedTask.objects.exists())
+
+    @override_settings(PHOTO_MAX_PIXELS=400 * 300 - 1)
+    def test_rejects_too_many_pixels(self):
+        response = self.upload(jpeg(sample_photo(1)))
+        self.assertFormError(
+            response.context["form"],
+            "photo",
+            views.PhotoField.default_error_messages["too_many_pixels"],
+        )
+        self.assertFalse(CompletedTask.objects.exists())
+
+    @override_settings(JOBS_EAGER=True, PHOTO_MAX_EDGE=300)
+    def test_stores_normalized_photo_without_exif(self):
+        exif = Image.Exif()
+        exif[0x010F] = "Camera"
+        # Rotate 90° clockwise for display.
+        exif[0x0112] = 6
+        exif.get_ifd(0x8825).update({1: "N", 2: (52.0, 13.0, 0.0)})
+        buffer = BytesIO()
+        sample_photo(1, size=(1200, 800)).save(buffer, "PNG", exif=exif)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertRedirects(self.upload(buffer.getvalue()), reverse("tasks"))
+
+        completed_task = CompletedTask.objects.get()
+        self.assertFalse(completed_task.processing)
+        with completed_task.photo.open("rb") as f, Image.open(f) as stored:
+            self.assertEqual(stored.format, "JPEG")
+            self.assertEqual(stored.size, (200, 300))
+            self.assertEqual(dict(stored.getexif()), {})
+        self.assertLess(completed_task.photo.size, len(buffer.getvalue()))
+
+        self.client.force_login(User.objects.create_superuser("admin"))
+        uploads = self.client.get(reverse("stats")).json()["uploads"]
+        self.assertEqual(uploads["uploads"], 1)
+        self.assertEqual(uploads["bytes_in"], len(buffer.getvalue()))
+        self.assertEqual(uploads["bytes_out"], completed_task.photo.size)
+        self.assertEqual(
+            uploads["bytes_saved"], uploads["bytes_in"] - uploads["bytes_out"]
+        )
+
+
+class RenditionTestCase(PhotoTestCase):
+    def test_gallery_offers_every_rendition(self):
+        completed_task = self.complete(jpeg(sample_photo(1, size=(1600, 1200))))
+        name, completed_task.renditions = render_photo(completed_task.photo.name)
+        self.assertEqual(completed_task.renditions, [320, 640, 1280])
+        completed_task.save()
+        storage = completed_task.photo.storage
+        stem = os.path.splitext(name)[0]
+        for width in completed_task.renditions:
+            with storage.open(f"{stem}_{width}w.jpg") as f, Image.open(f) as image:
+                self.assertEqual(image.width, width)
+            self.assertTrue(storage.exists(f"{stem}_{width}w.webp"))
+
+        self.client.force_login(self.user)
+        response = self.client.get(reverse("my-photos"))
+        url = storage.url(stem)
+        self.assertContains(
+            response,
+            f'srcset="{url}_320w.webp 320w, {url}_640w.webp 640w, '
+            f'{url}_1280w.webp 1280w"',
+        )
+        self.assertContains(response, f'src="{url}_320w.jpg"')
+
+    def test_small_photo_keeps_its_width(self):
+        completed_task = self.complete(jpeg(sample_photo(1, size=(200, 150))))
+        self.assertEqual(render_photo(completed_task.photo.name)[1], [200])
+
+    def test_backfill_renditions(self):
+        rendered = self.complete(jpeg(sample_photo(1)))
+        CompletedTask.objects.filter(pk=rendered.pk).update(renditions=[320])
+        pending = self.complete(jpeg(sample_photo(2)))
+        broken = self.complete(b"not a photo")
+        # Rendered in a worker process, which logs the broken photo.
+        with mock.patch("game.images.logger"):
+            call_command("backfill_renditions", processes=1, stdout=StringIO())
+        renditions = dict(CompletedTask.objects.values_list("pk", "renditions"))
+        self.assertEqual(
+            renditions, {rendered.pk: [320], pending.pk: [320], broken.pk: []}
+        )
+
+
+class PhotoProcessingTestCase(PhotoTestCase):
+    def uploaded(self, content: bytes) -> CompletedTask:
+        completed_task = self.complete(content)
+        CompletedTask.objects.filter(pk=completed_task.pk).update(processing=True)
+        return completed_task
+
+    def test_gallery_shows_placeholder_while_processing(self):
+        raw = self.uploaded(jpeg(sample_photo(1)))
+        self.client.force_login(self.user)
+        response = self.client.get(reverse("my-photos"))
+        self.assertContains(response, "Processing photo…")
+        self.assertNotContains(response, raw.photo.url)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            photos.process_photo(raw.pk)
+        response = self.client.get(reverse("my-photos"))
+        self.assertNotContains(response, "Processing photo…")
+        self.assertContains(response, CompletedTask.objects.get().thumbnail_url)
+
+    def test_concurrent_runs_store_one_result(self):
+        raw = self.uploaded(jpeg(sample_photo(1)))
+        render_photo = photos.render_photo
+
+        def other_worker_finishes_first(name):
+            if render.call_count == 1:
+                photos.process_photo(raw.pk)
+            return render_photo(name)
+
+        with (
+            mock.patch.object(
+                photos, "render_photo", side_effect=other_worker_finishes_first
+            ) as render,
+            self.captureOnCommitCallbacks(execute=True),
+        ):
+            photos.process_photo(raw.pk)
+        self.assertEqual(render.call_count, 2)
+        completed_task = CompletedTask.objects.get()
+        self.assertFalse(completed_task.processing)
+        self.assertEqual(
+            dict(PhotoBlob.objects.values_list("name", "refcount")),
+            {completed_task.photo.name: 1},
+        )
+        self.assertFalse(raw.photo.storage.exists(raw.photo.name))
+
+        # The job running once more leaves the processed photo alone.
+        photos.process_photo(raw.pk)
+        self.assertEqual(render.call_count, 2)
+
+    def test_worker_dying_on_the_last_attempt_flags_the_photo(self):
+        stalled = self.uploaded(jpeg(sample_photo(1)))
+        Job.objects.create(
+            kind="process_photo",
+            payload={"completed_task_id": stalled.pk},
+            status=Job.Status.RUNNING,
+            locked_by="dead-worker",
+            locked_until=timezone.now() - timedelta(seconds=1),
+            attempts=5,
+            max_attempts=5,
+        )
+        self.assertEqual(jobs.claim("worker", 10, timedelta(minutes=5)), [])
+        stalled.refresh_from_db()
+        self.assertTrue(stalled.processing_failed)
+
+    def test_failed_processing_is_flagged_and_retried(self):
+        broken = self.uploaded(b"not a photo")
+        job = Job.objects.create(
+            kind="process_photo",
+            payload={"completed_task_id": broken.pk},
+            status=Job.Status.RUNNING,
+            locked_by="worker",
+            attempts=5,
+            max_attempts=5,
+        )
+        with self.assertLogs("game.jobs", "ERROR"):
+            self.assertFalse(jobs.run(job))
+        broken.refresh_from_db()
+        self.assertTrue(broken.processing and broken.processing_failed)
+        self.client.force_login(self.user)
+        self.assertContains(
+            self.client.get(reverse("my-photos")), "This photo could not be processed."
+        )
+
+        self.client.force_login(User.objects.create_superuser("admin"))
+        changelist = reverse("admin:game_completedtask_changelist")
+        response = self.client.get(changelist, {"processing_failed__exact": 1})
+        self.assertEqual(list(response.context["cl"].result_list), [broken])
+        self.client.post(
+            changelist,
+            {"action": "retry_processing_selected", "_selected_action": [broken.pk]},
+        )
+        broken.refresh_from_db()
+        self.assertFalse(broken.processing_failed)
+        self.assertEqual(
+            Job.objects.get(status=Job.Status.QUEUED).payload,
+            {"completed_task_id": broken.pk},
+        )
+
+
+class PhotoHashTestCase(PhotoTestCase):
+    def distance(self, a: Image.Image, b: Image.Image) -> int:
+        return ((phash.dhash(a) ^ phash.dhash(b)) & phash.MASK).bit_count()
+
+    def test_near_duplicates_hash_close(self):
+        original = sample_photo(1)
+        resized = original.resize((200, 150))
+        cropped = original.crop((6, 4, 396, 296))
+        self.assertLessEqual(self.distance(original, resized), 4)
+        self.assertLessEqual(self.distance(original, cropped), 10)
+        self.assertGreater(self.distance(original, sample_photo(2)), 10)
+
+    def test_index_search_with_and_without_numpy(self):
+        index = phash.PhotoHashIndex()
+        index.load([(1, 0), (2, 0b111), (3, -1), (4, 0b1)])
+        expected = [(0, 1), (1, 4), (3, 2)]
+        self.assertEqual(index.near(0, 3), expected)
+        self.assertEqual(index.near(-1, 0), [(0, 3)])
+        with mock.patch.object(phash, "numpy", None):
+            self.assertEqual(index.near(0, 3), expected)
+            self.assertEqual(index.near(-1, 0), [(0, 3)])
+        self.assertEqual(index.near(0, 3, exclude=1), expected[1:])
+
+    def test_index_reads_only_new_hashes(self):
+        first = self.complete(b"first")
+        pending = self.complete(b"pending")
+        CompletedTask.objects.filter(pk=first.pk).update(photo_hash=1)
+        CompletedTask.objects.filter(pk=pending.pk).update(processing=True)
+        self.assertEqual(phash.index().near(0, 3), [(1, first.pk)])
+
+        later = self.complete(b"later")
+        for completed_task, value in ((pending, 3), (later, 7)):
+            CompletedTask.objects.filter(pk=completed_task.pk).update(
+                photo_hash=value, processing=False
+            )
+        with self.captureOnCommitCallbacks(execute=True):
+            phash.added()
+        with mock.patch.object(phash, "_hashed", wraps=phash._hashed) as hashed:
+            index = phash.index()
+        # Only the photos after the one still processing last time are read.
+        hashed.assert_called_once_with(first.pk)
+        self.assertEqual(
+            index.near(0, 3), [(1, first.pk), (2, pending.pk), (3, later.pk)]
+        )
+
+        pending.refresh_from_db()
+        with self.captureOnCommitCallbacks(execute=True):
+            pending.delete()
+        self.assertEqual(phash.index().near(0, 3), [(1, first.pk), (3, later.pk)])
+
+    def test_admin_lists_near_duplicates(self):
+        original = self.complete(jpeg(sample_photo(1)))
+        resized = self.complete(jpeg(sample_photo(1).resize((200, 150))))
+        self.complete(jpeg(sample_photo(2)))
+        call_command("rebuild_photo_hashes", processes=1, stdout=StringIO())
+        self.client.force_login(
+            User.objects.create_superuser("admin", password="secret")
+        )
+        changelist = reverse("admin:game_completedtask_changelist")
+        response = self.client.get(changelist)
+        self.assertContains(response, f"?near_duplicates_of={original.pk}")
+        response = self.client.get(changelist, {"near_duplicates_of": original.pk})
+        self.assertEqual(
+            {
+                completed_task.pk
+                for completed_task in response.context["cl"].result_list
+            },
+            {original.pk, resized.pk},
+        )
+
+
+class LoadTestCase(PhotoTestCase):
+    def seed(self, **options):
+        out = StringIO()
+        call_command(
+            "seed_load",
+            users=3,
+            tasks=10,
+            tasks_per_user=4,
+            completed_ratio=0.5,
+            images=2,
+            image_size=32,
+            seed=1,
+            stdout=out,
+            **options,
+        )
+        return out.getvalue()
+
+    @override_settings(DEBUG=False)
+    def test_seed_needs_debug_or_permission(self):
+        with self.assertRaisesMessage(CommandError, "--allow-superuser"):
+            self.seed()
+        self.assertFalse(User.objects.filter(is_superuser=True).exists())
+        self.seed(allow_superuser=True)
+        self.assertTrue(User.objects.filter(username="load-admin").exists())
+
+    @override_settings(DEBUG=True)
+    def test_seed_and_bench(self):
+        password = re.search(r"password (\S+)", self.seed())[1]
+        self.assertEqual(UserTask.objects.filter(user__username="load-0").count(), 4)
+        self.assertEqual(
+            Task.objects.filter(description_pl__startswith="Zadanie load").count(), 10
+        )
+        admin = User.objects.get(username="load-admin")
+        self.assertFalse(admin.check_password("load"))
+        self.assertTrue(admin.check_password(password))
+        self.assertEqual(leaderboard.differences(), {})
+
+        out = StringIO()
+        call_command(
+            "bench_views",
+            repeat=2,
+            warmup=0,
+            routes=["dashboard", "tasks", "admin:index"],
+            stdout=out,
+        )
+        report = json.loads(out.getvalue())
+        # In urls.py order.
+        self.assertEqual(list(report["client"]), ["admin:index", "dashboard", "tasks"])
+        for result in report["client"].values():
+            self.assertGreater(result["bytes"], 0)
+            self.assertLessEqual(result["p50_ms"], result["p99_ms"])
+        with self.assertRaisesMessage(CommandError, "Unknown routes: nowhere"):
+            call_command("bench_views", routes=["nowhere"], stdout=StringIO())
+
+
+class PhotoArchiveTestCase(PhotoTestCase):
+    def test_download_streams_photos_and_manifest(self):
+        first = self.complete(jpeg(sample_photo(1)))
+        second = self.complete(jpeg(sample_photo(2)))
+        missing = self.complete(b"missing")
+        missing.photo.storage.delete(missing.photo.name)
+        self.client.force_login(self.user)
+        with self.assertLogs("game.archive", "WARNING"):
+            response = self.client.get(reverse("my-photos-download"))
+            content = b"".join(response.streaming_content)
+        self.assertIn("attachment;", response["Content-Disposition"])
+
+        archive = zipfile.ZipFile(BytesIO(content))
+        self.assertIsNone(archive.testzip())
+        names = archive.namelist()
+        self.assertEqual(names[-1], "manifest.csv")
+        self.assertEqual(
+            names[:-1],
+            [f"player/{first.pk}-task-0.jpg", f"player/{second.pk}-task-1.jpg"],
+        )
+        with first.photo.open("rb") as photo:
+            self.assertEqual(archive.read(names[0]), photo.read())
+        manifest = list(csv.DictReader(StringIO(archive.read("manifest.csv").decode())))
+        self.assertEqual([row["file"] for row in manifest], [*names[:-1], ""])
+        self.assertEqual(manifest[2]["task"], "task 2")
+
+    def test_leaves_out_unprocessed_photos(self):
+        processed = self.complete(jpeg(sample_photo(1)))
+        for failed in (False, True):
+            completed_task = self.complete(jpeg(sample_photo(2)))
+            CompletedTask.objects.filter(pk=completed_task.pk).update(
+                processing=True, processing_failed=failed
+            )
+        self.client.force_login(self.user)
+        response = self.client.get(reverse("my-photos-download"))
+        archive = zipfile.ZipFile(BytesIO(b"".join(response.streaming_content)))
+        self.assertEqual(
+            archive.namelist(), [f"player/{processed.pk}-task-0.jpg", "manifest.csv"]
+        )
+
+    def test_public_download_is_for_staff(self):
+        self.client.force_login(self.user)
+        response = self.client.get(reverse("all-photos-download"))
+        self.assertEqual(response.status_code, 302)
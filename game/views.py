@@ -1,20 +1,30 @@
-import random
+from typing import ClassVar
 
 from django import forms
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth.forms import UserCreationForm
 from django.contrib.auth.mixins import LoginRequiredMixin
-from django.contrib.auth.models import User
+from django.contrib.auth.views import redirect_to_login
+from django.core.exceptions import PermissionDenied, ValidationError
 from django.db import transaction
-from django.db.models import F, Count
-from django.http.response import HttpResponseRedirect, Http404
+from django.http.response import HttpResponse, HttpResponseRedirect, Http404, JsonResponse, StreamingHttpResponse
 from django.shortcuts import redirect
 from django.urls import reverse_lazy, reverse
+from django.utils.crypto import constant_time_compare
+from django.utils.decorators import method_decorator
+from django.utils.functional import SimpleLazyObject, cached_property
 from django.utils.translation import gettext_lazy as _
 from django.views import generic
 from django.views.generic import TemplateView
 from django.views.generic.edit import FormMixin
 
-from game.models import Task, UserTask, CompletedTask
+from game import archive, cache, catalogue, dbstats, events, images, jobs, leaderboard, metrics, routers
+from game.draw import draw_task, TooManyIncompleteTasks, NoTasksAvailable
+from game.models import UserTask, CompletedTask
+from game.pagination import KeysetPage
+from game.retry import retry_on_lock
 
 
 class SignUpView(generic.CreateView):
@@ -23,46 +33,149 @@ class SignUpView(generic.CreateView):
     success_url = reverse_lazy("login")
 
 
-class TaskListView(LoginRequiredMixin, generic.ListView):
+class ReplicaReadMixin:
+    # GET and HEAD requests may read from a replica; see game.routers.
+    def setup(self, request, *args, **kwargs):
+        super().setup(request, *args, **kwargs)
+        if request.method in ("GET", "HEAD"):
+            routers.read_from_replica()
+
+
+class FragmentCacheMixin:
+    # Cached blocks in the template are keyed by these scope versions, which
+    # game.signals bumps when the underlying rows change.
+    fragment_name: str = ""
+    fragment_scopes: tuple[str, ...] = ()
+
+    def get_context_data(self, **kwargs):
+        ctx = super().get_context_data(**kwargs)
+        ctx["fragment"] = {"name": self.fragment_name, "scopes": self.fragment_scopes}
+        return ctx
+
+
+class TaskListView(LoginRequiredMixin, ReplicaReadMixin, FragmentCacheMixin, generic.ListView):
     model = UserTask
     template_name = "tasks.html"
+    context_object_name = "pending_tasks"
+    fragment_name = "tasks"
+    fragment_scopes = ("user", "tasks")
 
     def get_queryset(self):
         return super().get_queryset().filter(
-            user=self.request.user,
-            completedtask=None).order_by("-id")
+            user=self.request.user
+        ).select_related("completedtask").order_by("-id")
+
+    @cached_property
+    def split_tasks(self) -> tuple[list, list]:
+        # Pending and completed tasks come from the same query and are split here.
+        pending, completed = [], []
+        for user_task in self.object_list:
+            if hasattr(user_task, "completedtask"):
+                completed.append(user_task)
+            else:
+                pending.append(user_task)
+        completed.reverse()
+        return pending, completed
 
     def get_context_data(self, *args, **kwargs):
-        ctx = super().get_context_data(*args, **kwargs)
-        ctx["completed_tasks"] = super().get_queryset().filter(
-            user=self.request.user
-        ).exclude(completedtask=None)
-        return ctx
+        # Lazy, so nothing is queried when the cached fragment is served.
+        return super().get_context_data(
+            *args,
+            object_list=SimpleLazyObject(lambda: self.split_tasks[0]),
+            completed_tasks=SimpleLazyObject(lambda: self.split_tasks[1]),
+            **kwargs,
+        )
+
+class PhotoField(forms.ImageField):
+    default_error_messages: ClassVar[dict] = {
+        "file_too_large": _("The photo is too large. The limit is %(limit)s MB."),
+        "too_many_pixels": _("The photo resolution is too high."),
+    }
+
+    def to_python(self, data):
+        # Checked before Pillow touches the file: ImageField.to_python only
+        # parses headers, and the dimension check below reads them too.
+        if data and data.size > settings.PHOTO_MAX_UPLOAD_BYTES:
+            raise ValidationError(
+                self.error_messages["file_too_large"],
+                code="file_too_large",
+                params={"limit": settings.PHOTO_MAX_UPLOAD_BYTES // (1024 * 1024)},
+            )
+        f = super().to_python(data)
+        if f is not None:
+            width, height = f.image.size
+            if width * height > settings.PHOTO_MAX_PIXELS:
+                raise ValidationError(
+                    self.error_messages["too_many_pixels"], code="too_many_pixels"
+                )
+        return f
+
 
 class CompletedTaskForm(forms.ModelForm):
     class Meta:
         model = CompletedTask
         fields = ["photo", "is_public"]
+        field_classes: ClassVar[dict] = {"photo": PhotoField}
+
+class GalleryPaginationMixin:
+    paginate_by = 20
+    page_window = 2
+
+    page = None
+
+    def keyset_page(self, queryset, page_size):
+        return KeysetPage(
+            queryset,
+            date_field="completedtask__date_completed",
+            pk_field="completedtask__id",
+            per_page=page_size,
+            params=self.request.GET,
+            window=self.page_window,
+        )
+
+    def paginate_queryset(self, queryset, page_size):
+        page = self.page
+        if page is None:
+            page = self.keyset_page(queryset, page_size)
+        return None, page, page, True
 
-class MyPhotosView(LoginRequiredMixin, generic.ListView):
+
+class MyPhotosView(LoginRequiredMixin, ReplicaReadMixin, FragmentCacheMixin, GalleryPaginationMixin, generic.ListView):
     model = UserTask
     template_name = "gallery.html"
-    paginate_by = 20
+    fragment_name = "my-photos"
+    fragment_scopes = ("user", "tasks")
 
     def get_queryset(self):
         return super().get_queryset().filter(
             user=self.request.user
-        ).order_by("-completedtask__date_completed").exclude(completedtask=None).select_related("user", "completedtask")
+        ).exclude(completedtask=None).select_related("user", "completedtask")
+
+    def get_context_data(self, **kwargs):
+        ctx = super().get_context_data(**kwargs)
+        ctx["archive_url"] = reverse("my-photos-download")
+        return ctx
 
-class AllPhotosView(LoginRequiredMixin, generic.ListView):
+class AllPhotosView(LoginRequiredMixin, ReplicaReadMixin, FragmentCacheMixin, GalleryPaginationMixin, generic.ListView):
     model = UserTask
     template_name = "gallery.html"
-    paginate_by = 20
+    fragment_name = "all-photos"
+    fragment_scopes = ("gallery", "tasks")
 
     def get_queryset(self):
         return super().get_queryset().filter(
             completedtask__is_public=True
-        ).select_related("user", "completedtask").order_by("-completedtask__date_completed")
+        ).select_related("user", "completedtask")
+
+    def get_context_data(self, **kwargs):
+        ctx = super().get_context_data(**kwargs)
+        if self.request.user.is_staff:
+            ctx["archive_url"] = reverse("all-photos-download")
+        if not self.request.GET:
+            # New photos are only added live to the first page.
+            ctx["events_url"] = reverse("events")
+        return ctx
+
 
 class TaskDetailView(LoginRequiredMixin, FormMixin, generic.DetailView):
     model = UserTask
@@ -83,44 +196,48 @@ class TaskDetailView(LoginRequiredMixin, FormMixin, generic.DetailView):
         self.object = self.get_object()
         form = self.get_form()
         if form.is_valid():
-            completed_task = form.save(commit=False)
-            completed_task.user = self.request.user
-            completed_task.user_task = self.object
-            completed_task.save()
+            self.save_upload(form)
             return self.form_valid(form)
         else:
             return self.form_invalid(form)
 
+    @retry_on_lock
+    @transaction.atomic
+    def save_upload(self, form):
+        # Only the raw upload is stored here; resizing and thumbnails run
+        # in a ``run_jobs`` worker so they don't hold up a gunicorn worker.
+        completed_task = form.save(commit=False)
+        completed_task.user = self.request.user
+        completed_task.user_task = self.object
+        completed_task.processing = True
+        completed_task.save()
+        jobs.enqueue("process_photo", completed_task_id=completed_task.pk)
 
-class DashboardView(LoginRequiredMixin, generic.TemplateView):
+
+class DashboardView(LoginRequiredMixin, ReplicaReadMixin, FragmentCacheMixin, generic.TemplateView):
     template_name = "dashboard.html"
+    fragment_name = "dashboard"
+    fragment_scopes = ("user", "leaderboard")
 
     def get_context_data(self, **kwargs):
         ctx = super().get_context_data(**kwargs)
-        ctx["leaderboard"] = CompletedTask.objects.filter(task_verified=True).select_related(
-            "usertask").annotate(
-            username=F("user_task__user__username")).values("username").annotate(
-            count=Count("id")
-        ).filter(count__gt=0).order_by("-count")[:3]
+        ctx["leaderboard"] = leaderboard.top(settings.LEADERBOARD_SIZE)
+        ctx["my_rank"] = SimpleLazyObject(lambda: leaderboard.rank_for(self.request.user))
+        ctx["events_url"] = reverse("events")
         return ctx
 
 
-    @transaction.atomic
     def post(self, request, *args, **kwargs):
-        context = self.get_context_data(**kwargs)
-        user: User = self.request.user  # type: ignore[assignment]
-        if user.usertask_set.filter(completedtask=None).count() > 4:
-            context["draw_error"] = _("User already has 5 incomplete tasks")
+        try:
+            draw_task(self.request.user)
+        except TooManyIncompleteTasks:
+            draw_error = _("User already has 5 incomplete tasks")
+        except NoTasksAvailable:
+            draw_error = _("There are no more tasks available.")
         else:
-            task_ids = Task.objects.exclude(usertask__user=user).values_list(
-                "id", flat=True)
-            if task_ids:
-                task_id = random.choice(task_ids)
-                task = Task.objects.get(id=task_id)
-                UserTask(user=user, task=task).save()
-                return HttpResponseRedirect(reverse_lazy("tasks"))
-            else:
-                context["draw_error"] = _("There are no more tasks available.")
+            return HttpResponseRedirect(reverse_lazy("tasks"))
+        context = self.get_context_data(**kwargs)
+        context["draw_error"] = draw_error
         return self.render_to_response(context)
 
 
@@ -132,3 +249,210 @@ class IndexView(TemplateView):
             return HttpResponseRedirect(reverse_lazy("dashboard"))
         return super().get(request, *args, **kwargs)
 
+
+class PhotoArchiveMixin:
+    """Streams a ZIP of the photos in ``get_archive_queryset()`` as it's built."""
+    filename = "photos.zip"
+
+    def get_archive_queryset(self):
+        raise NotImplementedError
+
+    def archive_content(self):
+        return archive.photo_archive(self.get_archive_queryset())
+
+    def get(self, request, *args, **kwargs):
+        response = StreamingHttpResponse(self.archive_content(), content_type="application/zip")
+        response["Content-Disposition"] = f'attachment; filename="{self.filename}"'
+        return response
+
+
+class MyPhotosArchiveView(LoginRequiredMixin, PhotoArchiveMixin, generic.View):
+    filename = "my-photos.zip"
+
+    def get_archive_queryset(self):
+        return CompletedTask.objects.filter(user_task__user=self.request.user)
+
+
+@method_decorator(staff_member_required, name="dispatch")
+class AllPhotosArchiveView(PhotoArchiveMixin, generic.View):
+    filename = "all-photos.zip"
+
+    def get_archive_queryset(self):
+        return CompletedTask.objects.filter(is_public=True)
+
+
+@method_decorator(staff_member_required, name="dispatch")
+class StatsView(generic.View):
+    """Connection, cache and upload counters of the worker serving the request."""
+
+    def get(self, request, *args, **kwargs):
+        return JsonResponse({
+            **dbstats.stats(),
+            "fragment_cache": cache.stats(),
+            "task_catalogue": catalogue.stats(),
+            "uploads": images.upload_stats(),
+        })
+
+
+class MetricsView(generic.View):
+    """Request metrics of all workers in the Prometheus text format, for staff
+    or a scraper sending ``Authorization: Bearer <METRICS_TOKEN>``."""
+
+    def get(self, request, *args, **kwargs):
+        token = settings.METRICS_TOKEN
+        scraper = token and constant_time_compare(
+            request.headers.get("Authorization", ""), f"Bearer {token}"
+        )
+        if not scraper and not request.user.is_staff:
+            raise PermissionDenied
+        return HttpResponse(
+            metrics.exposition(metrics.collect()),
+            content_type="text/plain; version=0.0.4; charset=utf-8",
+        )
+
+
+class EventStreamView(LoginRequiredMixin, generic.View):
+    """New public photos and leaderboard changes as server-sent events.
+
+    The stream resumes after the ``Last-Event-ID`` a reconnecting browser
+    sends, or else after the events already published when the page
+    embedding it was rendered at ``?since=<unix time>``.
+    """
+
+    def get_cursor(self) -> int | None:
+        try:
+            return int(self.request.headers["Last-Event-ID"])
+        except (KeyError, ValueError):
+            return None
+
+    def get_since(self) -> float | None:
+        try:
+            return float(self.request.GET["since"])
+        except (KeyError, ValueError):
+            return None
+
+    def stream_response(self, content):
+        response = StreamingHttpResponse(content, content_type="text/event-stream")
+        response["Cache-Control"] = "no-cache"
+        # Tells a buffering proxy such as nginx to pass events straight on.
+        response["X-Accel-Buffering"] = "no"
+        return response
+
+    def get(self, request, *args, **kwargs):
+        after = self.get_cursor()
+        if after is None:
+            after = events.start(self.get_since())
+        return self.stream_response(events.stream(after, settings.EVENTS_SYNC_STREAM_SECONDS))
+
+
+# Async twins of the read-heavy pages, used when ASYNC_VIEWS is set and the
+# app runs under an ASGI worker. Their data is loaded through the async ORM
+# unless the page's cached fragment is already there; templates are still
+# rendered in a worker thread by Django's async handler.
+
+class AsyncLoginRequiredMixin(LoginRequiredMixin):
+    async def dispatch(self, request, *args, **kwargs):
+        # The lazy request.user would query the session synchronously.
+        request.user = await request.auser()
+        if not request.user.is_authenticated:
+            return self.handle_no_permission()
+        return await super().dispatch(request, *args, **kwargs)
+
+
+class AsyncFragmentCacheMixin(FragmentCacheMixin):
+    fragment = None
+
+    def lookup_fragment(self):
+        key = cache.request_fragment_key(
+            self.fragment_name, self.fragment_scopes, self.request
+        )
+        self.fragment = {"key": key, "content": cache.get_fragment(key)}
+        return self.fragment["content"]
+
+    async def aget_fragment(self):
+        return await sync_to_async(self.lookup_fragment)()
+
+    def get_context_data(self, **kwargs):
+        ctx = super().get_context_data(**kwargs)
+        if self.fragment is not None:
+            ctx["fragment"].update(self.fragment)
+        return ctx
+
+
+class AsyncTaskListView(AsyncLoginRequiredMixin, AsyncFragmentCacheMixin, TaskListView):
+    async def get(self, request, *args, **kwargs):
+        self.object_list = self.get_queryset()
+        if await self.aget_fragment() is None:
+            self.object_list = [user_task async for user_task in self.object_list]
+        return self.render_to_response(self.get_context_data())
+
+
+class AsyncGalleryMixin(AsyncLoginRequiredMixin, AsyncFragmentCacheMixin):
+    async def get(self, request, *args, **kwargs):
+        self.object_list = self.get_queryset()
+        if await self.aget_fragment() is None:
+            self.page = self.keyset_page(self.object_list, self.paginate_by)
+            await self.page.aload()
+        return self.render_to_response(self.get_context_data())
+
+
+class AsyncMyPhotosView(AsyncGalleryMixin, MyPhotosView):
+    pass
+
+
+class AsyncAllPhotosView(AsyncGalleryMixin, AllPhotosView):
+    pass
+
+
+class AsyncPhotoArchiveMixin:
+    def archive_content(self):
+        return archive.aiterate(super().archive_content())
+
+    async def get(self, request, *args, **kwargs):
+        return super().get(request, *args, **kwargs)
+
+
+class AsyncMyPhotosArchiveView(AsyncLoginRequiredMixin, AsyncPhotoArchiveMixin, MyPhotosArchiveView):
+    pass
+
+
+class AsyncAllPhotosArchiveView(AsyncPhotoArchiveMixin, AllPhotosArchiveView):
+    async def dispatch(self, request, *args, **kwargs):
+        # staff_member_required, which can't wrap a coroutine in a class.
+        request.user = await request.auser()
+        if not (request.user.is_active and request.user.is_staff):
+            return redirect_to_login(request.get_full_path(), reverse("admin:login"))
+        return await generic.View.dispatch(self, request, *args, **kwargs)
+
+
+class AsyncEventStreamView(AsyncLoginRequiredMixin, EventStreamView):
+    # Waiting for events costs an async worker next to nothing, so streams
+    # stay open and the browser seldom reconnects.
+    async def get(self, request, *args, **kwargs):
+        after = self.get_cursor()
+        if after is None:
+            after = await events.astart(self.get_since())
+        return self.stream_response(events.astream(after, settings.EVENTS_STREAM_SECONDS))
+
+
+class AsyncDashboardView(AsyncLoginRequiredMixin, AsyncFragmentCacheMixin, DashboardView):
+    leaders = None
+    rank = None
+
+    async def get(self, request, *args, **kwargs):
+        if await self.aget_fragment() is None:
+            self.leaders = [
+                leader async for leader in leaderboard.top(settings.LEADERBOARD_SIZE)
+            ]
+            self.rank = await leaderboard.arank_for(request.user)
+        return self.render_to_response(self.get_context_data(**kwargs))
+
+    def get_context_data(self, **kwargs):
+        ctx = super().get_context_data(**kwargs)
+        if self.leaders is not None:
+            ctx["leaderboard"], ctx["my_rank"] = self.leaders, self.rank
+        return ctx
+
+    async def post(self, request, *args, **kwargs):
+        # Drawing locks rows inside a transaction, so it stays synchronous.
+        return await sync_to_async(super().post)(request, *args, **kwargs)
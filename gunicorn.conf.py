@@ -0,0 +1,25 @@
+"""gunicorn settings, read from the working directory on start.
+
+The app is imported and warmed once in the master (see game.startup) and
+the workers are forked from it, so they start serving at once and share
+its memory copy-on-write. GUNICORN_PRELOAD=0 goes back to each worker
+importing the app itself.
+"""
+
+import gc
+import os
+
+bind = os.environ.get("GUNICORN_BIND", "0.0.0.0:80")
+workers = int(os.environ.get("WEB_CONCURRENCY", "16"))
+forwarded_allow_ips = "*"
+accesslog = "-"
+preload_app = os.environ.get("GUNICORN_PRELOAD", "1") != "0"
+
+
+def when_ready(server):
+    # Runs after the preload, before the first fork. Frozen objects are left
+    # alone by the collector, which would otherwise write to (and so copy)
+    # every page holding the preloaded app in each worker.
+    if server.cfg.preload_app:
+        gc.collect()
+        gc.freeze()
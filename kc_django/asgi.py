@@ -14,3 +14,9 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "kc_django.settings")
 
 application = get_asgi_application()
+
+# Warm up now rather than on the first requests; with gunicorn's
+# preload_app, once for all workers.
+from game import startup
+
+startup.warm()
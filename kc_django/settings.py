@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 import logging
+import os
 from gettext import gettext
 import environ
 from pathlib import Path
@@ -32,7 +33,7 @@ if not SECRET_KEY:
     SECRET_KEY = "django-insecure-u64vcef!chfbh2g)ftz==^+uhdnjor86e50-)0k=)r&tnjv5hm"
 
 # SECURITY WARNING: don't run with debug turned on in production!
-DEBUG = env.str("DEBUG", default=True)
+DEBUG = env.bool("DEBUG", default=True)
 
 ALLOWED_HOSTS = env.list("ALLOWED_HOSTS", default=["localhost", "127.0.0.1"])
 
@@ -50,7 +51,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "game.metrics.MetricsMiddleware",
     "django.middleware.security.SecurityMiddleware",
+    "game.routers.replica_middleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
@@ -84,10 +87,117 @@ WSGI_APPLICATION = "kc_django.wsgi.application"
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
 
+# Connections are kept open for DB_CONN_MAX_AGE seconds and checked before
+# reuse. On PostgreSQL, DB_POOL switches to psycopg 3's connection pool (the
+# "pool" extra) and DB_STATEMENT_TIMEOUT (ms) caps every statement server-side.
+DB_CONN_MAX_AGE = env.int("DB_CONN_MAX_AGE", default=60)
+DB_POOL = env.bool("DB_POOL", default=False)
+DB_POOL_MIN_SIZE = env.int("DB_POOL_MIN_SIZE", default=2)
+DB_POOL_MAX_SIZE = env.int("DB_POOL_MAX_SIZE", default=4)
+DB_POOL_TIMEOUT = env.int("DB_POOL_TIMEOUT", default=10)
+DB_STATEMENT_TIMEOUT = env.int("DB_STATEMENT_TIMEOUT", default=0)
+
+# SQLite waits up to DB_SQLITE_TIMEOUT seconds for a lock. Transactions
+# wrapped in game.retry.retry_on_lock are retried up to DB_LOCK_RETRIES times
+# if that still isn't enough.
+#
+# DB_SQLITE_CONCURRENT_WRITES is for deployments with several writing
+# processes. It switches the database file to WAL mode, so readers don't wait
+# for the writer; WAL is stored in the file and adds -wal and -shm files
+# next to it. It also starts every atomic() block with BEGIN IMMEDIATE,
+# which takes the write lock at once, even for blocks that only read, so
+# writers queue at BEGIN instead of failing at their first write.
+DB_SQLITE_CONCURRENT_WRITES = env.bool("DB_SQLITE_CONCURRENT_WRITES", default=False)
+DB_SQLITE_TIMEOUT = env.float("DB_SQLITE_TIMEOUT", default=20)
+DB_SQLITE_MMAP_SIZE = env.int("DB_SQLITE_MMAP_SIZE", default=256 * 1024 * 1024)
+DB_LOCK_RETRIES = env.int("DB_LOCK_RETRIES", default=4)
+
+
+def database(config: dict) -> dict:
+    config["CONN_MAX_AGE"] = DB_CONN_MAX_AGE
+    config["CONN_HEALTH_CHECKS"] = True
+    if config["ENGINE"] == "django.db.backends.sqlite3":
+        options = {
+            "timeout": DB_SQLITE_TIMEOUT,
+            "init_command": f"PRAGMA mmap_size={DB_SQLITE_MMAP_SIZE}",
+        }
+        if DB_SQLITE_CONCURRENT_WRITES:
+            options["transaction_mode"] = "IMMEDIATE"
+            # synchronous=NORMAL is only safe against corruption in WAL mode.
+            options["init_command"] = (
+                "PRAGMA journal_mode=WAL;"
+                "PRAGMA synchronous=NORMAL;"
+                + options["init_command"]
+            )
+        config["OPTIONS"] = {**options, **config.get("OPTIONS", {})}
+        return config
+    if config["ENGINE"] != "django.db.backends.postgresql":
+        return config
+    options = config.setdefault("OPTIONS", {})
+    if DB_POOL:
+        # Django hands connections back to the pool; persistent connections
+        # can't be combined with it.
+        config["CONN_MAX_AGE"] = 0
+        config["CONN_HEALTH_CHECKS"] = False
+        options["pool"] = {
+            "min_size": DB_POOL_MIN_SIZE,
+            "max_size": DB_POOL_MAX_SIZE,
+            "timeout": DB_POOL_TIMEOUT,
+        }
+    if DB_STATEMENT_TIMEOUT:
+        options["options"] = f"-c statement_timeout={DB_STATEMENT_TIMEOUT}"
+    return config
+
+
 DATABASES = {
-    "default": env.db(default = f"sqlite:///{BASE_DIR / 'db.sqlite3'}")
+    "default": database(env.db(default = f"sqlite:///{BASE_DIR / 'db.sqlite3'}"))
+}
+
+# Read replicas: each DATABASE_URL_REPLICA_<NAME> adds a "replica_<name>"
+# database. game.routers sends the gallery, task list and leaderboard reads
+# there, except for users who wrote within the last REPLICA_PIN_SECONDS.
+# Pages rendered from a replica within REPLICA_PIN_SECONDS of a change to
+# their data aren't put in the fragment cache.
+REPLICA_DATABASES = []
+for key in sorted(os.environ):
+    if key.startswith("DATABASE_URL_REPLICA_"):
+        alias = "replica_" + key.removeprefix("DATABASE_URL_REPLICA_").lower()
+        DATABASES[alias] = database(env.db(key))
+        DATABASES[alias]["TEST"] = {"MIRROR": "default"}
+        REPLICA_DATABASES.append(alias)
+
+DATABASE_ROUTERS = ["game.routers.ReplicaRouter"]
+REPLICA_PIN_SECONDS = env.int("REPLICA_PIN_SECONDS", default=5)
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.1/topics/cache/
+# locmem is per process; use a shared backend (filecache://, rediscache://,
+# pymemcache://) when running several gunicorn workers so invalidation
+# reaches all of them.
+
+CACHES = {
+    "default": env.cache("CACHE_URL", default="locmemcache://")
 }
 
+FRAGMENT_CACHE_ALIAS = "default"
+FRAGMENT_CACHE_TIMEOUT = env.int("FRAGMENT_CACHE_TIMEOUT", default=300)
+
+# Sessions are read from the cache and written through to the database, and
+# logged-in users are cached for USER_CACHE_TIMEOUT seconds, so most pages
+# start without a query. Both need the shared cache backend above once
+# there's more than one worker, or a logout or deactivation only reaches one.
+SESSION_ENGINE = "django.contrib.sessions.backends.cached_db"
+SESSION_CACHE_ALIAS = "default"
+USER_CACHE_ALIAS = "default"
+USER_CACHE_TIMEOUT = env.int("USER_CACHE_TIMEOUT", default=300)
+
+AUTHENTICATION_BACKENDS = [
+    "game.auth.CachedModelBackend",
+    # Sessions from before the cached backend still name this one.
+    "django.contrib.auth.backends.ModelBackend",
+]
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -117,6 +227,15 @@ USE_TZ = True
 STATIC_URL = "static/"
 STATIC_ROOT = env.path("STATIC_ROOT", default=BASE_DIR / "public")
 
+# Static files get content-hashed names (plus WebP and precompressed
+# variants) at collectstatic time, and uploaded photos are named after their
+# SHA-256, so nginx can serve both with far-future cache headers.
+STORAGES = {
+    "default": {"BACKEND": "django.core.files.storage.FileSystemStorage"},
+    "photos": {"BACKEND": "game.storage.ContentAddressedStorage"},
+    "staticfiles": {"BACKEND": "game.storage.StaticStorage"},
+}
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
 
@@ -131,4 +250,49 @@ LOCALE_PATHS = [BASE_DIR / "locale"]
 LOGIN_REDIRECT_URL = reverse_lazy("dashboard")
 LOGOUT_REDIRECT_URL = reverse_lazy("index")
 MEDIA_URL = "/media/"
-MEDIA_ROOT = env.path("MEDIA_ROOT", default=BASE_DIR / "media")
\ No newline at end of file
+MEDIA_ROOT = env.path("MEDIA_ROOT", default=BASE_DIR / "media")
+
+# Uploaded photos are downscaled to PHOTO_MAX_EDGE and re-encoded as JPEG.
+PHOTO_MAX_EDGE = env.int("PHOTO_MAX_EDGE", default=2048)
+PHOTO_JPEG_QUALITY = env.int("PHOTO_JPEG_QUALITY", default=85)
+PHOTO_MAX_UPLOAD_BYTES = env.int("PHOTO_MAX_UPLOAD_BYTES", default=25 * 1024 * 1024)
+PHOTO_MAX_PIXELS = env.int("PHOTO_MAX_PIXELS", default=50_000_000)
+# Photos whose 64-bit perceptual hashes differ in at most this many bits are
+# flagged as near duplicates in the admin.
+PHOTO_DUPLICATE_DISTANCE = env.int("PHOTO_DUPLICATE_DISTANCE", default=10)
+
+# Background jobs are processed by `manage.py run_jobs`. With JOBS_EAGER they
+# run in the request process right after commit instead, which is handy for
+# local development without a worker.
+JOBS_EAGER = env.bool("JOBS_EAGER", default=False)
+
+LEADERBOARD_SIZE = env.int("LEADERBOARD_SIZE", default=3)
+
+# Serve the dashboard, task list and galleries from async views. Only useful
+# under an ASGI worker, e.g.
+# gunicorn kc_django.asgi -k uvicorn_worker.UvicornWorker
+ASYNC_VIEWS = env.bool("ASYNC_VIEWS", default=False)
+
+# Request metrics, served at /metrics. Each worker writes its counters to
+# METRICS_DIR every METRICS_FLUSH_SECONDS so any worker can report the sum;
+# without it /metrics only covers the worker that answers. Empty the
+# directory on deploy. Requests slower than METRICS_SLOW_REQUEST_SECONDS are
+# logged with their slowest SQL.
+METRICS_DIR = env.str("METRICS_DIR", default=None)
+METRICS_FLUSH_SECONDS = env.float("METRICS_FLUSH_SECONDS", default=5)
+METRICS_SLOW_REQUEST_SECONDS = env.float("METRICS_SLOW_REQUEST_SECONDS", default=1.0)
+METRICS_TOKEN = env.str("METRICS_TOKEN", default=None)
+
+# Live gallery and leaderboard updates, served as server-sent events at
+# /events/ from the game_event table, so every worker sees what any other
+# one published. Events become visible EVENTS_SETTLE_SECONDS after they're
+# written, which covers transactions that commit out of id order. Sync
+# workers answer with what's new and let the browser reconnect every
+# EVENTS_POLL_SECONDS, unless EVENTS_SYNC_STREAM_SECONDS keeps the
+# connection open; async views hold it for EVENTS_STREAM_SECONDS. Events
+# older than EVENTS_RETENTION_SECONDS are deleted as new ones come in.
+EVENTS_SETTLE_SECONDS = env.float("EVENTS_SETTLE_SECONDS", default=1.0)
+EVENTS_POLL_SECONDS = env.float("EVENTS_POLL_SECONDS", default=2.0)
+EVENTS_SYNC_STREAM_SECONDS = env.float("EVENTS_SYNC_STREAM_SECONDS", default=0)
+EVENTS_STREAM_SECONDS = env.float("EVENTS_STREAM_SECONDS", default=300)
+EVENTS_RETENTION_SECONDS = env.int("EVENTS_RETENTION_SECONDS", default=24 * 60 * 60)
@@ -21,14 +21,30 @@ from django.urls import path, include
 
 from game import views
 
+
+def read_view(view):
+    # Under ASGI the read-heavy pages are served by their async twins.
+    if settings.ASYNC_VIEWS:
+        view = getattr(views, f"Async{view.__name__}")
+    return view.as_view()
+
 urlpatterns = [
     path("admin/", admin.site.urls),
     path("accounts/", include("django.contrib.auth.urls")),
     path("accounts/signup/", views.SignUpView.as_view(), name="signup"),
     path("tasks/<int:pk>/", views.TaskDetailView.as_view(), name="tasks_detail"),
-    path("dashboard/", views.DashboardView.as_view(), name="dashboard"),
-    path("my-photos/", views.MyPhotosView.as_view(), name="my-photos"),
-    path("all-photos/", views.AllPhotosView.as_view(), name="all-photos"),
-    path("tasks/", views.TaskListView.as_view(), name="tasks"),
+    path("dashboard/", read_view(views.DashboardView), name="dashboard"),
+    path("my-photos/", read_view(views.MyPhotosView), name="my-photos"),
+    path("all-photos/", read_view(views.AllPhotosView), name="all-photos"),
+    path("my-photos/download/", read_view(views.MyPhotosArchiveView), name="my-photos-download"),
+    path("all-photos/download/", read_view(views.AllPhotosArchiveView), name="all-photos-download"),
+    path("tasks/", read_view(views.TaskListView), name="tasks"),
+    path("events/", read_view(views.EventStreamView), name="events"),
+    path("stats/", views.StatsView.as_view(), name="stats"),
+    path("metrics", views.MetricsView.as_view(), name="metrics"),
     path("", views.IndexView.as_view(), name="index"),
-] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+]
+
+if settings.DEBUG:
+    # In production nginx serves media; see nginx/default.conf.
+    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
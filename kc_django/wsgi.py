@@ -14,3 +14,9 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "kc_django.settings")
 
 application = get_wsgi_application()
+
+# Warm up now rather than on the first requests; with gunicorn's
+# preload_app, once for all workers.
+from game import startup
+
+startup.warm()